@@ -0,0 +1,57 @@
+// Expands the compact columnar payloads written by Sources/columnar.py into
+// the objects the charts draw from. Other payloads are returned unchanged.
+function decodeBitmap(encoded, length) {
+    var bytes = atob(encoded);
+    var flags = new Array(length);
+    for (var i = 0; i < length; i++) {
+        flags[i] = ((bytes.charCodeAt(i >> 3) >> (i & 7)) & 1) == 1;
+    }
+    return flags;
+}
+function columnAt(column, i) {
+    return Array.isArray(column) ? column[i] : column;
+}
+function expandColumnar(payload) {
+    if (!payload || payload.format !== "columnar") {
+        return payload;
+    }
+    var palette = payload.palette;
+    if (payload.kind == "grid") {
+        return {"list": payload.names.map(function(name, i) {
+            return {"name": name, "x": i % payload.size, "y": Math.floor(i / payload.size),
+                    "numsite": payload.numsite[i], "colour": palette[payload.colour[i]]};
+        })};
+    }
+    if (payload.kind == "sortable") {
+        return {"list": payload.names.map(function(name, i) {
+            return {"name": name, "numsite": payload.numsite[i], "rank": i, "colour": palette[payload.colour[i]]};
+        })};
+    }
+    if (payload.kind == "gridperadnetwork") {
+        var absent = palette[payload.absent];
+        var expanded = {};
+        payload.adsystems.forEach(function(adsystem) {
+            var colour = palette[adsystem.colour];
+            var present = decodeBitmap(adsystem.present, payload.sites.length);
+            expanded[adsystem.name] = {"percent": adsystem.percent, "color": colour,
+                "value": payload.sites.map(function(site, i) {
+                    return {"name": site, "x": i % payload.size, "y": Math.floor(i / payload.size),
+                            "present": present[i], "colour": present[i] ? colour : absent};
+                })};
+        });
+        return expanded;
+    }
+    if (payload.kind == "sankey") {
+        return {
+            "nodes": payload.names.map(function(name, i) {
+                return {"node": i, "name": name, "colour": palette[payload.colour[i]]};
+            }),
+            "links": payload.source.map(function(source, i) {
+                return {"source": source, "target": payload.target[i], "value": columnAt(payload.value, i),
+                        "colour": palette[columnAt(payload.link_colour, i)]};
+            })
+        };
+    }
+    console.log("unknown columnar payload kind " + payload.kind);
+    return payload;
+}
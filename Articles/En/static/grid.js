@@ -9,7 +9,7 @@ var svg1 = d3.select("#global_contrib_graph")
 .attr("transform",
 "translate(" + margin_grid.left + "," + margin_grid.top + ")");
 d3.json("static/data_grid.json", function(data) {
-    data=data["list"]
+    data=expandColumnar(data)["list"]
     var myGroups = d3.map(data, function(d){return d.x;}).keys()
     var myVars = d3.map(data, function(d){return d.y;}).keys()
     var x = d3.scaleBand()
@@ -10,6 +10,7 @@ function display_graph(path){
     .nodePadding(padding)
     .extent([[20, 10], [width-100, height - 10]])
     d3.json(path, function(error, graph) {
+        graph=expandColumnar(graph)
         const svg = d3.select("#my_dataviz").append("svg")
         .attr("viewBox", [0, 0, width, height]);
         const {nodes, links} = sankey(graph);
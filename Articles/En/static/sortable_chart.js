@@ -23,6 +23,7 @@ var svg2 = d3.select("#sortable_graph").append("svg")
 .attr("transform", "translate(" + margin.left + "," + margin.top + ")");
 
 d3.json("static/data_sortable.json", function(error, data) {
+    data=expandColumnar(data)
     console.log(data)
     data["list"].forEach(function(d) {
         d.numsite = +d.numsite;
@@ -77,7 +77,7 @@ function fillcube(network,data){
 }
 fetch("static/data_gridperadnetwork.json")
 .then(response => response.json())
-.then(json =>creategraph(json));
+.then(json =>creategraph(expandColumnar(json)));
 function creategraph(obj){
     for (var key in obj) {
         if (obj.hasOwnProperty(key)) {
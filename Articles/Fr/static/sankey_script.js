@@ -15,6 +15,7 @@ var sankey = d3.sankey()
 .size([width_sankey-250, height_sankey]);
 
 d3.json("static/data_sankey.json", function(error, graph) {
+    graph=expandColumnar(graph)
     sankey
     .nodes(graph.nodes)
     .links(graph.links)
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import os
 import sys
 import json
 import csv
@@ -11,6 +12,15 @@ from urllib.parse import urlparse
 import validators
 import unicodedata
 import requests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from raw_archive import RawArchive
+from retry_policy import RetryPolicy, read_within, run_sync
+
+#Raw ads.txt archive (-a), read back instead of crawling with -r
+ARCHIVE = None
+REPLAY = None
+#Retries, and timeouts of at most 10s (shorter once the latency of the hosts is known)
+POLICY = RetryPolicy(timeout=10)
 
 def process_row_to_db(conn, data_row, comment, hostname,rank):
     insert_stmt = "INSERT OR IGNORE INTO adstxt (SITE_DOMAIN, SITE_RANK,  EXCHANGE_DOMAIN, SELLER_ACCOUNT_ID, ACCOUNT_TYPE, TAG_ID, ENTRY_COMMENT) VALUES (?,?, ?, ?, ?, ?, ? );"
@@ -41,6 +51,36 @@ def process_row_to_db(conn, data_row, comment, hostname,rank):
         return 1
     return 0
 
+def fetch_adstxt(aurl, myheaders):
+    #Returns the requests response, rebuilt from the archive when replaying a crawl
+    if REPLAY:
+        entry = ARCHIVE.lookup(aurl, REPLAY)
+        if entry is None or entry.status is None:
+            raise IOError("%s not archived on %s" % (aurl, REPLAY))
+        r = requests.models.Response()
+        r.status_code = entry.status
+        r.url = aurl
+        r.headers = requests.structures.CaseInsensitiveDict({'Content-Type': entry.content_type} if entry.content_type else {})
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r._content = ARCHIVE.body(entry.sha256) if entry.sha256 else b''
+        r.request = requests.Request('GET', aurl, headers=myheaders).prepare()
+        return r
+    try:
+        r = run_sync(POLICY, urlparse(aurl).hostname, lambda timeout: requests.get(aurl, headers=myheaders,timeout=timeout,stream=True), read=read_response)
+    except Exception as err:
+        if ARCHIVE:
+            ARCHIVE.record(aurl, None, error=str(err))
+        raise
+    if ARCHIVE:
+        ARCHIVE.record(aurl, r.status_code, r.content if r.status_code == 200 else None, r.headers.get('Content-Type'))
+    return r
+
+def read_response(r, deadline):
+    #Body of a streamed response, read as it arrives within the total timeout of the attempt
+    r._content = read_within(iter(lambda: r.raw.read1(65536, decode_content=True), b''), deadline)
+    r._content_consumed = True
+    return r
+
 def crawl_to_db(conn, crawl_url_queue):
     hosts_using_adstxt=0
     hosts_not_using_adtstxt=0
@@ -55,7 +95,7 @@ def crawl_to_db(conn, crawl_url_queue):
         rowcnt = 0
         print(" Crawling  %s : %s " % (aurl, ahost))
         try:
-            r = requests.get(aurl, headers=myheaders,timeout=10)
+            r = fetch_adstxt(aurl, myheaders)
             logging.info("  %d" % r.status_code)
         except:
             r = collections.namedtuple("response","status_code")(404)
@@ -118,13 +158,18 @@ def load_url_queue(jsonfilename, url_queue):
         for key in data:
             host = data[key]
             skip = 0
-            try:
-                ip = socket.gethostbyname(host)
-            except:
+            if REPLAY:
+                #No DNS when replaying: the crawl only archived the hosts that resolved
+                if ARCHIVE.lookup('http://{thehost}/ads.txt'.format(thehost=host), REPLAY) is None:
+                    skip = 1
+            else:
                 try:
-                    ip = socket.gethostbyname("www."+host)
+                    ip = socket.gethostbyname(host)
                 except:
-                    skip = 1
+                    try:
+                        ip = socket.gethostbyname("www."+host)
+                    except:
+                        skip = 1
             if(skip < 1):
                 ads_txt_url = 'http://{thehost}/ads.txt'.format(thehost=host)
                 logging.info("  pushing %s" % ads_txt_url)
@@ -141,6 +186,10 @@ arg_parser.add_option("-d", "--database", dest="target_database",
                   help="Database to dump crawled data into", metavar="FILE")
 arg_parser.add_option("-v", "--verbose", dest="verbose", action='count',
                   help="Increase verbosity (specify multiple times for more)")
+arg_parser.add_option("-a", "--archive", dest="archive_dir",
+                  help="Keep the raw ads.txt files in this archive", metavar="DIR")
+arg_parser.add_option("-r", "--replay", dest="replay",
+                  help="Crawl the files archived on this date (or latest) instead of the network", metavar="DATE")
 
 (options, args) = arg_parser.parse_args()
 
@@ -148,6 +197,11 @@ if len(sys.argv)==1:
     arg_parser.print_help()
     exit(1)
 
+if options.archive_dir or options.replay:
+    ARCHIVE = RawArchive(options.archive_dir or "../../archive")
+    if options.replay:
+        REPLAY = ARCHIVE.resolve_date(options.replay)
+
 crawl_url_queue = {}
 conn = None
 cnt_urls = 0
@@ -172,3 +226,5 @@ with conn:
         except TypeError: #SEEMS LIKE THE DOMAIN IS UNKNOWN
             print("WARNING: UNKNOWN DOMAIN %s PLEASE ADD TO THE EXCEL FILE" % row[2])
     conn.commit()
+if ARCHIVE:
+    ARCHIVE.close()
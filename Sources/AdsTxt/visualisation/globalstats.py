@@ -1,19 +1,17 @@
 #!/usr/bin/env python
+import os
 import sys
 import json
-import sqlite3
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from incidence import IncidenceMatrix
 
 database_name="../adstxt.db"
-conn = sqlite3.connect(database_name)
-c = conn.cursor()
-c.execute("SELECT  COUNT(DISTINCT SITE_DOMAIN)  FROM cleanadstxt")
-result=c.fetchall()
-print("Pourcentage de site avec Ads.txt ",100*result[0][0]/5000)
-c.execute("SELECT  COUNT(*)  FROM cleanadstxt GROUP BY SITE_DOMAIN")
-result=[x[0] for x in c.fetchall()]
-max_value = max(result)
-min_value = min(result)
-avg_value = sum(result)/len(result)
+matrix = IncidenceMatrix.load(database_name)
+print("Pourcentage de site avec Ads.txt ",100*len(matrix.sites)/5000)
+result=matrix.site_counts
+max_value = int(result.max())
+min_value = int(result.min())
+avg_value = float(result.mean())
 print("Max num of Adsystem: ",max_value)
 print("Min num of Adsystem: ",min_value)
 print("Mean num of Adsystem: ",avg_value)
@@ -1,28 +1,32 @@
 #!/usr/bin/env python
-import sqlite3
+import os
+import sys
 import json
-import matplotlib.cm as cm
-import matplotlib as mpl
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from incidence import IncidenceMatrix
+from palette import ScalarMappable
 
 size=20
-num_website=size*size
-conn = sqlite3.connect("../../adstxt.db")
-c = conn.cursor()
-# FINDS MAX SITE RANK ACCORDING TO THE NUM OF WEBSITE WE WANT
-c.execute("SELECT SITE_DOMAIN, COUNT(*), SITE_RANK FROM cleanadstxt GROUP BY SITE_DOMAIN ORDER BY SITE_RANK  LIMIT (?);",(num_website,))
-list_website_table = c.fetchall()
-json_data={}
-json_data['list']=[]
-norm = mpl.colors.Normalize(vmin=0, vmax=150)
-#Voir https://matplotlib.org/examples/color/colormaps_reference.html
-cmap = cm.magma_r
-m = cm.ScalarMappable(norm=norm, cmap=cmap)
-index=0;
-for  website in list_website_table:
-    xpos=index%size
-    ypos=int(index/size)
-    json_data['list'].append({"name":website[0],"x":xpos,"y":ypos, "numsite":website[1],"colour":mpl.colors.to_hex(m.to_rgba(website[1]+20))})
-    index+=1
-print(json_data)
-with open('data_grid.json', 'w') as f:
-    json.dump(json_data, f)
+output_name='data_grid.json'
+
+def build(matrix):
+    # SITES ARE ALREADY SORTED BY RANK, KEEP THE NUM OF WEBSITE WE WANT
+    num_website=min(size*size,len(matrix.sites))
+    numsite=matrix.site_counts[:num_website]
+    json_data={}
+    json_data['list']=[]
+    #magma_r, voir https://matplotlib.org/examples/color/colormaps_reference.html
+    m = ScalarMappable(vmin=0, vmax=150)
+    colours=m.to_hex(numsite+20)
+    positions=np.arange(num_website)
+    for name,xpos,ypos,count,colour in zip(matrix.sites[:num_website],(positions%size).tolist(),(positions//size).tolist(),numsite.tolist(),colours):
+        json_data['list'].append({"name":name,"x":xpos,"y":ypos, "numsite":count,"colour":colour})
+    return json_data
+
+if __name__ == "__main__":
+    json_data=build(IncidenceMatrix.load("../../adstxt.db"))
+    print(json_data)
+    with open(output_name, 'w') as f:
+        json.dump(json_data, f)
@@ -1,46 +1,44 @@
 #!/usr/bin/env python
-import sqlite3
+import os
+import sys
 import json
-import matplotlib.cm as cm
-import matplotlib as mpl
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from incidence import IncidenceMatrix
+from palette import ScalarMappable
 
 size=20
 num_website=size*size
 num_adsystem=25
-conn = sqlite3.connect("../../adstxt.db")
-c = conn.cursor()
-c.execute("SELECT adsystem_domain, COUNT(*) FROM cleanadstxt GROUP BY adsystem_domain ORDER BY COUNT(*) DESC LIMIT (?);",(num_adsystem,))
-list_adystem_table = c.fetchall()
-json_data={}
-c.execute("SELECT DISTINCT SITE_DOMAIN, SITE_RANK FROM cleanadstxt ORDER BY SITE_RANK LIMIT (?);",(num_website,))
-list_website_table = c.fetchall()
-norm = mpl.colors.Normalize(vmin=400, vmax=1800)
-cmap = cm.magma_r
-m = cm.ScalarMappable(norm=norm, cmap=cmap)
+output_name='data_gridperadnetwork.json'
 
-for adsystem in list_adystem_table:
-    print(adsystem)
-    c.execute("SELECT SITE_DOMAIN FROM cleanadstxt WHERE adsystem_domain = (?);",(adsystem[0],))
-    list_present_website_table = c.fetchall()
-    json_data[adsystem[0]]={}
-    json_data[adsystem[0]]["percent"]=0
-    json_data[adsystem[0]]["color"]=mpl.colors.to_hex(m.to_rgba(adsystem[1]))
-    json_data[adsystem[0]]["value"]=[]
-    index=0;
-    present=0;
-    for  website in list_website_table:
-        xpos=index%size
-        ypos=int(index/size)
-        if(website[0] in [x[0] for x in list_present_website_table]):
-            json_data[adsystem[0]]["value"].append({"name":website[0],"x":xpos,"y":ypos,"present":True,"colour":mpl.colors.to_hex(m.to_rgba(adsystem[1]))})
-            index+=1
-            present+=1
-        else:
-            json_data[adsystem[0]]["value"].append({"name":website[0],"x":xpos,"y":ypos, "present":False,"colour":"#FFF"})
-            index+=1
-    json_data[adsystem[0]]["percent"]=100.0*present/num_website
+def build(matrix):
+    adsystems=matrix.top_adsystems(num_adsystem)
+    json_data={}
+    site_count=min(num_website,len(matrix.sites))
+    present_table=matrix.presence(adsystems,site_count)
+    positions=np.arange(site_count)
+    xpos=(positions%size).tolist()
+    ypos=(positions//size).tolist()
+    site_names=matrix.sites[:site_count]
+    m = ScalarMappable(vmin=400, vmax=1800)
+    colours=m.to_hex(matrix.adsystem_counts[adsystems])
 
+    for adsystem,colour,present_row in zip(adsystems.tolist(),colours,present_table):
+        name=matrix.adsystems[adsystem]
+        json_data[name]={}
+        json_data[name]["percent"]=100.0*int(present_row.sum())/num_website
+        json_data[name]["color"]=colour
+        json_data[name]["value"]=[{"name":site,"x":x,"y":y,"present":True,"colour":colour} if present else
+                                  {"name":site,"x":x,"y":y,"present":False,"colour":"#FFF"}
+                                  for site,x,y,present in zip(site_names,xpos,ypos,present_row.tolist())]
+    return json_data
 
-
-with open('data_gridperadnetwork.json', 'w') as f:
-    json.dump(json_data, f)
+if __name__ == "__main__":
+    matrix = IncidenceMatrix.load("../../adstxt.db")
+    for adsystem in matrix.top_adsystems(num_adsystem).tolist():
+        print((matrix.adsystems[adsystem],int(matrix.adsystem_counts[adsystem])))
+    json_data=build(matrix)
+    with open(output_name, 'w') as f:
+        json.dump(json_data, f)
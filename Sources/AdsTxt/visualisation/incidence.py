@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""Site x ad system incidence matrix of the cleanadstxt table.
+
+Sites are ordered by rank and ad systems by number of sites declaring them, so
+the "top N" selections of the dataviz builders are plain slices. The matrix is
+stored sparse (CSR, one row of ad system ids per site) with numpy counts, and
+cached next to the database until the database file changes.
+
+    python incidence.py ../adstxt.db    # build / refresh the cache
+"""
+import os
+import sys
+import sqlite3
+import numpy as np
+
+
+def _fingerprint(database_name):
+    stat = os.stat(database_name)
+    return "%d:%d" % (stat.st_size, stat.st_mtime_ns)
+
+
+class IncidenceMatrix:
+    def __init__(self, sites, ranks, adsystems, site_ptr, site_idx):
+        self.sites = list(sites)
+        self.ranks = ranks
+        self.adsystems = list(adsystems)
+        self.site_ptr, self.site_idx = site_ptr, site_idx
+        self.site_counts = np.diff(site_ptr)
+        self.adsystem_counts = np.bincount(site_idx, minlength=len(self.adsystems))
+
+    @classmethod
+    def from_sqlite(cls, conn):
+        c = conn.cursor()
+        c.execute("SELECT SITE_DOMAIN, MIN(SITE_RANK) FROM cleanadstxt GROUP BY SITE_DOMAIN;")
+        site_rows = sorted(c.fetchall(), key=lambda row: (row[1], row[0]))
+        c.execute("SELECT ADSYSTEM_DOMAIN, COUNT(*) FROM cleanadstxt GROUP BY ADSYSTEM_DOMAIN;")
+        adsystem_rows = sorted(c.fetchall(), key=lambda row: (-row[1], row[0]))
+        c.execute("SELECT SITE_DOMAIN, ADSYSTEM_DOMAIN FROM cleanadstxt;")
+        pairs = c.fetchall()
+
+        site_index = {row[0]: i for i, row in enumerate(site_rows)}
+        adsystem_index = {row[0]: i for i, row in enumerate(adsystem_rows)}
+        rows = np.fromiter((site_index[pair[0]] for pair in pairs), dtype=np.int32, count=len(pairs))
+        cols = np.fromiter((adsystem_index[pair[1]] for pair in pairs), dtype=np.int32, count=len(pairs))
+        order = np.lexsort((cols, rows))
+        site_ptr = np.zeros(len(site_rows) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(site_rows)), out=site_ptr[1:])
+        ranks = np.array([row[1] for row in site_rows], dtype=np.int64)
+        return cls([row[0] for row in site_rows], ranks, [row[0] for row in adsystem_rows],
+                   site_ptr, cols[order])
+
+    @classmethod
+    def load(cls, database_name, cache_path=None):
+        """Load the matrix of an adstxt.db, through the on-disk cache when it is up to date."""
+        cache_path = cache_path or database_name + ".incidence.npz"
+        fingerprint = _fingerprint(database_name)
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as snapshot:
+                if str(snapshot["fingerprint"]) == fingerprint:
+                    return cls(snapshot["sites"].tolist(), snapshot["ranks"], snapshot["adsystems"].tolist(),
+                               snapshot["site_ptr"], snapshot["site_idx"])
+        conn = sqlite3.connect(database_name)
+        try:
+            matrix = cls.from_sqlite(conn)
+        finally:
+            conn.close()
+        matrix.save(cache_path, fingerprint)
+        return matrix
+
+    def save(self, cache_path, fingerprint=""):
+        with open(cache_path, "wb") as f:
+            np.savez(f, fingerprint=np.array(fingerprint), sites=np.array(self.sites, dtype=str),
+                     ranks=self.ranks, adsystems=np.array(self.adsystems, dtype=str),
+                     site_ptr=self.site_ptr, site_idx=self.site_idx)
+
+    def sites_below_rank(self, rank):
+        """Number of leading sites whose rank is strictly lower than `rank`."""
+        return int(np.searchsorted(self.ranks, rank, side="left"))
+
+    def adsystem_counts_in(self, num_sites):
+        """Number of sites declaring each ad system among the first `num_sites` sites."""
+        return np.bincount(self.site_idx[:self.site_ptr[num_sites]], minlength=len(self.adsystems))
+
+    def top_adsystems(self, num_adsystem, num_sites=None):
+        """Ids of the most declared ad systems, overall or among the first `num_sites` sites."""
+        if num_sites is None:
+            return np.arange(min(num_adsystem, len(self.adsystems)))
+        counts = self.adsystem_counts_in(num_sites)
+        # stable sort keeps the global order between ties
+        return np.argsort(-counts, kind="stable")[:num_adsystem]
+
+    def presence(self, adsystems, num_sites):
+        """Boolean (len(adsystems), num_sites) matrix: is the ad system in the site's ads.txt."""
+        num_sites = min(num_sites, len(self.sites))
+        position = np.full(len(self.adsystems), -1, dtype=np.int64)
+        position[np.asarray(adsystems, dtype=np.int64)] = np.arange(len(adsystems))
+        rows = np.repeat(np.arange(num_sites), self.site_counts[:num_sites])
+        cols = position[self.site_idx[:self.site_ptr[num_sites]]]
+        keep = cols >= 0
+        dense = np.zeros((len(adsystems), num_sites), dtype=bool)
+        dense[cols[keep], rows[keep]] = True
+        return dense
+
+
+if __name__ == "__main__":
+    database_name = sys.argv[1] if len(sys.argv) > 1 else "../adstxt.db"
+    matrix = IncidenceMatrix.load(database_name)
+    print("%d sites, %d ad systems, %d entries" % (len(matrix.sites), len(matrix.adsystems), len(matrix.site_idx)))
@@ -1,53 +1,52 @@
 #!/usr/bin/env python
-import sqlite3
+import os
+import sys
 import json
-import matplotlib.cm as cm
-import matplotlib as mpl
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from incidence import IncidenceMatrix
+from palette import ScalarMappable
 
 cutout_adsystem=30
 num_website=100
-conn = sqlite3.connect("../../adstxt.db")
-c = conn.cursor()
-c.execute("SELECT SITE_RANK FROM cleanadstxt GROUP BY SITE_DOMAIN ORDER BY SITE_RANK  LIMIT 1 OFFSET (?);",(num_website,))
-cutout_website=c.fetchone()[0]
-print(cutout_website)
-c.execute("SELECT adsystem_domain, COUNT(case when SITE_RANK<(?) then 1 else null end) FROM cleanadstxt GROUP BY adsystem_domain ORDER BY COUNT(case when SITE_RANK<(?) then 1 else null end) DESC LIMIT (?);",(cutout_website,cutout_website,cutout_adsystem,))
-adsystem_table = c.fetchall()
-result=""
-index=0
-json_data={}
-json_data['nodes']=[]
-json_data['links']=[]
-node_index=0
-#To generate color
-norm = mpl.colors.Normalize(vmin=20, vmax=120)
-#Voir https://matplotlib.org/examples/color/colormaps_reference.html
-cmap = cm.magma_r
-m = cm.ScalarMappable(norm=norm, cmap=cmap)
-for adsystem in adsystem_table:
-    name=adsystem[0]
-    prevalence=float(num_website*adsystem[1]/num_website)
-    #domain=todo, add most common domain as canonical
-    c.execute("SELECT SITE_DOMAIN, SITE_RANK FROM cleanadstxt WHERE adsystem_domain = (?) AND SITE_RANK<(?);",(name,cutout_website))
-    connection_table = c.fetchall()
-    for connection in connection_table:
-        c.execute("SELECT SITE_DOMAIN, SITE_RANK FROM cleanadstxt WHERE adsystem_domain = (?) AND SITE_RANK<(?);",(name,cutout_website))
+output_name='data_sankey.json'
 
-        if(name not in [node["name"] for node in json_data["nodes"]]):
-            json_data['nodes'].append({"node":node_index,"name":name, "colour":mpl.colors.to_hex(m.to_rgba(prevalence))})
-            advertiser_node_number=node_index
-            node_index+=1
-        else:
-            advertiser_node_number=[index_node["node"] for index_node in json_data['nodes'] if index_node["name"]== name][0]
+def build(matrix):
+    cutout_website=int(matrix.ranks[num_website])
+    #SITES RANKED BEFORE THE CUTOUT ARE THE FIRST ONES OF THE MATRIX
+    site_count=matrix.sites_below_rank(cutout_website)
+    adsystems=matrix.top_adsystems(cutout_adsystem,site_count)
+    prevalences=matrix.adsystem_counts_in(site_count)[adsystems]
+    present_table=matrix.presence(adsystems,site_count)
+    json_data={}
+    json_data['nodes']=[]
+    json_data['links']=[]
+    node_index=0
+    site_nodes={}
+    #To generate color
+    #magma_r, voir https://matplotlib.org/examples/color/colormaps_reference.html
+    m = ScalarMappable(vmin=20, vmax=120)
+    colours=m.to_hex(prevalences.astype(float))
+    for adsystem,colour,present_row in zip(adsystems.tolist(),colours,present_table):
+        connected_sites=np.flatnonzero(present_row).tolist()
+        if not connected_sites:
+            continue
+        json_data['nodes'].append({"node":node_index,"name":matrix.adsystems[adsystem], "colour":colour})
+        advertiser_node_number=node_index
+        node_index+=1
+        for site in connected_sites:
+            if site not in site_nodes:
+                json_data['nodes'].append({"node":node_index,"name":matrix.sites[site], "colour":"#000"})
+                site_nodes[site]=node_index
+                node_index+=1
+            json_data['links'].append({"source":advertiser_node_number,"target":site_nodes[site],"value":1,"colour":colour})
+    return json_data
 
-        if(connection[0] not in [node["name"] for node in json_data["nodes"]]):
-            json_data['nodes'].append({"node":node_index,"name":connection[0], "colour":"#000"})
-            website_node_number=node_index
-            node_index+=1
-        else:
-            website_node_number=[index_node["node"] for index_node in json_data['nodes'] if index_node["name"]== connection[0]][0]
-        json_data['links'].append({"source":advertiser_node_number,"target":website_node_number,"value":1,"colour":mpl.colors.to_hex(m.to_rgba(prevalence))})
-    index+=1
-print(json_data)
-with open('data_sankey.json', 'w') as f:
-    json.dump(json_data, f)
+if __name__ == "__main__":
+    matrix = IncidenceMatrix.load("../../adstxt.db")
+    print(int(matrix.ranks[num_website]))
+    json_data=build(matrix)
+    print(json_data)
+    with open(output_name, 'w') as f:
+        json.dump(json_data, f)
@@ -1,24 +1,28 @@
 #!/usr/bin/env python
-import sqlite3
+import os
+import sys
 import json
-import matplotlib.cm as cm
-import matplotlib as mpl
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from incidence import IncidenceMatrix
+from palette import ScalarMappable
 
 num_website=25
-conn = sqlite3.connect("../../adstxt.db")
-c = conn.cursor()
-c.execute("SELECT SITE_DOMAIN, COUNT(*), SITE_RANK FROM cleanadstxt GROUP BY SITE_DOMAIN ORDER BY SITE_RANK  LIMIT (?);",(num_website,))
-list_website_table = c.fetchall()
-json_data={}
-json_data['list']=[]
-norm = mpl.colors.Normalize(vmin=0, vmax=200)
-#Voir https://matplotlib.org/examples/color/colormaps_reference.html
-cmap = cm.magma_r
-m = cm.ScalarMappable(norm=norm, cmap=cmap)
-index=0
-for  website in list_website_table:
-    json_data['list'].append({"name":website[0],"numsite":website[1], "rank":index,"colour":mpl.colors.to_hex(m.to_rgba(website[1]+20))})
-    index+=1
+output_name='data_sortable.json'
 
-with open('data_sortable.json', 'w') as f:
-    json.dump(json_data, f)
+def build(matrix):
+    num_website_kept=min(num_website,len(matrix.sites))
+    numsite=matrix.site_counts[:num_website_kept]
+    json_data={}
+    json_data['list']=[]
+    #magma_r, voir https://matplotlib.org/examples/color/colormaps_reference.html
+    m = ScalarMappable(vmin=0, vmax=200)
+    colours=m.to_hex(numsite+20)
+    for index,(name,count,colour) in enumerate(zip(matrix.sites[:num_website_kept],numsite.tolist(),colours)):
+        json_data['list'].append({"name":name,"numsite":count, "rank":index,"colour":colour})
+    return json_data
+
+if __name__ == "__main__":
+    json_data=build(IncidenceMatrix.load("../../adstxt.db"))
+    with open(output_name, 'w') as f:
+        json.dump(json_data, f)
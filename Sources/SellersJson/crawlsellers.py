@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import os
 import sys
 import json
 import ssl
@@ -17,8 +18,42 @@ import requests
 import tldextract
 from io import BytesIO
 import gzip
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from raw_archive import RawArchive
+from retry_policy import RetryPolicy, read_within, run_sync
+
+#v2 schema (sellersjs_crawler_v2.sql): integer ids and ACTOR_TYPE codes
+SCHEMA_VERSION = 1
+TYPE_IDS = {"PUBLISHER":1, "INTERMEDIARY":2, "BOTH":3}
+#Raw sellers.json archive (-a), read back instead of crawling with -r
+ARCHIVE = None
+REPLAY = None
+#Retries, and timeouts of at most 40s (shorter once the latency of the hosts is known)
+POLICY = RetryPolicy(timeout=40)
+
+def insert_seller_to_db_v2(conn, domain, type):
+    c = conn.cursor()
+    c.execute("SELECT ID,TYPE FROM ACTOR WHERE DOMAIN=(?);", (domain,))
+    data=c.fetchone()
+    if data is None:
+        c.execute("INSERT OR IGNORE INTO ACTOR (DOMAIN, TYPE) VALUES (?,?);", (domain,TYPE_IDS[type],))
+        conn.commit()
+        return True
+    elif (type=="BOTH" or type=="INTERMEDIARY") and data[1]==TYPE_IDS["PUBLISHER"]:
+        c.execute("UPDATE ACTOR SET TYPE=(?) WHERE ID=(?);", (TYPE_IDS["BOTH"],data[0],))
+        conn.commit()
+        return True
+    return False
+
+def insert_link_v2(conn, domainfrom, domainto):
+    c = conn.cursor()
+    c.execute("INSERT OR IGNORE INTO EDGE (ACTOR_FROM, ACTOR_TO) SELECT SELLER.ID, SSP.ID FROM ACTOR SELLER, ACTOR SSP WHERE SELLER.DOMAIN=(?) AND SSP.DOMAIN=(?);", (domainfrom,domainto,))
+    conn.commit()
+    return True
 
 def insert_seller_to_db(conn, domain, type):
+    if SCHEMA_VERSION >= 2:
+        return insert_seller_to_db_v2(conn, domain, type)
     c = conn.cursor()
     c.execute("SELECT rowid,type  FROM ACTORS WHERE DOMAIN=(?);", (domain,))
     data=c.fetchone()
@@ -36,6 +71,8 @@ def insert_seller_to_db(conn, domain, type):
             return False
 
 def insert_link(conn, domainfrom, domainto):
+    if SCHEMA_VERSION >= 2:
+        return insert_link_v2(conn, domainfrom, domainto)
     c = conn.cursor()
     c.execute("INSERT OR IGNORE INTO RELATION (ACTOR_FROM, ACTOR_TO) VALUES (?,?);", (domainfrom,domainto,))
     conn.commit()
@@ -49,22 +86,43 @@ def normalize_url(url):
     except:
         return url
 
+def fetch_sellers_json(seller_json_url):
+    #Returns the body and its charset, from the archive when replaying a crawl
+    if REPLAY:
+        entry=ARCHIVE.lookup(seller_json_url, REPLAY)
+        if entry is None:
+            raise LookupError("%s not archived on %s" % (seller_json_url, REPLAY))
+        if entry.sha256 is None:
+            raise IOError(entry.error)
+        return ARCHIVE.body(entry.sha256), entry.charset
+    req = urllib.request.Request(seller_json_url)
+    req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:74.0) Gecko/20100101 Firefox/74.0')
+    req.add_header('Accept','application/json,text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8')
+    try:
+        def read(response, deadline):
+            return response, read_within(iter(lambda: response.read1(65536), b''), deadline)
+        response, data = run_sync(POLICY, urlparse(seller_json_url).hostname,
+                                  lambda timeout: urllib.request.urlopen(req,timeout=timeout), read=read)
+        if response.info().get('Content-Encoding') == 'gzip':
+            buf = BytesIO(data)
+            f = gzip.GzipFile(fileobj=buf)
+            data = f.read()
+    except Exception as err:
+        if ARCHIVE:
+            ARCHIVE.record(seller_json_url, getattr(err, 'code', None), error=str(err))
+        raise
+    if ARCHIVE:
+        ARCHIVE.record(seller_json_url, response.status, data, response.info().get('Content-Type'))
+    return data, response.info().get_param('charset')
+
 def crawl_actor(conn,crawled_url):
     ssl._create_default_https_context = ssl._create_unverified_context
     seller_json_url = 'http://{thehost}/sellers.json'.format(thehost=crawled_url)
     print(seller_json_url)
     try:
-        req = urllib.request.Request(seller_json_url)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:74.0) Gecko/20100101 Firefox/74.0')
-        req.add_header('Accept','application/json,text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8')
-        response = urllib.request.urlopen(req,timeout=40)
+        data, charset = fetch_sellers_json(seller_json_url)
         try:
-            data=response.read()
-            if response.info().get('Content-Encoding') == 'gzip':
-                buf = BytesIO(data)
-                f = gzip.GzipFile(fileobj=buf)
-                data = f.read()
-            data = json.loads(data.decode(response.info().get_param('charset') or 'utf-8'))
+            data = json.loads(data.decode(charset or 'utf-8'))
             seller_list={}
             try:
                 seller_list=data['sellers']
@@ -106,13 +164,18 @@ def load_url_queue(jsonfilename, url_queue):
         for key in data:
             host = data[key]
             skip = 0
-            try:
-                ip = socket.gethostbyname(host)
-            except:
+            if REPLAY:
+                #No DNS when replaying: the crawl only archived the hosts that resolved
+                if ARCHIVE.lookup('http://{thehost}/sellers.json'.format(thehost=host), REPLAY) is None:
+                    skip = 1
+            else:
                 try:
-                    ip = socket.gethostbyname("www."+host)
+                    ip = socket.gethostbyname(host)
                 except:
-                    skip = 1
+                    try:
+                        ip = socket.gethostbyname("www."+host)
+                    except:
+                        skip = 1
             if(skip < 1):
                 sellersjs_url = 'http://{thehost}/sellers.json'.format(thehost=host)
                 logging.info("  pushing %s" % sellersjs_url)
@@ -129,10 +192,18 @@ arg_parser.add_option("-d", "--database", dest="target_database",
                   help="Database to dump crawled data into", metavar="FILE")
 arg_parser.add_option("-v", "--verbose", dest="verbose", action='count',
                   help="Increase verbosity (specify multiple times for more)")
+arg_parser.add_option("-a", "--archive", dest="archive_dir",
+                  help="Keep the raw sellers.json files in this archive", metavar="DIR")
+arg_parser.add_option("-r", "--replay", dest="replay",
+                  help="Crawl the files archived on this date (or latest) instead of the network", metavar="DATE")
 (options, args) = arg_parser.parse_args()
 if len(sys.argv)==1:
     arg_parser.print_help()
     exit(1)
+if options.archive_dir or options.replay:
+    ARCHIVE = RawArchive(options.archive_dir or "../../archive")
+    if options.replay:
+        REPLAY = ARCHIVE.resolve_date(options.replay)
 crawl_url_queue = {}
 conn = None
 cnt_urls = 0
@@ -141,5 +212,8 @@ cnt_urls = load_url_queue(options.target_filename, crawl_url_queue)
 print("found %s urls" %cnt_urls)
 if (cnt_urls > 0) and options.target_database and (len(options.target_database) > 1):
     conn = sqlite3.connect(options.target_database)
+    SCHEMA_VERSION = conn.execute("PRAGMA user_version;").fetchone()[0]
 with conn:
     cnt_records = crawl_to_db(conn, crawl_url_queue)
+if ARCHIVE:
+    ARCHIVE.close()
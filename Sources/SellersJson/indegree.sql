@@ -0,0 +1,46 @@
+BEGIN TRANSACTION;
+-- Number of sellers declared by each actor, per seller type.
+-- Kept up to date by triggers while the crawler inserts relations, so
+-- aggregate statistics do not have to scan RELATION.
+DROP TABLE IF EXISTS INDEGREE;
+CREATE TABLE INDEGREE(
+       DOMAIN                       TEXT    NOT NULL,
+       TYPE                         TEXT    NOT NULL,
+       NUM                          INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (DOMAIN,TYPE)
+);
+
+DROP TRIGGER IF EXISTS RELATION_INDEGREE_INSERT;
+CREATE TRIGGER RELATION_INDEGREE_INSERT AFTER INSERT ON RELATION
+BEGIN
+    INSERT INTO INDEGREE (DOMAIN, TYPE, NUM)
+        SELECT NEW.ACTOR_TO, upper(TYPE), 1 FROM ACTORS WHERE DOMAIN=NEW.ACTOR_FROM
+        ON CONFLICT(DOMAIN,TYPE) DO UPDATE SET NUM=NUM+1;
+END;
+
+DROP TRIGGER IF EXISTS ACTORS_INDEGREE_INSERT;
+CREATE TRIGGER ACTORS_INDEGREE_INSERT AFTER INSERT ON ACTORS
+BEGIN
+    INSERT INTO INDEGREE (DOMAIN, TYPE, NUM)
+        SELECT ACTOR_TO, upper(NEW.TYPE), 1 FROM RELATION WHERE ACTOR_FROM=NEW.DOMAIN
+        ON CONFLICT(DOMAIN,TYPE) DO UPDATE SET NUM=NUM+1;
+END;
+
+DROP TRIGGER IF EXISTS ACTORS_INDEGREE_UPDATE;
+CREATE TRIGGER ACTORS_INDEGREE_UPDATE AFTER UPDATE OF TYPE ON ACTORS
+WHEN upper(OLD.TYPE)!=upper(NEW.TYPE)
+BEGIN
+    UPDATE INDEGREE SET NUM=NUM-1
+        WHERE TYPE=upper(OLD.TYPE) AND DOMAIN IN (SELECT ACTOR_TO FROM RELATION WHERE ACTOR_FROM=NEW.DOMAIN);
+    INSERT INTO INDEGREE (DOMAIN, TYPE, NUM)
+        SELECT ACTOR_TO, upper(NEW.TYPE), 1 FROM RELATION WHERE ACTOR_FROM=NEW.DOMAIN
+        ON CONFLICT(DOMAIN,TYPE) DO UPDATE SET NUM=NUM+1;
+END;
+
+-- Backfill, for databases crawled before this table existed
+INSERT INTO INDEGREE (DOMAIN, TYPE, NUM)
+    SELECT RELATION.ACTOR_TO, upper(ACTORS.TYPE), COUNT(*) FROM RELATION
+    INNER JOIN ACTORS ON ACTORS.DOMAIN = RELATION.ACTOR_FROM
+    GROUP BY RELATION.ACTOR_TO, upper(ACTORS.TYPE);
+
+COMMIT;
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Copy a v1 sellersjs.db (text keyed ACTORS / RELATION) into the v2 schema.
+
+    python migrate_v2.py -s sellersjs.db -d sellersjs_v2.db
+
+Domains become integer ids, types are normalised to the ACTOR_TYPE codes
+(case-insensitive, non-standard values get OTHER and domains only seen in
+RELATION get UNKNOWN) and ACTOR_INDEGREE is rebuilt by the triggers of the v2
+schema. UNKNOWN sellers are not counted, as they had no row for the v1
+INDEGREE, so globalstats.py gives the same figures on both databases.
+"""
+import os
+import sys
+import sqlite3
+from optparse import OptionParser
+
+SCHEMA_V2 = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sellersjs_crawler_v2.sql")
+
+
+def migrate(source_database, target_database):
+    conn = sqlite3.connect(target_database)
+    with open(SCHEMA_V2) as f:
+        conn.executescript(f.read())
+    conn.execute("ATTACH DATABASE ? AS V1;", (source_database,))
+    if conn.execute("SELECT COUNT(*) FROM V1.sqlite_master WHERE type='table' AND name='ACTORS';").fetchone()[0] == 0:
+        raise SystemExit("%s has no v1 ACTORS table" % source_database)
+    with conn:
+        conn.execute("""INSERT INTO ACTOR (DOMAIN, TYPE, UPDATED)
+                        SELECT V1.ACTORS.DOMAIN, COALESCE(ACTOR_TYPE.ID, 4), V1.ACTORS.UPDATED
+                        FROM V1.ACTORS LEFT JOIN ACTOR_TYPE ON ACTOR_TYPE.NAME = upper(V1.ACTORS.TYPE) AND ACTOR_TYPE.ID<>0
+                        ORDER BY V1.ACTORS.DOMAIN;""")
+        # relations can point to domains that never got an ACTORS row
+        conn.execute("""INSERT OR IGNORE INTO ACTOR (DOMAIN, TYPE, UPDATED)
+                        SELECT DOMAIN, 0, NULL FROM (SELECT ACTOR_FROM AS DOMAIN FROM V1.RELATION
+                                                     UNION SELECT ACTOR_TO FROM V1.RELATION);""")
+        conn.execute("""INSERT OR IGNORE INTO EDGE (ACTOR_FROM, ACTOR_TO)
+                        SELECT SELLER.ID, SSP.ID FROM V1.RELATION
+                        INNER JOIN ACTOR SELLER ON SELLER.DOMAIN = V1.RELATION.ACTOR_FROM
+                        INNER JOIN ACTOR SSP ON SSP.DOMAIN = V1.RELATION.ACTOR_TO;""")
+    conn.execute("DETACH DATABASE V1;")
+    conn.execute("ANALYZE;")
+    actors = conn.execute("SELECT COUNT(*) FROM ACTOR;").fetchone()[0]
+    edges = conn.execute("SELECT COUNT(*) FROM EDGE;").fetchone()[0]
+    conn.close()
+    return actors, edges
+
+
+if __name__ == "__main__":
+    arg_parser = OptionParser()
+    arg_parser.add_option("-s", "--source", dest="source_database", default="sellersjs.db",
+                          help="v1 database to read", metavar="FILE")
+    arg_parser.add_option("-d", "--database", dest="target_database",
+                          help="v2 database to create (overwritten)", metavar="FILE")
+    (options, args) = arg_parser.parse_args()
+    if not options.target_database:
+        arg_parser.print_help()
+        sys.exit(1)
+    if os.path.abspath(options.source_database) == os.path.abspath(options.target_database):
+        sys.exit("source and target must be different files")
+    if os.path.exists(options.target_database):
+        os.remove(options.target_database)
+    actors, edges = migrate(options.source_database, options.target_database)
+    print("migrated %d actors, %d relations to %s" % (actors, edges, options.target_database))
@@ -1,4 +1,9 @@
 #!/bin/sh
 set -x
-sqlite3 sellersjs.db < sellersjs_crawler.sql
+if [ "$1" = "v2" ]; then
+    sqlite3 sellersjs.db < sellersjs_crawler_v2.sql
+else
+    sqlite3 sellersjs.db < sellersjs_crawler.sql
+    sqlite3 sellersjs.db < indegree.sql
+fi
 rm sellersjs_crawler.log
@@ -0,0 +1,79 @@
+BEGIN TRANSACTION;
+-- v2 schema: actors are interned as integer ids, types are an enum table and
+-- relations are indexed in both directions. ACTORS, RELATION and INDEGREE are
+-- kept as read-only views with the v1 columns for the existing queries.
+-- UNKNOWN is for domains only seen in a relation (no v1 ACTORS row) and is
+-- left out of the indegree, OTHER for an ACTORS row with a non-standard type.
+DROP VIEW IF EXISTS INDEGREE;
+DROP VIEW IF EXISTS RELATION;
+DROP VIEW IF EXISTS ACTORS;
+DROP TABLE IF EXISTS ACTOR_INDEGREE;
+DROP TABLE IF EXISTS EDGE;
+DROP TABLE IF EXISTS ACTOR;
+DROP TABLE IF EXISTS ACTOR_TYPE;
+
+CREATE TABLE ACTOR_TYPE(
+       ID                           INTEGER NOT NULL,
+       NAME                         TEXT    NOT NULL UNIQUE,
+    PRIMARY KEY (ID)
+);
+INSERT INTO ACTOR_TYPE (ID, NAME) VALUES (0,'UNKNOWN'), (1,'PUBLISHER'), (2,'INTERMEDIARY'), (3,'BOTH'), (4,'OTHER');
+
+CREATE TABLE ACTOR(
+       ID                           INTEGER NOT NULL,
+       DOMAIN                       TEXT    NOT NULL UNIQUE,
+       TYPE                         INTEGER NOT NULL REFERENCES ACTOR_TYPE(ID),
+       UPDATED                      DATE    DEFAULT (datetime('now','localtime')),
+    PRIMARY KEY (ID)
+);
+
+CREATE TABLE EDGE(
+       ACTOR_FROM                   INTEGER NOT NULL REFERENCES ACTOR(ID),
+       ACTOR_TO                     INTEGER NOT NULL REFERENCES ACTOR(ID),
+    PRIMARY KEY (ACTOR_FROM,ACTOR_TO)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX EDGE_REVERSE ON EDGE (ACTOR_TO, ACTOR_FROM);
+
+CREATE TABLE ACTOR_INDEGREE(
+       ACTOR                        INTEGER NOT NULL REFERENCES ACTOR(ID),
+       TYPE                         INTEGER NOT NULL REFERENCES ACTOR_TYPE(ID),
+       NUM                          INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (ACTOR,TYPE)
+) WITHOUT ROWID;
+
+CREATE TRIGGER EDGE_INDEGREE_INSERT AFTER INSERT ON EDGE
+BEGIN
+    INSERT INTO ACTOR_INDEGREE (ACTOR, TYPE, NUM)
+        SELECT NEW.ACTOR_TO, TYPE, 1 FROM ACTOR WHERE ID=NEW.ACTOR_FROM AND TYPE<>0
+        ON CONFLICT(ACTOR,TYPE) DO UPDATE SET NUM=NUM+1;
+END;
+
+CREATE TRIGGER ACTOR_INDEGREE_UPDATE AFTER UPDATE OF TYPE ON ACTOR
+WHEN OLD.TYPE!=NEW.TYPE
+BEGIN
+    UPDATE ACTOR_INDEGREE SET NUM=NUM-1
+        WHERE TYPE=OLD.TYPE AND OLD.TYPE<>0 AND ACTOR IN (SELECT ACTOR_TO FROM EDGE WHERE ACTOR_FROM=NEW.ID);
+    INSERT INTO ACTOR_INDEGREE (ACTOR, TYPE, NUM)
+        SELECT ACTOR_TO, NEW.TYPE, 1 FROM EDGE WHERE ACTOR_FROM=NEW.ID AND NEW.TYPE<>0
+        ON CONFLICT(ACTOR,TYPE) DO UPDATE SET NUM=NUM+1;
+END;
+
+CREATE VIEW ACTORS AS
+    SELECT ACTOR.DOMAIN AS DOMAIN, ACTOR_TYPE.NAME AS TYPE, ACTOR.UPDATED AS UPDATED
+    FROM ACTOR INNER JOIN ACTOR_TYPE ON ACTOR_TYPE.ID = ACTOR.TYPE;
+
+CREATE VIEW RELATION AS
+    SELECT SELLER.DOMAIN AS ACTOR_FROM, SSP.DOMAIN AS ACTOR_TO
+    FROM EDGE
+    INNER JOIN ACTOR SELLER ON SELLER.ID = EDGE.ACTOR_FROM
+    INNER JOIN ACTOR SSP ON SSP.ID = EDGE.ACTOR_TO;
+
+CREATE VIEW INDEGREE AS
+    SELECT ACTOR.DOMAIN AS DOMAIN, ACTOR_TYPE.NAME AS TYPE, ACTOR_INDEGREE.NUM AS NUM
+    FROM ACTOR_INDEGREE
+    INNER JOIN ACTOR ON ACTOR.ID = ACTOR_INDEGREE.ACTOR
+    INNER JOIN ACTOR_TYPE ON ACTOR_TYPE.ID = ACTOR_INDEGREE.TYPE
+    WHERE ACTOR_INDEGREE.TYPE<>0;
+
+PRAGMA user_version = 2;
+COMMIT;
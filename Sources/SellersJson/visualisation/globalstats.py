@@ -2,8 +2,6 @@
 import sys
 import json
 import sqlite3
-import matplotlib.cm as cm
-import matplotlib as mpl
 
 def check_actor_type(conn, domain):
     c = conn.cursor()
@@ -20,12 +18,10 @@ conn = sqlite3.connect(database_name)
 c = conn.cursor()
 
 top_20_list=[]
-top_20_string=""
 with open(sellerlist_path, 'rb') as json_file:
     data = json.load(json_file)
     top_20_list=[data[key] for key in data ]
-    for website in top_20_list:
-        top_20_string=top_20_string+' "'+website+'",'
+top_20_placeholders=",".join("?"*len(top_20_list))
 
 c.execute("SELECT  COUNT(*)  FROM ACTORS  WHERE TYPE='INTERMEDIARY' or TYPE='BOTH'")
 result=c.fetchall()
@@ -36,23 +32,32 @@ c.execute("SELECT  COUNT(*)  FROM ACTORS  WHERE  TYPE='PUBLISHER'")
 result=c.fetchall()
 print("Nombre d'éditeur ",result[0][0])
 
-query_string=("SELECT  COUNT(*)  FROM RELATION WHERE ACTOR_TO IN ("+top_20_string[:-1]+") AND ACTOR_FROM IN ("+top_20_string[:-1]+") AND ACTOR_TO!=ACTOR_FROM")
-c.execute(query_string)
+query_string=("SELECT  COUNT(*)  FROM RELATION WHERE ACTOR_TO IN ("+top_20_placeholders+") AND ACTOR_FROM IN ("+top_20_placeholders+") AND ACTOR_TO!=ACTOR_FROM")
+c.execute(query_string,top_20_list+top_20_list)
 result=c.fetchall()
 print("Nombre d'interco dans le top 20 ",result[0][0])
 
 
-c.execute("SELECT  domain  FROM ACTORS  WHERE TYPE='INTERMEDIARY' or TYPE='BOTH'")
-result=c.fetchall()
-accumulator={'BOTH':0,'PUBLISHER':0,'INTERMEDIARY':0,'NUMSITE':0}
-for website in result:
-    c.execute("SELECT upper(TYPE), COUNT(*)  FROM RELATION  INNER JOIN ACTORS  ON ACTORS.DOMAIN = RELATION.ACTOR_FROM  WHERE ACTOR_TO=(?) GROUP BY lower(TYPE)",(website[0],))
-    count=c.fetchall()
-    if count != []:
-        accumulator['NUMSITE']+=1
-        result_dict = {item[0]: item[1:][0] for item in count}
-        for key in ['PUBLISHER','INTERMEDIARY','BOTH']:
-            if key in result_dict:
-                accumulator[key]+=result_dict[key]
+#Sellers declared by the SSPs, per type, summed over the SSPs declaring at least one
+c.execute("SELECT name FROM sqlite_master WHERE type IN ('table','view') AND name='INDEGREE'")
+if c.fetchone() is not None:
+    #Materialized by the triggers of indegree.sql while crawling
+    c.execute("""SELECT COUNT(DISTINCT INDEGREE.DOMAIN),
+                        TOTAL(CASE WHEN INDEGREE.TYPE='PUBLISHER' THEN NUM END),
+                        TOTAL(CASE WHEN INDEGREE.TYPE='INTERMEDIARY' THEN NUM END),
+                        TOTAL(CASE WHEN INDEGREE.TYPE='BOTH' THEN NUM END)
+                 FROM INDEGREE INNER JOIN ACTORS ON ACTORS.DOMAIN = INDEGREE.DOMAIN
+                 WHERE (ACTORS.TYPE='INTERMEDIARY' or ACTORS.TYPE='BOTH') AND NUM>0""")
+else:
+    c.execute("""SELECT COUNT(DISTINCT RELATION.ACTOR_TO),
+                        TOTAL(upper(SELLER.TYPE)='PUBLISHER'),
+                        TOTAL(upper(SELLER.TYPE)='INTERMEDIARY'),
+                        TOTAL(upper(SELLER.TYPE)='BOTH')
+                 FROM RELATION
+                 INNER JOIN ACTORS SSP ON SSP.DOMAIN = RELATION.ACTOR_TO
+                 INNER JOIN ACTORS SELLER ON SELLER.DOMAIN = RELATION.ACTOR_FROM
+                 WHERE SSP.TYPE='INTERMEDIARY' or SSP.TYPE='BOTH'""")
+result=c.fetchone()
+accumulator={'NUMSITE':result[0],'PUBLISHER':int(result[1]),'INTERMEDIARY':int(result[2]),'BOTH':int(result[3])}
 print("Nombre moyen d'éditeur par SSP ayant déclaré : ",accumulator["PUBLISHER"]/accumulator["NUMSITE"])
 print("Nombre moyen de SSP par SSP ayant déclaré : ",(accumulator["INTERMEDIARY"]+accumulator["BOTH"])/accumulator["NUMSITE"])
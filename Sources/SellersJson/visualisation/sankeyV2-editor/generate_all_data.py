@@ -1,76 +1,159 @@
 #!/usr/bin/env python
 import sys
 import json
-import sqlite3
-import matplotlib.cm as cm
-import matplotlib as mpl
+import os
+import hashlib
+import functools
+import multiprocessing
+from optparse import OptionParser
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from supply_graph import SupplyGraph
+from palette import ScalarMappable
 
-def check_actor_type(conn, domain):
-    c = conn.cursor()
-    c.execute("SELECT TYPE  FROM ACTORS WHERE DOMAIN=(?);", (domain,))
-    data=c.fetchone()
-    if(data is not None):
-        return data[0]
-    return False
+#magma_r, voir https://matplotlib.org/examples/color/colormaps_reference.html
+m = ScalarMappable(vmin=1, vmax=15)
+#Layout of the files written by build_json, part of the subgraph hashes: change it with the layout
+FILE_FORMAT = "nodes-links-1"
 
-def find_next_links(conn,domain):
-    c = conn.cursor()
-    c.execute("SELECT ACTOR_TO  FROM RELATION WHERE ACTOR_FROM=(?);", (domain,))
-    data=c.fetchall()
-    if(data is not None):
-        return domain, [element[0] for element in data]
-    return domain,[]
+@functools.lru_cache(maxsize=None)
+def level_colour(level):
+    #Colours only depend on the level, compute each of them once
+    return m.to_hex(5+level)
 
-def crawl(conn,origin):
-    origin, targets= find_next_links(conn, origin)
-    queue=[{"domain":target, "level":1} for target in targets]
-    visited=[{"domain":origin, "level":0}]
-    raw_link=[[origin,target] for target in targets]
-    while len(queue)>0:
-        target=queue.pop(0)
-        if target["domain"] in [site["domain"] for site in visited]:
-            pass
-        else:
-            visited.append(target)
-            new_origin, next_targets= find_next_links(conn, target["domain"])
-            raw_link+=[[target["domain"],next_target] for next_target in next_targets]
-            queue+=[{"domain":next_target, "level":target["level"]+1} for next_target in next_targets]
-    #NOW PRUNE LINK THAT DON'T GO FORWARD
-    visited_dict = dict((site["domain"], site["level"]) for site in visited)
+#Read-only graph snapshot, inherited by the workers (or loaded from the npz cache)
+graph=None
+
+def load_graph(database_name):
+    global graph
+    if graph is None:
+        graph=SupplyGraph.load(database_name)
+    return graph
+
+def crawl(graph,origin):
+    origin_id=graph.index(origin)
+    if origin_id is None:
+        return [{"domain":origin, "level":0}],[]
+    order,levels=graph.bfs(origin_id)
+    visited=[{"domain":graph.domains[node], "level":int(levels[node])} for node in order]
+    #ONLY KEEP LINKS THAT GO FORWARD
     pruned_link=[]
-    for link in raw_link:
-        if(visited_dict[link[1]]>visited_dict[link[0]]):
-            pruned_link.append(link)
+    for node in order:
+        for next_node in graph.successors(node):
+            if levels[next_node]>levels[node]:
+                pruned_link.append([graph.domains[node],graph.domains[next_node]])
     return visited,pruned_link
 
-database_name="../../sellersjs.db"
-domain_list="../../data/top_alexa50fr.json"
+def subgraph_hash(result_node,result_link):
+    #Everything the sankey file is made of: its format, nodes with their level and colour, and links
+    digest=hashlib.sha1()
+    digest.update(("%s\n" % FILE_FORMAT).encode("utf-8"))
+    for node in result_node:
+        digest.update(("%s:%d:%s\n" % (node["domain"],node["level"],level_colour(node["level"]))).encode("utf-8"))
+    for link in result_link:
+        digest.update(("%s>%s\n" % (link[0],link[1])).encode("utf-8"))
+    return digest.hexdigest()
+
+def build_json(result_node,result_link):
+    json_data={"nodes":[], "links":[]}
+    index_node=0
+    node_dict={}
+    for node in result_node:
+        json_data["nodes"].append({"node":index_node,"name":node["domain"],"colour":level_colour(node["level"])})
+        node_dict[node["domain"]] = [index_node,node["level"]]
+        index_node+=1
+    for link in result_link:
+        json_data["links"].append({"source":node_dict[link[0]][0],"target":node_dict[link[1]][0], "value":1,"colour": level_colour(node_dict[link[0]][1])})
+    return json_data
+
+def generate_site(task):
+    number,target_site,previous_hash,output_dir=task
+    result_node,result_link=crawl(graph,target_site)
+    site_hash=subgraph_hash(result_node,result_link)
+    data_available=len(result_link)>0
+    output_path=os.path.join(output_dir,target_site+'.json')
+    written=False
+    if data_available and (site_hash!=previous_hash or not os.path.exists(output_path)):
+        with open(output_path, 'w') as f:
+            json.dump(build_json(result_node,result_link), f)
+        written=True
+    return number,target_site,site_hash,data_available,written
+
+def build_sites(graph,targets):
+    #In-memory variant for a caller holding the graph: (pruned list, {site: sankey json})
+    pruned_list={}
+    site_data={}
+    for number in targets:
+        result_node,result_link=crawl(graph,targets[number])
+        if result_link:
+            pruned_list[number]=targets[number]
+            site_data[targets[number]]=build_json(result_node,result_link)
+    return pruned_list,site_data
+
+def write_if_changed(path,json_data):
+    content=json.dumps(json_data)
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read()==content:
+                return False
+    with open(path, 'w') as f:
+        f.write(content)
+    return True
+
+arg_parser = OptionParser()
+arg_parser.add_option("-t", "--targets", dest="target_filename", default="../../data/top_alexa50fr.json",
+                  help="list of sites to generate a sankey for", metavar="FILE")
+arg_parser.add_option("-d", "--database", dest="target_database", default="../../sellersjs.db",
+                  help="Crawled sellers.json database", metavar="FILE")
+arg_parser.add_option("-o", "--output", dest="output_dir", default="sankey_data",
+                  help="Directory of the per-site sankey files", metavar="DIR")
+arg_parser.add_option("-p", "--pruned", dest="pruned_filename", default="top_alexa50fr_pruned.json",
+                  help="List of the sites having a sankey", metavar="FILE")
+arg_parser.add_option("-c", "--hashes", dest="hashes_filename", default=None,
+                  help="Subgraph hashes of the files written, kept out of the published directory (default: <database>.sankey_hashes.json)", metavar="FILE")
+arg_parser.add_option("-j", "--jobs", dest="jobs", type="int", default=os.cpu_count() or 1,
+                  help="Number of worker processes")
+arg_parser.add_option("-f", "--force", dest="force", action="store_true", default=False,
+                  help="Rewrite every file, even when its subgraph did not change")
+
+if __name__ == "__main__":
+    (options, args) = arg_parser.parse_args()
+    load_graph(options.target_database)
+    os.makedirs(options.output_dir, exist_ok=True)
+    #Former location, inside the published directory
+    legacy_hashes_path=os.path.join(options.output_dir,'subgraph_hashes.json')
+    if os.path.exists(legacy_hashes_path):
+        os.remove(legacy_hashes_path)
+    hashes_path=options.hashes_filename or options.target_database+'.sankey_hashes.json'
+    #Hashes per output directory: {directory: {site: hash}}
+    output_key=os.path.abspath(options.output_dir)
+    all_hashes={}
+    if os.path.exists(hashes_path):
+        with open(hashes_path) as f:
+            all_hashes=json.load(f)
+    previous_hashes={} if options.force else all_hashes.get(output_key,{})
+
+    with open(options.target_filename) as json_file:
+        data = json.load(json_file)
+    tasks=[(number,data[number],previous_hashes.get(data[number]),options.output_dir) for number in data]
+    if options.jobs>1 and len(tasks)>1:
+        #fork shares the snapshot loaded above, spawn reloads it from the cache
+        with multiprocessing.Pool(options.jobs, initializer=load_graph, initargs=(options.target_database,)) as pool:
+            results=list(pool.imap_unordered(generate_site, tasks, chunksize=max(1,len(tasks)//(options.jobs*8))))
+    else:
+        results=[generate_site(task) for task in tasks]
 
-conn = sqlite3.connect(database_name)
-pruned_list={}
-with open(domain_list) as json_file:
-    data = json.load(json_file)
+    pruned_list={}
+    hashes={}
+    written=0
+    result_by_number={result[0]:result for result in results}
     for number in data:
-        target_site=data[number]
-        result_node,result_link=crawl(conn,target_site)
-        json_data={"nodes":[], "links":[]}
-        index_node=0
-        node_dict={}
-        norm = mpl.colors.Normalize(vmin=1, vmax=15)
-        #Voir https://matplotlib.org/examples/color/colormaps_reference.html
-        cmap = cm.magma_r
-        m = cm.ScalarMappable(norm=norm, cmap=cmap)
-        data_available=False
-        for node in result_node:
-            json_data["nodes"].append({"node":index_node,"name":node["domain"],"colour":mpl.colors.to_hex(m.to_rgba(5+node["level"]))})
-            node_dict[node["domain"]] = [index_node,node["level"]]
-            index_node+=1
-        for link in result_link:
-            data_available=True
-            json_data["links"].append({"source":node_dict[link[0]][0],"target":node_dict[link[1]][0], "value":1,"colour": mpl.colors.to_hex(m.to_rgba(5+node_dict[link[0]][1]))})
+        number,target_site,site_hash,data_available,site_written=result_by_number[number]
+        hashes[target_site]=site_hash
+        written+=site_written
         if data_available:
             pruned_list[number]=data[number]
-            with open('sankey_data/'+target_site+'.json', 'w') as f:
-                json.dump(json_data, f)
-with open('top_alexa50fr_pruned.json', 'w') as f:
-    json.dump(pruned_list, f)
+    write_if_changed(options.pruned_filename,pruned_list)
+    all_hashes[output_key]=hashes
+    write_if_changed(hashes_path,all_hashes)
+    print("%d sites, %d with data, %d files written" % (len(data),len(pruned_list),written))
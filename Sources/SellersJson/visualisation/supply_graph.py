@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""In-memory snapshot of the sellers.json supply graph.
+
+ACTORS and RELATION are read once into integer indexed CSR arrays:
+    forward  (ACTOR_FROM -> ACTOR_TO): the SSPs a seller is declared by
+    reverse  (ACTOR_TO -> ACTOR_FROM): the sellers an SSP declares
+plus a type array, so the visualisation generators traverse the graph without
+one SQL query per node. Neighbours are listed in the order the generators'
+former per-node queries returned them, so their outputs keep their order:
+forward by ACTOR_TO (the RELATION / EDGE primary key), reverse in RELATION
+row order (by ACTOR_FROM id in the v2 schema). The snapshot is cached next to
+the database and rebuilt whenever the database file changes.
+
+    python supply_graph.py ../sellersjs.db    # build / refresh the cache
+"""
+import os
+import sys
+import sqlite3
+from collections import deque
+import numpy as np
+
+# UNKNOWN: no ACTORS row, OTHER: an ACTORS row with a non-standard type (same codes as the v2 ACTOR_TYPE)
+TYPE_NAMES = ['UNKNOWN', 'PUBLISHER', 'INTERMEDIARY', 'BOTH', 'OTHER']
+UNKNOWN, PUBLISHER, INTERMEDIARY, BOTH, OTHER = range(len(TYPE_NAMES))
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+# Bumped when the layout or the order of the cached arrays changes
+SNAPSHOT_VERSION = 2
+
+
+def _fingerprint(database_name):
+    stat = os.stat(database_name)
+    return "%d:%d:%d" % (stat.st_size, stat.st_mtime_ns, SNAPSHOT_VERSION)
+
+
+def _csr(src, dst, num_nodes, key):
+    """Build (indptr, indices) with the neighbours of each node sorted by `key` (one value per edge)."""
+    order = np.lexsort((key, src))
+    indices = dst[order].astype(np.int32)
+    counts = np.bincount(src, minlength=num_nodes)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, indices
+
+
+class SupplyGraph:
+    def __init__(self, domains, types, fwd_ptr, fwd_idx, rev_ptr, rev_idx):
+        self.domains = list(domains)
+        self.types = types
+        self.fwd_ptr, self.fwd_idx = fwd_ptr, fwd_idx
+        self.rev_ptr, self.rev_idx = rev_ptr, rev_idx
+        self._index = {domain: i for i, domain in enumerate(self.domains)}
+
+    # --- construction -------------------------------------------------------
+
+    @classmethod
+    def from_sqlite(cls, conn):
+        if conn.execute("PRAGMA user_version;").fetchone()[0] >= 2:
+            return cls.from_sqlite_v2(conn)
+        c = conn.cursor()
+        c.execute("SELECT DOMAIN, TYPE FROM ACTORS;")
+        actors = c.fetchall()
+        c.execute("SELECT ACTOR_FROM, ACTOR_TO FROM RELATION ORDER BY rowid;")
+        relations = c.fetchall()
+
+        domains = set(actor[0] for actor in actors)
+        for relation in relations:
+            domains.update(relation)
+        domains = sorted(domains)
+        index = {domain: i for i, domain in enumerate(domains)}
+
+        types = np.zeros(len(domains), dtype=np.int8)
+        for domain, actor_type in actors:
+            types[index[domain]] = TYPE_CODES.get(str(actor_type).upper(), OTHER)
+
+        src = np.fromiter((index[relation[0]] for relation in relations), dtype=np.int32, count=len(relations))
+        dst = np.fromiter((index[relation[1]] for relation in relations), dtype=np.int32, count=len(relations))
+        # Forward as the (ACTOR_FROM, ACTOR_TO) key returns them, reverse in row order (no index on ACTOR_TO)
+        fwd_ptr, fwd_idx = _csr(src, dst, len(domains), dst)
+        rev_ptr, rev_idx = _csr(dst, src, len(domains), np.arange(len(relations)))
+        return cls(domains, types, fwd_ptr, fwd_idx, rev_ptr, rev_idx)
+
+    @classmethod
+    def from_sqlite_v2(cls, conn):
+        """Integer id schema: ACTOR ids are remapped to the domain-sorted node ids."""
+        c = conn.cursor()
+        c.execute("SELECT ID, DOMAIN, TYPE FROM ACTOR ORDER BY DOMAIN;")
+        actors = c.fetchall()
+        ids = np.fromiter((actor[0] for actor in actors), dtype=np.int64, count=len(actors))
+        node_of = np.zeros(int(ids.max()) + 1 if len(ids) else 0, dtype=np.int32)
+        node_of[ids] = np.arange(len(actors), dtype=np.int32)
+        types = np.fromiter((actor[2] for actor in actors), dtype=np.int8, count=len(actors))
+
+        edges = np.array(c.execute("SELECT ACTOR_FROM, ACTOR_TO FROM EDGE;").fetchall(), dtype=np.int64)
+        edges = edges.reshape(-1, 2)
+        src, dst = node_of[edges[:, 0]], node_of[edges[:, 1]]
+        # Neighbours in ACTOR id order, as the EDGE key and the EDGE_REVERSE index return them
+        fwd_ptr, fwd_idx = _csr(src, dst, len(actors), edges[:, 1])
+        rev_ptr, rev_idx = _csr(dst, src, len(actors), edges[:, 0])
+        return cls([actor[1] for actor in actors], types, fwd_ptr, fwd_idx, rev_ptr, rev_idx)
+
+    @classmethod
+    def load(cls, database_name, cache_path=None):
+        """Load the graph of a sellersjs.db, through the on-disk snapshot when it is up to date."""
+        cache_path = cache_path or database_name + ".graph.npz"
+        fingerprint = _fingerprint(database_name)
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as snapshot:
+                if str(snapshot["fingerprint"]) == fingerprint:
+                    return cls(snapshot["domains"].tolist(), snapshot["types"],
+                               snapshot["fwd_ptr"], snapshot["fwd_idx"],
+                               snapshot["rev_ptr"], snapshot["rev_idx"])
+        conn = sqlite3.connect(database_name)
+        try:
+            graph = cls.from_sqlite(conn)
+        finally:
+            conn.close()
+        graph.save(cache_path, fingerprint)
+        return graph
+
+    def save(self, cache_path, fingerprint=""):
+        with open(cache_path, "wb") as f:
+            np.savez(f, fingerprint=np.array(fingerprint), domains=np.array(self.domains, dtype=str),
+                     types=self.types, fwd_ptr=self.fwd_ptr, fwd_idx=self.fwd_idx,
+                     rev_ptr=self.rev_ptr, rev_idx=self.rev_idx)
+
+    # --- lookups --------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.domains)
+
+    @property
+    def num_edges(self):
+        return len(self.fwd_idx)
+
+    def index(self, domain):
+        """Integer id of a domain, None when it is not in the graph."""
+        return self._index.get(domain)
+
+    def type_of(self, node):
+        """Upper-case actor type of a node ('UNKNOWN' when it has no ACTORS row)."""
+        return TYPE_NAMES[self.types[node]]
+
+    def successors(self, node):
+        """SSPs declaring `node` as a seller (ACTOR_FROM=node)."""
+        return self.fwd_idx[self.fwd_ptr[node]:self.fwd_ptr[node + 1]]
+
+    def predecessors(self, node):
+        """Sellers declared by `node` (ACTOR_TO=node)."""
+        return self.rev_idx[self.rev_ptr[node]:self.rev_ptr[node + 1]]
+
+    def out_degree(self, node=None):
+        degrees = np.diff(self.fwd_ptr)
+        return degrees if node is None else int(degrees[node])
+
+    def in_degree(self, node=None):
+        degrees = np.diff(self.rev_ptr)
+        return degrees if node is None else int(degrees[node])
+
+    def in_degree_by_type(self, node):
+        """Number of sellers declared by `node`, per type name."""
+        counts = np.bincount(self.types[self.predecessors(node)], minlength=len(TYPE_NAMES))
+        return {TYPE_NAMES[code]: int(count) for code, count in enumerate(counts)}
+
+    # --- traversals -----------------------------------------------------------
+
+    def bfs(self, origin, reverse=False, expand=None):
+        """Breadth-first search from `origin`.
+
+        `reverse` walks ACTOR_TO -> ACTOR_FROM. `expand` is an optional boolean
+        mask; nodes outside it are reached but their neighbours are not queued.
+        Returns (order, levels): nodes in visiting order and a level array with
+        -1 for unreached nodes.
+        """
+        ptr, idx = (self.rev_ptr, self.rev_idx) if reverse else (self.fwd_ptr, self.fwd_idx)
+        levels = np.full(len(self.domains), -1, dtype=np.int32)
+        levels[origin] = 0
+        order = [origin]
+        queue = deque([origin])
+        while queue:
+            node = queue.popleft()
+            if expand is not None and node != origin and not expand[node]:
+                continue
+            next_level = levels[node] + 1
+            for neighbour in idx[ptr[node]:ptr[node + 1]]:
+                if levels[neighbour] < 0:
+                    levels[neighbour] = next_level
+                    order.append(int(neighbour))
+                    queue.append(neighbour)
+        return order, levels
+
+    def reach(self, origin, reverse=False, expand=None):
+        """Ids of the nodes reachable from `origin` (origin excluded)."""
+        order, levels = self.bfs(origin, reverse, expand)
+        return np.array(order[1:], dtype=np.int32)
+
+    def publisher_reach_by_level(self, origins):
+        """Distinct publishers reachable from each origin, per level, in one pass.
+
+        Same walk as the estate chart crawl: from an SSP back to the sellers it
+        declares, intermediaries are expanded and publishers are not. A
+        publisher declared by an intermediary at level L is counted at level L
+        (the origin is level 0), only at the lowest level it shows up.
+
+        The BFS is level-synchronous over all origins at once: every node holds
+        a 64-bit mask of the origins that reached it, so each level is a couple
+        of vectorised passes over the edges whatever the number of origins.
+        Returns one {level: count} dict per origin; a level is present when a
+        publisher was found at it, even if all of them were already counted.
+        """
+        results = [{} for _ in origins]
+        heads = np.repeat(np.arange(len(self.domains), dtype=np.int32), np.diff(self.rev_ptr))
+        tails = self.rev_idx
+        tail_is_publisher = self.types[tails] == PUBLISHER
+        for chunk_start in range(0, len(origins), 64):
+            chunk = origins[chunk_start:chunk_start + 64]
+            frontier = np.zeros(len(self.domains), dtype=np.uint64)
+            for bit, origin in enumerate(chunk):
+                if origin is not None:
+                    frontier[origin] |= np.uint64(1 << bit)
+            seen = frontier.copy()
+            publisher_seen = np.zeros(len(self.domains), dtype=np.uint64)
+            level = 0
+            while frontier.any():
+                active = frontier[heads] != 0
+                masks = frontier[heads[active]]
+                active_tails = tails[active]
+                on_publisher = tail_is_publisher[active]
+
+                found = np.zeros(len(self.domains), dtype=np.uint64)
+                np.bitwise_or.at(found, active_tails[on_publisher], masks[on_publisher])
+                new_publishers = found & ~publisher_seen
+                publisher_seen |= found
+                touched = int(np.bitwise_or.reduce(found))
+                found_nodes = found != 0
+                new_publishers = new_publishers[found_nodes]
+                for bit in range(len(chunk)):
+                    if touched >> bit & 1:
+                        count = np.count_nonzero(new_publishers & np.uint64(1 << bit))
+                        results[chunk_start + bit][level] = int(count)
+
+                reached = np.zeros(len(self.domains), dtype=np.uint64)
+                np.bitwise_or.at(reached, active_tails[~on_publisher], masks[~on_publisher])
+                frontier = reached & ~seen
+                seen |= frontier
+                level += 1
+        return results
+
+    def interconnection_matrix(self, names):
+        """Chord matrix between named actors, filled in one pass over their edges.
+
+        matrix[x][y] is 0.5 when x is declared as a seller by y plus 1 when y is
+        declared by x, the diagonal is left at 0. Also returns the (root, target) links
+        between the names, ordered like `names` then by target.
+        """
+        ids = [self.index(name) for name in names]
+        position = np.full(len(self.domains), -1, dtype=np.int64)
+        for rank, node in enumerate(ids):
+            if node is not None and position[node] < 0:
+                position[node] = rank
+        known = [node for node in ids if node is not None]
+        src, dst = self.edges_between(known) if known else (np.array([], dtype=np.int32),) * 2
+        rows, cols = position[src], position[dst]
+        order = np.lexsort((dst, rows))
+        rows, cols = rows[order], cols[order]
+
+        adjacency = np.zeros((len(names), len(names)))
+        adjacency[rows, cols] = 1
+        matrix = 0.5 * adjacency + adjacency.T
+        np.fill_diagonal(matrix, 0)
+        links = [(names[row], names[col]) for row, col in zip(rows.tolist(), cols.tolist())]
+        return matrix, links
+
+    def edges_between(self, nodes):
+        """Forward edges (source, target) with both ends in `nodes`, by source then in successors order."""
+        mask = np.zeros(len(self.domains), dtype=bool)
+        mask[np.asarray(nodes, dtype=np.int64)] = True
+        src = np.repeat(np.arange(len(self.domains), dtype=np.int32), np.diff(self.fwd_ptr))
+        keep = mask[src] & mask[self.fwd_idx]
+        return src[keep], self.fwd_idx[keep]
+
+
+if __name__ == "__main__":
+    database_name = sys.argv[1] if len(sys.argv) > 1 else "../sellersjs.db"
+    graph = SupplyGraph.load(database_name)
+    print("%d actors, %d relations" % (len(graph), graph.num_edges))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""Build every data file of Articles/En/static and Articles/Fr/static in one pass.
+
+    python build_static.py          # rebuild the outputs whose inputs changed
+    python build_static.py -n       # only list the outputs that are out of date
+    python build_static.py -f       # rebuild everything
+
+adstxt.db and sellersjs.db are loaded at most once (IncidenceMatrix and
+SupplyGraph) and only when an output depending on them is out of date; every
+dataset is then computed from that shared state by the `build` functions of
+the visualisation generators and written to both language trees.
+
+.build_cache.json records, for each output, a hash of its inputs (database
+fingerprints, seller lists, generator and palette sources) and the sha256 of each file it
+wrote. An output whose inputs did not change and whose files still hold that
+content is skipped without being computed; a recomputed file is only written
+when its content changed.
+
+By default the grid, sortable and sankey payloads are written in the compact
+columnar format of columnar.py (read by static/columnar.js); `--format
+verbose` writes them as the generators produce them.
+"""
+import os
+import sys
+import json
+import hashlib
+import importlib.util
+from optparse import OptionParser
+
+SOURCES_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SOURCES_DIR)
+ADSTXT_VISUALISATION = os.path.join(SOURCES_DIR, "AdsTxt", "visualisation")
+SELLERSJSON_VISUALISATION = os.path.join(SOURCES_DIR, "SellersJson", "visualisation")
+sys.path.insert(0, ADSTXT_VISUALISATION)
+sys.path.insert(0, SELLERSJSON_VISUALISATION)
+from incidence import IncidenceMatrix
+from supply_graph import SupplyGraph
+import columnar
+
+CACHE_VERSION = 2
+
+
+def adstxt_output(module, state):
+    return {module.output_name: module.build(state.matrix)}
+
+
+def sellerlist_output(module, state):
+    return {module.output_name: module.build(state.graph, state.sellerlist)}
+
+
+def sankey_output(module, state):
+    pruned_list, site_data = module.build_sites(state.graph, state.targets)
+    files = {"top_alexa50fr_pruned.json": pruned_list}
+    for site, json_data in site_data.items():
+        files["sankey_data/" + site + ".json"] = json_data
+    return files
+
+
+# output: (generator script, inputs, build function)
+OUTPUTS = {
+    "data_grid.json": ("AdsTxt/visualisation/grid/dataviz_builder.py", ["adstxt"], adstxt_output),
+    "data_gridperadnetwork.json": ("AdsTxt/visualisation/gridperadnetwork/dataviz_builder.py", ["adstxt"], adstxt_output),
+    "data_sankey.json": ("AdsTxt/visualisation/sankey/dataviz_builder.py", ["adstxt"], adstxt_output),
+    "data_sortable.json": ("AdsTxt/visualisation/sortable_chart/dataviz_builder.py", ["adstxt"], adstxt_output),
+    "data_stacked.json": ("SellersJson/visualisation/stacked-chart/generate-data.py", ["sellersjs", "sellerlist"], sellerlist_output),
+    "data_chorded.json": ("SellersJson/visualisation/chordedV2/generate_data.py", ["sellersjs", "sellerlist"], sellerlist_output),
+    "estate_data.json": ("SellersJson/visualisation/realestate-peradsystem/generate_data.py", ["sellersjs", "sellerlist"], sellerlist_output),
+    "sankey_data": ("SellersJson/visualisation/sankeyV2-editor/generate_all_data.py", ["sellersjs", "targets"], sankey_output),
+}
+
+# code every output depends on, on top of its own generator
+SHARED_CODE = [os.path.join(SOURCES_DIR, "palette.py")]
+
+# code every output of an input depends on
+INPUT_CODE = {
+    "adstxt": os.path.join(ADSTXT_VISUALISATION, "incidence.py"),
+    "sellersjs": os.path.join(SELLERSJSON_VISUALISATION, "supply_graph.py"),
+}
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_list(path):
+    with open(path, "rb") as json_file:
+        return json.load(json_file)
+
+
+class BuildState:
+    """Inputs shared by every output, each loaded on first use."""
+
+    def __init__(self, options):
+        self.options = options
+        self.paths = {"adstxt": options.adstxt_database, "sellersjs": options.sellersjs_database,
+                      "sellerlist": options.sellerlist_filename, "targets": options.target_filename}
+        self._loaded = {}
+        self._fingerprints = {}
+
+    def _get(self, name, loader):
+        if name not in self._loaded:
+            self._loaded[name] = loader()
+        return self._loaded[name]
+
+    @property
+    def matrix(self):
+        return self._get("matrix", lambda: IncidenceMatrix.load(self.paths["adstxt"]))
+
+    @property
+    def graph(self):
+        return self._get("graph", lambda: SupplyGraph.load(self.paths["sellersjs"]))
+
+    @property
+    def sellerlist(self):
+        return self._get("sellerlist", lambda: list(load_list(self.paths["sellerlist"]).values()))
+
+    @property
+    def targets(self):
+        return self._get("targets", lambda: load_list(self.paths["targets"]))
+
+    def fingerprint(self, name):
+        """Cheap identity of an input: size and mtime for databases, sha256 for the lists."""
+        if name not in self._fingerprints:
+            path = self.paths[name]
+            if name in INPUT_CODE:
+                stat = os.stat(path)
+                self._fingerprints[name] = "%d:%d:%s" % (stat.st_size, stat.st_mtime_ns, file_digest(INPUT_CODE[name]))
+            else:
+                self._fingerprints[name] = file_digest(path)
+        return self._fingerprints[name]
+
+    def input_hash(self, output):
+        script, inputs, build = OUTPUTS[output]
+        digest = hashlib.sha256(("%d\n%s\n%s\n" % (CACHE_VERSION, output, self.options.format)).encode("utf-8"))
+        if self.options.format == columnar.FORMAT:
+            digest.update(file_digest(columnar.__file__).encode("ascii"))
+        for path in [os.path.join(SOURCES_DIR, script)] + SHARED_CODE:
+            digest.update(file_digest(path).encode("ascii"))
+        for name in inputs:
+            digest.update(("\n%s=%s" % (name, self.fingerprint(name))).encode("utf-8"))
+        return digest.hexdigest()
+
+
+def load_generator(output):
+    script = os.path.join(SOURCES_DIR, OUTPUTS[output][0])
+    spec = importlib.util.spec_from_file_location("static_" + output.replace(".", "_"), script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def up_to_date(entry, input_hash, static_dirs):
+    if not entry or entry.get("inputs") != input_hash:
+        return False
+    for static_dir in static_dirs:
+        for path, digest in entry["files"].items():
+            full_path = os.path.join(static_dir, path)
+            if not os.path.exists(full_path) or file_digest(full_path) != digest:
+                return False
+    return True
+
+
+def serialize(path, json_data, output_format):
+    if output_format == columnar.FORMAT:
+        compacted = columnar.compact(path, json_data)
+        if compacted is not json_data:
+            return json.dumps(compacted, separators=(",", ":")).encode("utf-8")
+    return json.dumps(json_data).encode("utf-8")
+
+
+def write_output(files, previous_files, static_dirs, output_format):
+    """Write the files whose content changed, drop the ones this output no longer produces."""
+    written = 0
+    digests = {}
+    for path, json_data in files.items():
+        content = serialize(path, json_data, output_format)
+        digest = hashlib.sha256(content).hexdigest()
+        digests[path] = digest
+        for static_dir in static_dirs:
+            full_path = os.path.join(static_dir, path)
+            if os.path.exists(full_path) and file_digest(full_path) == digest:
+                continue
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as f:
+                f.write(content)
+            written += 1
+    for path in set(previous_files) - set(digests):
+        for static_dir in static_dirs:
+            full_path = os.path.join(static_dir, path)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+    return digests, written
+
+
+def main():
+    arg_parser = OptionParser()
+    arg_parser.add_option("-a", "--adstxt", dest="adstxt_database",
+                          default=os.path.join(SOURCES_DIR, "AdsTxt", "adstxt.db"),
+                          help="Crawled ads.txt database", metavar="FILE")
+    arg_parser.add_option("-s", "--sellersjs", dest="sellersjs_database",
+                          default=os.path.join(SOURCES_DIR, "SellersJson", "sellersjs.db"),
+                          help="Crawled sellers.json database", metavar="FILE")
+    arg_parser.add_option("-l", "--sellerlist", dest="sellerlist_filename",
+                          default=os.path.join(SOURCES_DIR, "SellersJson", "data", "sellerlist.json"),
+                          help="SSPs of the stacked, chorded and estate charts", metavar="FILE")
+    arg_parser.add_option("-t", "--targets", dest="target_filename",
+                          default=os.path.join(SOURCES_DIR, "SellersJson", "data", "top_alexa50fr.json"),
+                          help="Sites of the per-site sankeys", metavar="FILE")
+    arg_parser.add_option("-o", "--output", dest="static_dirs", action="append",
+                          help="Static directory to write to (repeatable, default: both Articles trees)", metavar="DIR")
+    arg_parser.add_option("-c", "--cache", dest="cache_filename",
+                          default=os.path.join(SOURCES_DIR, ".build_cache.json"),
+                          help="Dependency and content hash cache", metavar="FILE")
+    arg_parser.add_option("--format", dest="format", type="choice", choices=[columnar.FORMAT, "verbose"],
+                          default=columnar.FORMAT, help="Payload format: columnar (default) or verbose")
+    arg_parser.add_option("-n", "--dry-run", dest="dry_run", action="store_true", default=False,
+                          help="Only list the outputs that are out of date")
+    arg_parser.add_option("-f", "--force", dest="force", action="store_true", default=False,
+                          help="Recompute every output, even when its inputs did not change")
+    (options, args) = arg_parser.parse_args()
+    static_dirs = options.static_dirs or [os.path.join(ROOT_DIR, "Articles", language, "static")
+                                          for language in ("En", "Fr")]
+    selected = args or list(OUTPUTS)
+    unknown = [output for output in selected if output not in OUTPUTS]
+    if unknown:
+        arg_parser.error("unknown output(s): %s (known: %s)" % (", ".join(unknown), ", ".join(OUTPUTS)))
+
+    cache = {}
+    if os.path.exists(options.cache_filename):
+        with open(options.cache_filename) as f:
+            cache = json.load(f)
+    state = BuildState(options)
+    for output in selected:
+        entry = cache.get(output)
+        input_hash = state.input_hash(output)
+        if not options.force and up_to_date(entry, input_hash, static_dirs):
+            print("%-28s up to date" % output)
+            continue
+        if options.dry_run:
+            print("%-28s out of date" % output)
+            continue
+        files = OUTPUTS[output][2](load_generator(output), state)
+        digests, written = write_output(files, entry["files"] if entry else {}, static_dirs, options.format)
+        cache[output] = {"inputs": input_hash, "files": digests}
+        print("%-28s rebuilt, %d file(s) written" % (output, written))
+        with open(options.cache_filename, "w") as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
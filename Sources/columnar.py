@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""Compact columnar encoding of the visualisation payloads.
+
+The generators produce one object per site (or per link) repeating names,
+positions and hex colours; the encoded payloads store each column once:
+
+    data_grid.json              {"format": "columnar", "kind": "grid", "size", "names",
+                                 "numsite", "palette", "colour"}
+    data_sortable.json          {"format": "columnar", "kind": "sortable", "names",
+                                 "numsite", "palette", "colour"}
+    data_gridperadnetwork.json  {"format": "columnar", "kind": "gridperadnetwork", "size",
+                                 "sites", "palette", "absent", "adsystems": [{"name",
+                                 "percent", "colour", "present"}]}
+    data_sankey.json and        {"format": "columnar", "kind": "sankey", "palette", "names",
+    sankey_data/*.json           "colour", "source", "target", "value", "link_colour"}
+
+Colours are indices into `palette`, grid positions are implied by the site
+index (x = i % size, y = i // size), `present` is a base64 bitmap over
+`sites` (bit i is bit i % 8 of byte i // 8) and a column holding the same
+value everywhere is stored as that value. `expand` gives back the verbose
+payload; static/columnar.js is its JavaScript counterpart for the pages.
+
+    python columnar.py data_gridperadnetwork.json [...]    # encode files in place
+"""
+import os
+import sys
+import json
+import base64
+
+FORMAT = "columnar"
+
+
+class Palette:
+    def __init__(self):
+        self.colours = []
+        self._index = {}
+
+    def __call__(self, colour):
+        if colour not in self._index:
+            self._index[colour] = len(self.colours)
+            self.colours.append(colour)
+        return self._index[colour]
+
+
+def _column(values):
+    """A list, or its single value when every element is the same."""
+    if values and all(value == values[0] for value in values):
+        return values[0]
+    return values
+
+
+def _uncolumn(column, length):
+    return column if isinstance(column, list) else [column] * length
+
+
+def encode_bitmap(flags):
+    bitmap = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            bitmap[i >> 3] |= 1 << (i & 7)
+    return base64.b64encode(bytes(bitmap)).decode("ascii")
+
+
+def decode_bitmap(encoded, length):
+    bitmap = base64.b64decode(encoded)
+    return [bool(bitmap[i >> 3] >> (i & 7) & 1) for i in range(length)]
+
+
+def _grid_size(elements):
+    """Width of a grid laid out row by row in element order, as the builders do."""
+    size = max(element["x"] for element in elements) + 1 if elements else 0
+    for i, element in enumerate(elements):
+        if (element["x"], element["y"]) != (i % size, i // size):
+            raise ValueError("%s is not at the grid position of its index %d" % (element["name"], i))
+    return size
+
+
+def compact_grid(json_data):
+    elements = json_data["list"]
+    palette = Palette()
+    return {"format": FORMAT, "kind": "grid", "size": _grid_size(elements),
+            "names": [element["name"] for element in elements],
+            "numsite": [element["numsite"] for element in elements],
+            "colour": [palette(element["colour"]) for element in elements],
+            "palette": palette.colours}
+
+
+def compact_sortable(json_data):
+    elements = json_data["list"]
+    palette = Palette()
+    return {"format": FORMAT, "kind": "sortable",
+            "names": [element["name"] for element in elements],
+            "numsite": [element["numsite"] for element in elements],
+            "colour": [palette(element["colour"]) for element in elements],
+            "palette": palette.colours}
+
+
+def compact_gridperadnetwork(json_data):
+    palette = Palette()
+    sites, size, absent = [], 0, None
+    adsystems = []
+    for name, adsystem in json_data.items():
+        values = adsystem["value"]
+        if not sites:
+            sites = [value["name"] for value in values]
+            size = _grid_size(values)
+        absent_colours = {value["colour"] for value in values if not value["present"]}
+        if absent_colours:
+            absent = palette(absent_colours.pop())
+        adsystems.append({"name": name, "percent": adsystem["percent"], "colour": palette(adsystem["color"]),
+                          "present": encode_bitmap([value["present"] for value in values])})
+    return {"format": FORMAT, "kind": "gridperadnetwork", "size": size, "sites": sites,
+            "absent": absent if absent is not None else palette("#FFF"),
+            "palette": palette.colours, "adsystems": adsystems}
+
+
+def compact_sankey(json_data):
+    palette = Palette()
+    nodes, links = json_data["nodes"], json_data["links"]
+    return {"format": FORMAT, "kind": "sankey",
+            "names": [node["name"] for node in nodes],
+            "colour": [palette(node["colour"]) for node in nodes],
+            "source": [link["source"] for link in links],
+            "target": [link["target"] for link in links],
+            "value": _column([link["value"] for link in links]),
+            "link_colour": _column([palette(link["colour"]) for link in links]),
+            "palette": palette.colours}
+
+
+def expand(payload):
+    """Verbose payload of an encoded one (returned as is when it is not encoded)."""
+    if not isinstance(payload, dict) or payload.get("format") != FORMAT:
+        return payload
+    palette = payload["palette"]
+    kind = payload["kind"]
+    if kind in ("grid", "sortable"):
+        elements = []
+        for i, (name, numsite, colour) in enumerate(zip(payload["names"], payload["numsite"], payload["colour"])):
+            if kind == "grid":
+                elements.append({"name": name, "x": i % payload["size"], "y": i // payload["size"],
+                                 "numsite": numsite, "colour": palette[colour]})
+            else:
+                elements.append({"name": name, "numsite": numsite, "rank": i, "colour": palette[colour]})
+        return {"list": elements}
+    if kind == "gridperadnetwork":
+        size, sites, absent = payload["size"], payload["sites"], palette[payload["absent"]]
+        json_data = {}
+        for adsystem in payload["adsystems"]:
+            colour = palette[adsystem["colour"]]
+            present = decode_bitmap(adsystem["present"], len(sites))
+            json_data[adsystem["name"]] = {
+                "percent": adsystem["percent"], "color": colour,
+                "value": [{"name": site, "x": i % size, "y": i // size, "present": flag,
+                           "colour": colour if flag else absent}
+                          for i, (site, flag) in enumerate(zip(sites, present))]}
+        return json_data
+    if kind == "sankey":
+        num_links = len(payload["source"])
+        return {"nodes": [{"node": i, "name": name, "colour": palette[colour]}
+                          for i, (name, colour) in enumerate(zip(payload["names"], payload["colour"]))],
+                "links": [{"source": source, "target": target, "value": value, "colour": palette[colour]}
+                          for source, target, value, colour in zip(payload["source"], payload["target"],
+                                                                   _uncolumn(payload["value"], num_links),
+                                                                   _uncolumn(payload["link_colour"], num_links))]}
+    raise ValueError("unknown columnar payload kind %r" % kind)
+
+
+COMPACTORS = {
+    "data_grid.json": compact_grid,
+    "data_sortable.json": compact_sortable,
+    "data_gridperadnetwork.json": compact_gridperadnetwork,
+    "data_sankey.json": compact_sankey,
+}
+
+
+def compactor(path):
+    """Encoder of a static file, None for the payloads kept verbose."""
+    if os.path.basename(os.path.dirname(path)) == "sankey_data":
+        return compact_sankey
+    return COMPACTORS.get(os.path.basename(path))
+
+
+def compact(path, json_data):
+    encode = compactor(path)
+    if encode is None or (isinstance(json_data, dict) and json_data.get("format") == FORMAT):
+        return json_data
+    return encode(json_data)
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            json_data = json.load(f)
+        compacted = compact(path, json_data)
+        if compacted is json_data:
+            print("%s: left as is" % path)
+            continue
+        with open(path, "w") as f:
+            json.dump(compacted, f, separators=(",", ":"))
+        print("%s: %d -> %d bytes" % (path, len(json.dumps(json_data)), os.path.getsize(path)))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""Colour scales of the visualisation generators, without matplotlib.
+
+    m = ScalarMappable(vmin=0, vmax=150)
+    m.to_hex(42)                # '#f9795d'
+    m.to_hex(numpy_array)       # list of hex strings, in one vectorised pass
+
+Same result as mpl.colors.to_hex(cm.ScalarMappable(norm=mpl.colors.Normalize(
+vmin, vmax), cmap=cm.magma_r).to_rgba(value)): values are normalised in
+float64 without clipping, mapped to int(t * 256) with t == 1 kept in the last
+entry, values below / above the range get the first / last entry and NaN
+gives the transparent "bad" colour (#000000 once the alpha is dropped).
+
+The tables hold matplotlib's 256 colour lookup table already converted to
+hex, generated once with
+    [mpl.colors.to_hex(c) for c in matplotlib.cm.magma_r(range(256))]
+"""
+import numpy as np
+
+MAGMA_R = (
+    "#fcfdbf", "#fcfbbd", "#fcf9bb", "#fcf7b9", "#fcf6b8", "#fcf4b6", "#fcf2b4", "#fcf0b2",
+    "#fceeb0", "#fcecae", "#fdebac", "#fde9aa", "#fde7a9", "#fde5a7", "#fde3a5", "#fde2a3",
+    "#fde0a1", "#fddea0", "#fddc9e", "#fdda9c", "#fed89a", "#fed799", "#fed597", "#fed395",
+    "#fed194", "#fecf92", "#fecd90", "#fecc8f", "#feca8d", "#fec88c", "#fec68a", "#fec488",
+    "#fec287", "#fec185", "#febf84", "#febd82", "#febb81", "#feb97f", "#feb77e", "#feb67c",
+    "#feb47b", "#feb27a", "#feb078", "#feae77", "#feac76", "#feaa74", "#fea973", "#fea772",
+    "#fea571", "#fea36f", "#fea16e", "#fe9f6d", "#fe9d6c", "#fd9b6b", "#fd9a6a", "#fd9869",
+    "#fd9668", "#fd9467", "#fd9266", "#fc9065", "#fc8e64", "#fc8c63", "#fc8a62", "#fc8961",
+    "#fb8761", "#fb8560", "#fb835f", "#fa815f", "#fa7f5e", "#fa7d5e", "#f97b5d", "#f9795d",
+    "#f9785d", "#f8765c", "#f8745c", "#f7725c", "#f7705c", "#f66e5c", "#f66c5c", "#f56b5c",
+    "#f4695c", "#f4675c", "#f3655c", "#f2645c", "#f2625d", "#f1605d", "#f05f5e", "#ef5d5e",
+    "#ee5b5e", "#ed5a5f", "#ec5860", "#eb5760", "#ea5661", "#e95462", "#e85362", "#e75263",
+    "#e55064", "#e44f64", "#e34e65", "#e24d66", "#e04c67", "#df4a68", "#de4968", "#dc4869",
+    "#db476a", "#d9466b", "#d8456c", "#d6456c", "#d5446d", "#d3436e", "#d2426f", "#d0416f",
+    "#cf4070", "#cd4071", "#cc3f71", "#ca3e72", "#c83e73", "#c73d73", "#c53c74", "#c43c75",
+    "#c23b75", "#c03a76", "#bf3a77", "#bd3977", "#bc3978", "#ba3878", "#b83779", "#b73779",
+    "#b5367a", "#b3367a", "#b2357b", "#b0357b", "#ae347b", "#ad347c", "#ab337c", "#aa337d",
+    "#a8327d", "#a6317d", "#a5317e", "#a3307e", "#a1307e", "#a02f7f", "#9e2f7f", "#9c2e7f",
+    "#9b2e7f", "#992d80", "#982d80", "#962c80", "#942c80", "#932b80", "#912b81", "#902a81",
+    "#8e2a81", "#8c2981", "#8b2981", "#892881", "#882781", "#862781", "#842681", "#832681",
+    "#812581", "#802582", "#7e2482", "#7c2382", "#7b2382", "#792282", "#782281", "#762181",
+    "#752181", "#732081", "#721f81", "#701f81", "#6e1e81", "#6d1d81", "#6b1d81", "#6a1c81",
+    "#681c81", "#671b80", "#651a80", "#641a80", "#621980", "#601880", "#5f187f", "#5d177f",
+    "#5c167f", "#5a167e", "#59157e", "#57157e", "#56147d", "#54137d", "#52137c", "#51127c",
+    "#4f127b", "#4e117b", "#4c117a", "#4a1079", "#491078", "#471078", "#451077", "#440f76",
+    "#420f75", "#400f74", "#3f0f72", "#3d0f71", "#3b0f70", "#390f6e", "#38106c", "#36106b",
+    "#341069", "#331067", "#311165", "#2f1163", "#2d1161", "#2c115f", "#2a115c", "#29115a",
+    "#271258", "#251255", "#241253", "#221150", "#21114e", "#20114b", "#1e1149", "#1d1147",
+    "#1c1044", "#1a1042", "#19103f", "#180f3d", "#160f3b", "#150e38", "#140e36", "#130d34",
+    "#120d31", "#110c2f", "#100b2d", "#0e0b2b", "#0d0a29", "#0c0926", "#0b0924", "#0a0822",
+    "#090720", "#08071e", "#07061c", "#06051a", "#060518", "#050416", "#040414", "#030312",
+    "#03030f", "#02020d", "#02020b", "#020109", "#010108", "#010106", "#010005", "#000004",
+)
+
+COLOURMAPS = {"magma_r": MAGMA_R}
+BAD_COLOUR = "#000000"
+
+
+class Normalize:
+    """Linear map of [vmin, vmax] to [0, 1], values outside are not clipped."""
+
+    def __init__(self, vmin, vmax):
+        if vmin > vmax:
+            raise ValueError("minvalue must be less than or equal to maxvalue")
+        self.vmin, self.vmax = float(vmin), float(vmax)
+
+    def __call__(self, value):
+        result = np.array(value, dtype=np.float64)
+        if self.vmin == self.vmax:
+            return np.zeros_like(result)
+        result -= self.vmin
+        result /= self.vmax - self.vmin
+        return result
+
+
+class ScalarMappable:
+    def __init__(self, vmin, vmax, cmap="magma_r"):
+        self.norm = Normalize(vmin, vmax)
+        self.lut = np.array(COLOURMAPS[cmap] + (BAD_COLOUR,))
+        self.N = len(COLOURMAPS[cmap])
+
+    def lut_index(self, value):
+        """Position of each value in the lookup table, N for NaN."""
+        scaled = self.norm(value) * self.N
+        bad = np.isnan(scaled)
+        index = np.clip(np.floor(np.where(bad, 0, scaled)), 0, self.N - 1).astype(np.int64)
+        index[bad] = self.N
+        return index
+
+    def to_hex(self, value):
+        """Hex colour of a scalar, or list of hex colours of an array."""
+        index = self.lut_index(np.atleast_1d(value))
+        if np.ndim(value) == 0:
+            return str(self.lut[index[0]])
+        return self.lut[index].tolist()
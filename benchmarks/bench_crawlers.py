@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""Offline end-to-end benchmarks for SSPScraper and AdTechScraper.
+
+Usage:
+    python benchmarks/bench_crawlers.py --ssps 10 --sellers 5000 --json bench.json
+    python benchmarks/bench_crawlers.py --baseline bench.json   # exit 1 on regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(1, os.path.dirname(BENCH_DIR))
+
+from synthetic import SyntheticUniverse
+from standin_server import LocalRoutingSession, ServerConfig, StandInServer
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process, in MB (Linux reports KB)."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / 1024.0 if sys.platform != 'darwin' else usage / (1024.0 * 1024.0)
+
+
+class LoopLagProbe:
+    """Longest time the event loop went without running other tasks while the probe was active."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, loop.time() - start - self.interval)
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+
+    @property
+    def max_lag_ms(self) -> float:
+        return round(self.max_lag * 1000.0, 1)
+
+
+class BenchRecorder:
+    def __init__(self, server: StandInServer):
+        self.server = server
+        self.results: List[Dict] = []
+
+    def record(self, name: str, elapsed: float, requests: int = 0, parsed_bytes: int = 0, rows: int = 0,
+               loop_lag_ms: float = None):
+        entry = {
+            'name': name,
+            'seconds': round(elapsed, 4),
+            'requests': requests,
+            'requests_per_sec': round(requests / elapsed, 1) if requests and elapsed else None,
+            'parse_mb_per_sec': round(parsed_bytes / 1e6 / elapsed, 2) if parsed_bytes and elapsed else None,
+            'rows': rows,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+        if loop_lag_ms is not None:
+            entry['max_loop_lag_ms'] = loop_lag_ms
+        self.results.append(entry)
+        print(f"{name:<28} {entry['seconds']:>9.3f}s  req/s={entry['requests_per_sec'] or '-':>8}  "
+              f"MB/s={entry['parse_mb_per_sec'] or '-':>7}  rows={rows:<8} peakRSS={entry['peak_rss_mb']}MB"
+              + (f"  loopLag={loop_lag_ms}ms" if loop_lag_ms is not None else ''))
+
+
+async def bench_ssp_scraper(universe: SyntheticUniverse, server: StandInServer, recorder: BenchRecorder,
+                            max_domains: int):
+    from csv_sink import CsvSink
+    from ssp_scraper import SSPScraper, process_domains_batch
+
+    scraper = SSPScraper()
+    await scraper.init_session()
+    scraper.session = LocalRoutingSession(scraper.session, server.port)
+    try:
+        # fetch
+        urls = universe.sellers_json_urls()
+        before = server.stats['requests']
+        start = time.perf_counter()
+        contents = await asyncio.gather(*(scraper.fetch_bytes(url) for url in urls.values()))
+        recorder.record('ssp.fetch_sellers_json', time.perf_counter() - start,
+                        requests=server.stats['requests'] - before)
+
+        # parse
+        parsed_bytes = sum(len(content) for content in contents if content)
+        start = time.perf_counter()
+        async with LoopLagProbe() as probe:
+            for (ssp_name, url), content in zip(urls.items(), contents):
+                if content:
+                    scraper.results['sellers'].extend(scraper.parse_sellers_json(content, ssp_name, url))
+                    await asyncio.sleep(0)
+        recorder.record('ssp.parse_sellers_json', time.perf_counter() - start,
+                        parsed_bytes=parsed_bytes, rows=len(scraper.results['sellers']),
+                        loop_lag_ms=probe.max_lag_ms)
+
+        # fetch and parse overlapped, parsing in worker processes
+        pipelined = SSPScraper()
+        pipelined.session = scraper.session
+        before = server.stats['requests']
+        start = time.perf_counter()
+        async with LoopLagProbe() as probe:
+            await pipelined.collect_sellers_pipelined(list(urls.items()))
+        recorder.record('ssp.fetch_parse_pipelined', time.perf_counter() - start,
+                        requests=server.stats['requests'] - before, parsed_bytes=parsed_bytes,
+                        rows=len(pipelined.results['sellers']), loop_lag_ms=probe.max_lag_ms)
+
+        publishers = sorted({entry['domain'] for entry in scraper.results['sellers']
+                             if entry['domain'] and entry['seller_type'] == 'PUBLISHER'})[:max_domains]
+        intermediaries = sorted({entry['domain'] for entry in scraper.results['sellers']
+                                 if entry['domain'] and entry['seller_type'] != 'PUBLISHER'})[:max_domains]
+
+        before = server.stats['requests']
+        start = time.perf_counter()
+        results = await asyncio.gather(*(scraper.check_ads_txt(domain) for domain in publishers))
+        scraper.results['direct_media'].extend(results)
+        recorder.record('ssp.check_ads_txt', time.perf_counter() - start,
+                        requests=server.stats['requests'] - before, rows=len(results))
+
+        # same checks through the bounded worker pool, streamed to a CSV file
+        sink = CsvSink('output/direct_media_stream.csv')
+        before = server.stats['requests']
+        start = time.perf_counter()
+        rows = await process_domains_batch(scraper, iter(publishers), scraper.check_ads_txt,
+                                           'ssp.check_ads_txt_pool', sink=sink)
+        sink.close()
+        recorder.record('ssp.check_ads_txt_pool', time.perf_counter() - start,
+                        requests=server.stats['requests'] - before, rows=rows)
+
+        before = server.stats['requests']
+        start = time.perf_counter()
+        results = await asyncio.gather(*(scraper.check_sellers_json(domain) for domain in intermediaries))
+        scraper.results['intermediaries'].extend(results)
+        recorder.record('ssp.check_sellers_json', time.perf_counter() - start,
+                        requests=server.stats['requests'] - before, rows=len(results))
+
+        start = time.perf_counter()
+        scraper.save_results()
+        recorder.record('ssp.save_results', time.perf_counter() - start, rows=len(scraper.results['sellers']))
+        pipelined.results.close()
+    finally:
+        await scraper.close_session()
+        scraper.results.close()
+
+
+async def bench_adtech_scraper(universe: SyntheticUniverse, server: StandInServer, recorder: BenchRecorder,
+                               max_domains: int):
+    from scraper import AdTechScraper
+
+    scraper = AdTechScraper()
+    await scraper.init_session()
+    scraper.session = LocalRoutingSession(scraper.session, server.port)
+    domains = (universe.intermediaries + universe.publishers)[:max_domains]
+    try:
+        before = server.stats['requests']
+        start = time.perf_counter()
+        await asyncio.gather(*(scraper.process_domain(domain) for domain in domains))
+        rows = len(scraper.results['ads_txt']) + len(scraper.results['sellers_json'])
+        recorder.record('adtech.process_domain', time.perf_counter() - start,
+                        requests=server.stats['requests'] - before, rows=rows)
+
+        start = time.perf_counter()
+        scraper.save_results()
+        recorder.record('adtech.save_results', time.perf_counter() - start, rows=rows)
+    finally:
+        await scraper.close_session()
+
+    # Batch API: bounded concurrency, rows streamed to the CSV files
+    scraper = AdTechScraper()
+    await scraper.init_session()
+    scraper.session = LocalRoutingSession(scraper.session, server.port)
+    try:
+        before = server.stats['requests']
+        start = time.perf_counter()
+        await scraper.process_domains(domains, output_dir='output/adtech_stream')
+        recorder.record('adtech.process_domains', time.perf_counter() - start,
+                        requests=server.stats['requests'] - before, rows=scraper.rows_written)
+    finally:
+        await scraper.close_session()
+
+
+async def run(args) -> List[Dict]:
+    start = time.perf_counter()
+    universe = SyntheticUniverse(ssp_count=args.ssps, sellers_per_ssp=args.sellers,
+                                 publisher_count=args.publishers, intermediary_count=args.intermediaries,
+                                 seed=args.seed)
+    print(f'Generated {len(universe.documents)} hosts, {universe.total_bytes() / 1e6:.1f} MB '
+          f'in {time.perf_counter() - start:.2f}s')
+    config = ServerConfig(latency_ms=args.latency, jitter_ms=args.jitter, not_found_ratio=args.not_found,
+                          rate_limit_ratio=args.rate_limit, gzip_ratio=args.gzip,
+                          redirect_ratio=args.redirect, seed=args.seed)
+    server = StandInServer(universe, config)
+    await server.start()
+    recorder = BenchRecorder(server)
+    try:
+        await bench_ssp_scraper(universe, server, recorder, args.max_domains)
+        await bench_adtech_scraper(universe, server, recorder, args.max_domains)
+    finally:
+        await server.stop()
+    print('Server stats:', dict(server.stats))
+    return recorder.results
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """List the metrics that regressed by more than `tolerance` against a baseline run."""
+    regressions = []
+    previous = {entry['name']: entry for entry in baseline}
+    for entry in results:
+        old = previous.get(entry['name'])
+        if not old:
+            continue
+        for key in ('requests_per_sec', 'parse_mb_per_sec'):
+            if old.get(key) and entry.get(key) and entry[key] < old[key] * (1 - tolerance):
+                regressions.append(f"{entry['name']}.{key}: {old[key]} -> {entry[key]}")
+        if old.get('peak_rss_mb') and entry['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{entry['name']}.peak_rss_mb: {old['peak_rss_mb']} -> {entry['peak_rss_mb']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline crawler benchmarks')
+    parser.add_argument('--ssps', type=int, default=10)
+    parser.add_argument('--sellers', type=int, default=5000, help='sellers per SSP sellers.json')
+    parser.add_argument('--publishers', type=int, default=2000)
+    parser.add_argument('--intermediaries', type=int, default=200)
+    parser.add_argument('--max-domains', type=int, default=500, help='domains checked per stage')
+    parser.add_argument('--latency', type=float, default=5.0, help='server latency in ms')
+    parser.add_argument('--jitter', type=float, default=5.0, help='server latency jitter in ms')
+    parser.add_argument('--not-found', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0.02)
+    parser.add_argument('--gzip', type=float, default=0.5)
+    parser.add_argument('--redirect', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    parser.add_argument('--baseline', help='previous --json output to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    # The scrapers write their logs and output/ to the working directory
+    os.chdir(tempfile.mkdtemp(prefix='bench_crawlers_'))
+    results = asyncio.run(run(args))
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('Regressions:\n  ' + '\n  '.join(regressions))
+            sys.exit(1)
+        print('No regression against', baseline_path)
+
+
+if __name__ == '__main__':
+    main()
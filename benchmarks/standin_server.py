@@ -0,0 +1,161 @@
+"""Local aiohttp server standing in for SSPs and publishers during benchmarks.
+
+Every synthetic host is served from the same socket; the target host is taken
+from the Host header, so crawlers are pointed at it with `LocalRoutingSession`
+instead of touching DNS or TLS.
+"""
+import argparse
+import asyncio
+import gzip
+import random
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+from synthetic import SyntheticUniverse
+
+
+class ServerConfig:
+    """Failure and latency profile of the stand-in server."""
+
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 10.0, not_found_ratio: float = 0.0,
+                 rate_limit_ratio: float = 0.02, gzip_ratio: float = 0.5, redirect_ratio: float = 0.05,
+                 charset_ratio: float = 0.5, seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.not_found_ratio = not_found_ratio
+        self.rate_limit_ratio = rate_limit_ratio
+        self.gzip_ratio = gzip_ratio
+        self.redirect_ratio = redirect_ratio
+        self.charset_ratio = charset_ratio
+        self.seed = seed
+
+
+class StandInServer:
+    def __init__(self, universe: SyntheticUniverse, config: Optional[ServerConfig] = None):
+        self.universe = universe
+        self.config = config or ServerConfig()
+        self.stats = Counter()
+        self._hits = Counter()
+        self._gzipped: Dict[Tuple[str, str], bytes] = {}
+        self._runner = None
+        self.port = None
+
+    def _roll(self, host: str, path: str, what: str) -> float:
+        """Deterministic pseudo-random draw for a (host, path) pair."""
+        return random.Random(f'{self.config.seed}:{what}:{host}{path}').random()
+
+    def _lookup(self, host: str, path: str) -> Optional[bytes]:
+        paths = self.universe.documents.get(host)
+        if paths is None and host.startswith('www.'):
+            paths = self.universe.documents.get(host[4:])
+        if paths is None:
+            return None
+        return paths.get(path)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        host = request.query.get('_host') or request.host.split(':')[0]
+        path = request.path
+        self.stats['requests'] += 1
+        self._hits[(host, path)] += 1
+
+        if self.config.latency_ms or self.config.jitter_ms:
+            delay = self.config.latency_ms + self._roll(host, path, 'latency') * self.config.jitter_ms
+            await asyncio.sleep(delay / 1000.0)
+
+        body = self._lookup(host, path)
+        if body is None or self._roll(host, path, '404') < self.config.not_found_ratio:
+            self.stats['404'] += 1
+            return web.Response(status=404, text='Not Found')
+
+        if self._hits[(host, path)] == 1 and self._roll(host, path, '429') < self.config.rate_limit_ratio:
+            self.stats['429'] += 1
+            return web.Response(status=429, headers={'Retry-After': '0'})
+
+        if not request.query.get('_host') and self._roll(host, path, 'redirect') < self.config.redirect_ratio:
+            self.stats['301'] += 1
+            raise web.HTTPMovedPermanently(location=f'{path}?_host={host}')
+
+        content_type = 'application/json' if path.endswith('.json') else 'text/plain'
+        if self._roll(host, path, 'charset') < self.config.charset_ratio:
+            content_type += '; charset=utf-8'
+        headers = {'Content-Type': content_type}
+        if self._roll(host, path, 'gzip') < self.config.gzip_ratio:
+            key = (host, path)
+            if key not in self._gzipped:
+                self._gzipped[key] = gzip.compress(body, compresslevel=5)
+            body = self._gzipped[key]
+            headers['Content-Encoding'] = 'gzip'
+        self.stats['200'] += 1
+        self.stats['bytes_sent'] += len(body)
+        return web.Response(body=body, headers=headers)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        app = web.Application()
+        app.router.add_route('GET', '/{tail:.*}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self.port
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class LocalRoutingSession:
+    """Wraps an aiohttp ClientSession and sends every request to the stand-in server.
+
+    `https://host/path` becomes `http://127.0.0.1:<port>/path` with `Host: host`,
+    so the scrapers keep building their usual URLs.
+    """
+
+    def __init__(self, session, port: int, address: str = '127.0.0.1'):
+        self._session = session
+        self._base = f'http://{address}:{port}'
+
+    def get(self, url, headers=None, **kwargs):
+        parts = urlsplit(str(url))
+        local_url = self._base + (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        headers = dict(headers or {})
+        headers['Host'] = parts.hostname or ''
+        return self._session.get(local_url, headers=headers, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+async def _serve_forever(args):
+    universe = SyntheticUniverse(ssp_count=args.ssps, sellers_per_ssp=args.sellers, seed=args.seed)
+    config = ServerConfig(latency_ms=args.latency, not_found_ratio=args.not_found,
+                          rate_limit_ratio=args.rate_limit, gzip_ratio=args.gzip,
+                          redirect_ratio=args.redirect, seed=args.seed)
+    server = StandInServer(universe, config)
+    port = await server.start(port=args.port)
+    print(f'Serving {len(universe.documents)} hosts ({universe.total_bytes() / 1e6:.1f} MB) on port {port}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in ad-tech web server')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--ssps', type=int, default=10)
+    parser.add_argument('--sellers', type=int, default=2000, help='sellers per SSP sellers.json')
+    parser.add_argument('--latency', type=float, default=20.0, help='base latency in ms')
+    parser.add_argument('--not-found', type=float, default=0.0, help='ratio of forced 404s')
+    parser.add_argument('--rate-limit', type=float, default=0.02, help='ratio of 429 on first hit')
+    parser.add_argument('--gzip', type=float, default=0.5, help='ratio of gzip encoded bodies')
+    parser.add_argument('--redirect', type=float, default=0.05, help='ratio of 301 redirects')
+    parser.add_argument('--seed', type=int, default=42)
+    try:
+        asyncio.run(_serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,114 @@
+"""Synthetic sellers.json / ads.txt generators used by the offline benchmarks."""
+import json
+import random
+from typing import Dict, List, Optional
+
+DEFAULT_SELLER_MIX = {'PUBLISHER': 0.75, 'INTERMEDIARY': 0.2, 'BOTH': 0.05}
+
+
+def _pick_type(rng: random.Random, mix: Dict[str, float]) -> str:
+    """Pick a seller_type according to the given weights."""
+    return rng.choices(list(mix.keys()), weights=list(mix.values()), k=1)[0]
+
+
+def generate_sellers_json(ssp_domain: str, sellers: List[Dict], contact: str = '') -> Dict:
+    """Build a sellers.json document for an SSP from a list of seller dicts."""
+    return {
+        'contact_email': contact or f'adops@{ssp_domain}',
+        'contact_address': '1 Synthetic Street',
+        'version': '1.0',
+        'identifiers': [{'name': 'TAG-ID', 'value': 'synthetic'}],
+        'sellers': sellers,
+    }
+
+
+def generate_sellers(rng: random.Random, count: int, publishers: List[str],
+                     intermediaries: List[str], mix: Optional[Dict[str, float]] = None) -> List[Dict]:
+    """Generate `count` seller entries drawing domains from the given pools."""
+    mix = mix or DEFAULT_SELLER_MIX
+    sellers = []
+    for index in range(count):
+        seller_type = _pick_type(rng, mix)
+        pool = publishers if seller_type == 'PUBLISHER' else intermediaries
+        domain = rng.choice(pool)
+        seller = {
+            'seller_id': f'{index:08x}',
+            'name': domain.split('.')[0].capitalize(),
+            'domain': domain,
+            'seller_type': seller_type,
+        }
+        # A few entries look like the real files: confidential or without domain
+        roll = rng.random()
+        if roll < 0.02:
+            seller['is_confidential'] = 1
+            del seller['domain']
+        elif roll < 0.04:
+            seller['is_passthrough'] = 1
+        sellers.append(seller)
+    return sellers
+
+
+def generate_ads_txt(rng: random.Random, domain: str, ad_systems: List[str], lines: int = 40,
+                     with_smilewanted: bool = False) -> str:
+    """Generate an ads.txt file with DIRECT/RESELLER lines and the usual variables."""
+    out = [f'# ads.txt file for {domain}', f'OWNERDOMAIN={domain}', f'CONTACT=ads@{domain}']
+    if rng.random() < 0.3:
+        out.append(f'MANAGERDOMAIN={rng.choice(ad_systems)}')
+    for _ in range(lines):
+        system = rng.choice(ad_systems)
+        account = f'pub-{rng.randrange(10 ** 9):09d}'
+        account_type = 'DIRECT' if rng.random() < 0.4 else 'RESELLER'
+        if rng.random() < 0.5:
+            out.append(f'{system}, {account}, {account_type}, {rng.randrange(16 ** 8):08x}')
+        else:
+            out.append(f'{system}, {account}, {account_type}')
+    if with_smilewanted:
+        out.append(f'smilewanted.com, {rng.randrange(10 ** 4)}, DIRECT')
+    return '\n'.join(out) + '\n'
+
+
+class SyntheticUniverse:
+    """A deterministic set of SSPs, publishers and intermediaries with their files.
+
+    `documents` maps a host name to a dict of path -> body bytes, which is what
+    the stand-in server serves.
+    """
+
+    def __init__(self, ssp_count: int = 10, sellers_per_ssp: int = 2000, publisher_count: int = 2000,
+                 intermediary_count: int = 200, mix: Optional[Dict[str, float]] = None,
+                 ads_txt_lines: int = 40, ads_txt_ratio: float = 0.8, sellers_json_ratio: float = 0.6,
+                 seed: int = 42):
+        rng = random.Random(seed)
+        self.ssps = [f'ssp{index}.example' for index in range(ssp_count)]
+        self.publishers = [f'publisher{index}.example' for index in range(publisher_count)]
+        self.intermediaries = [f'reseller{index}.example' for index in range(intermediary_count)]
+        self.documents: Dict[str, Dict[str, bytes]] = {}
+
+        for ssp in self.ssps:
+            sellers = generate_sellers(rng, sellers_per_ssp, self.publishers, self.intermediaries, mix)
+            body = json.dumps(generate_sellers_json(ssp, sellers)).encode('utf-8')
+            self.documents.setdefault(ssp, {})['/sellers.json'] = body
+
+        for domain in self.publishers:
+            if rng.random() < ads_txt_ratio:
+                body = generate_ads_txt(rng, domain, self.ssps, ads_txt_lines,
+                                        with_smilewanted=rng.random() < 0.1)
+                self.documents.setdefault(domain, {})['/ads.txt'] = body.encode('utf-8')
+
+        for domain in self.intermediaries:
+            if rng.random() < sellers_json_ratio:
+                sellers = generate_sellers(rng, max(10, sellers_per_ssp // 20), self.publishers,
+                                           self.intermediaries, mix)
+                path = '/sellers.json' if rng.random() < 0.7 else '/.well-known/sellers.json'
+                body = json.dumps(generate_sellers_json(domain, sellers)).encode('utf-8')
+                self.documents.setdefault(domain, {})[path] = body
+            if rng.random() < ads_txt_ratio:
+                body = generate_ads_txt(rng, domain, self.ssps, ads_txt_lines)
+                self.documents.setdefault(domain, {})['/ads.txt'] = body.encode('utf-8')
+
+    def sellers_json_urls(self) -> Dict[str, str]:
+        """SSP name -> sellers.json URL, the shape of `List of SSP.csv`."""
+        return {ssp.split('.')[0].upper(): f'https://{ssp}/sellers.json' for ssp in self.ssps}
+
+    def total_bytes(self) -> int:
+        return sum(len(body) for paths in self.documents.values() for body in paths.values())
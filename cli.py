@@ -0,0 +1,156 @@
+"""Single entry point of the crawlers and their tools.
+
+    python cli.py crawl [--streaming --concurrency 100 --format jsonl ...]
+    python cli.py crawl --workers 4              # sharded over 4 processes
+    python cli.py worker --queue /shared/crawl_queue.db --shard 2
+    python cli.py replay DATE|latest
+    python cli.py check domains.txt [--concurrency 50 --output output --archive archive]
+    python cli.py check domains.txt --replay DATE|latest
+    python cli.py verify [--sellers ... --ads-txt ...]
+    python cli.py upload
+    python cli.py visualise [build_static.py options]
+    python cli.py --profile crawl.prof crawl ...
+
+Each subcommand imports what it needs when it runs: `--help`, a domain check
+or a crawl without upload never load the Google client libraries, and
+pandas is only loaded by the steps that build DataFrames.
+"""
+import argparse
+import os
+import sys
+
+from csv_sink import OUTPUT_FORMATS
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def crawl(args, replay=None):
+    if args.workers is not None or args.shards:
+        import sharded_crawl
+        sharded_crawl.run_sharded(args, replay)
+    else:
+        import ssp_scraper
+        ssp_scraper.run_crawl(args, replay)
+
+
+def replay(args):
+    crawl(args, args.date)
+
+
+def worker(args):
+    import sharded_crawl
+    sharded_crawl.run_worker(args.queue, args.shard, args.name, args.concurrency)
+
+
+def check(args):
+    import asyncio
+    import scraper
+    concurrency = args.concurrency or scraper.DOMAIN_CONCURRENCY
+    asyncio.run(scraper.main(args.domains, concurrency, args.output, args.output_format,
+                             args.archive, args.replay))
+
+
+def verify(args):
+    import cross_verify
+    cross_verify.main(args.sellers, args.ads_txt, args.ads_txt_db, args.output)
+
+
+def upload(args):
+    import ssp_scraper
+    ssp_scraper.upload_results()
+
+
+def visualise(args):
+    sys.path.insert(0, os.path.join(ROOT_DIR, 'Sources'))
+    import build_static
+    # build_static parses its own options
+    sys.argv = ['build_static.py'] + args.forwarded
+    build_static.main()
+
+
+def add_crawl_arguments(parser):
+    # Imported here: the crawl options need ssp_scraper (aiohttp), --help of the other subcommands does not
+    import sharded_crawl
+    import ssp_scraper
+    ssp_scraper.add_crawl_arguments(parser)
+    sharded_crawl.add_shard_arguments(parser)
+
+
+def build_parser(argv):
+    parser = argparse.ArgumentParser(description='ads.txt / sellers.json crawlers')
+    parser.add_argument('--profile', metavar='FILE', help='profile the command, save the stats to FILE')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+
+    crawl_parser = commands.add_parser('crawl', help="crawl the sellers.json of 'List of SSP.csv'")
+    crawl_parser.set_defaults(run=crawl)
+    replay_parser = commands.add_parser('replay', help='rerun the crawl on an archived run')
+    replay_parser.add_argument('date', help='date of the archived run, or latest')
+    replay_parser.set_defaults(run=replay)
+    worker_parser = commands.add_parser('worker', help="process the items of a sharded crawl's queue")
+    worker_parser.set_defaults(run=worker)
+    # Only the subcommand asked for gets its (costly) crawl options
+    if any(command in argv for command in ('crawl', 'replay')):
+        add_crawl_arguments(crawl_parser if 'crawl' in argv else replay_parser)
+    elif 'worker' in argv:
+        import sharded_crawl
+        sharded_crawl.add_worker_arguments(worker_parser)
+
+    check_parser = commands.add_parser('check', help='fetch ads.txt and sellers.json of a list of domains')
+    check_parser.add_argument('domains', nargs='?', help='file of domains, one per line (default: examples)')
+    check_parser.add_argument('--concurrency', type=int, help='domains processed at once (default: 50)')
+    check_parser.add_argument('--output', default='output', help='directory of the outputs')
+    check_parser.add_argument('--format', dest='output_format', choices=OUTPUT_FORMATS, default='csv',
+                              help='format of the outputs')
+    check_parser.add_argument('--archive', help='raw document archive directory (default: no archive)')
+    check_parser.add_argument('--replay', metavar='DATE',
+                              help='read the files archived on DATE (or latest) instead of fetching them, '
+                                   'from --archive or archive/')
+    check_parser.set_defaults(run=check)
+
+    verify_parser = commands.add_parser('verify', help='check ads.txt records against the sellers.json files')
+    verify_parser.add_argument('--sellers', default='output/sellers_data.csv', help="ssp_scraper's sellers_data.csv")
+    source = verify_parser.add_mutually_exclusive_group()
+    source.add_argument('--ads-txt', default='output/ads_txt_results.csv', help="check's ads_txt_results.csv")
+    source.add_argument('--ads-txt-db', help='adstxt database of Sources/AdsTxt/adstxt_crawler.py')
+    verify_parser.add_argument('--output', default='output', help='directory of the reports')
+    verify_parser.set_defaults(run=verify)
+
+    upload_parser = commands.add_parser('upload', help='upload the CSV results in output/ to Google Sheets')
+    upload_parser.set_defaults(run=upload)
+
+    # Its arguments are left to build_static.py (see main)
+    visualise_parser = commands.add_parser('visualise', help='rebuild the Articles static data (build_static.py)',
+                                           add_help=False)
+    visualise_parser.set_defaults(run=visualise)
+    return parser
+
+
+def profiled(run, args, path):
+    """Run the command under cProfile; the stats are saved to `path` and the top entries printed."""
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(run, args)
+    finally:
+        profiler.dump_stats(path)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    forwarded = []
+    if 'visualise' in argv:
+        split = argv.index('visualise') + 1
+        argv, forwarded = argv[:split], argv[split:]
+    args = build_parser(argv).parse_args(argv)
+    args.forwarded = forwarded
+    if args.profile:
+        profiled(args.run, args, args.profile)
+    else:
+        args.run(args)
+
+
+if __name__ == '__main__':
+    main()
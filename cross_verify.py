@@ -0,0 +1,226 @@
+"""Cross-verification of ads.txt records against the SSP sellers.json files.
+
+Each ads.txt record (site, ad system domain, seller account id, DIRECT or
+RESELLER) should name a seller of that ad system's sellers.json, of the
+matching type (DIRECT: PUBLISHER, RESELLER: INTERMEDIARY, BOTH matching
+either) and, for DIRECT records, with the site as its domain. The sellers
+are loaded once into a hash index on (ad system domain, seller_id), so every
+record is checked with one lookup and both inputs are read as streams:
+
+    python cross_verify.py --sellers output/sellers_data.csv --ads-txt output/ads_txt_results.csv
+    python cross_verify.py --sellers output/sellers_data.csv --ads-txt-db Sources/AdsTxt/adstxt.db
+
+Seller types are those each SSP declares (the declared_seller_type column):
+the seller_type column of sellers_data.csv holds the majority type of the
+seller's domain across all SSPs, which may not be the one this SSP gives.
+The ad system domain of a seller is the host of its sellers.json URL, also
+indexed under its parent domains (realtimebidding.google.com answers for
+google.com). Records of ad systems whose sellers.json was not crawled are
+counted as unknown, not as mismatches. Outputs, in the output directory:
+
+    ads_txt_verification.csv    one row per site: records, verified and each issue count
+    ads_txt_mismatches.csv      one row per record failing a check, with the seller found
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+from csv_sink import CsvSink
+
+# Issues, in the columns order of the per-site report
+ISSUES = ['missing_seller', 'type_mismatch', 'domain_mismatch', 'unknown_system']
+# sellers.json seller_type expected for each ads.txt account type
+EXPECTED_TYPES = {'DIRECT': {'PUBLISHER', 'BOTH'}, 'RESELLER': {'INTERMEDIARY', 'BOTH'}}
+REPORT_FIELDS = ['site', 'records', 'verified'] + ISSUES
+MISMATCH_FIELDS = ['site', 'ad_system_domain', 'seller_id', 'account_type', 'issue',
+                   'seller_type', 'seller_domain', 'ssp_name']
+
+
+def normalize_host(domain: Optional[str]) -> str:
+    domain = (domain or '').strip().lower().rstrip('.')
+    if '://' in domain:
+        domain = urlparse(domain).hostname or ''
+    domain = domain.split('/', 1)[0]
+    return domain[4:] if domain.startswith('www.') else domain
+
+
+def normalize_seller_id(seller_id) -> str:
+    return str(seller_id if seller_id is not None else '').strip().lower()
+
+
+class SellerIndex:
+    """(ad system domain, seller_id) -> (SELLER_TYPE, domain, ssp name) of every known seller."""
+
+    def __init__(self):
+        self.sellers: Dict[Tuple[str, str], Tuple[str, str, str]] = {}
+        # Ad system domain (and parent domains) -> sellers.json host it is indexed under
+        self.systems: Dict[str, str] = {}
+        self._sources: Dict[str, str] = {}
+
+    def add_system(self, source_url: str) -> str:
+        """Register the sellers.json at `source_url`; returns its ad system domain."""
+        host = self._sources.get(source_url)
+        if host is None:
+            host = self._sources[source_url] = normalize_host(source_url)
+            # The host itself takes precedence over a parent domain of another host
+            self.systems[host] = host
+            labels = host.split('.')
+            for i in range(1, len(labels) - 1):
+                self.systems.setdefault('.'.join(labels[i:]), host)
+        return host
+
+    def add(self, source_url: str, seller_id, seller_type: str, domain: str, ssp_name: str = ''):
+        host = self.add_system(source_url)
+        self.sellers[(host, normalize_seller_id(seller_id))] = (
+            (seller_type or '').strip().upper(), normalize_host(domain), ssp_name or '')
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> 'SellerIndex':
+        """Index of SSPScraper seller rows (results['sellers']), with the type declared by each SSP."""
+        return cls.from_tuples((row['Source URL'], row['seller_id'], row.get('declared_seller_type', row['seller_type']),
+                                row['domain'], row.get('SSP name')) for row in rows)
+
+    @classmethod
+    def from_tuples(cls, rows: Iterable[tuple]) -> 'SellerIndex':
+        """Index of (Source URL, seller_id, seller_type, domain, SSP name) rows (read_sellers_csv)."""
+        index = cls()
+        for row in rows:
+            index.add(*row)
+        return index
+
+    def system(self, ad_system_domain: str) -> Optional[str]:
+        return self.systems.get(normalize_host(ad_system_domain))
+
+    def __len__(self):
+        return len(self.sellers)
+
+
+def check(index: SellerIndex, site: str, ad_system_domain: str, seller_id, account_type: str):
+    """(issue or None, seller entry or None) of one ads.txt record."""
+    return _check(index.sellers, index.system(ad_system_domain), normalize_host(site), seller_id,
+                  (account_type or '').strip().upper())
+
+
+def _check(sellers, host, site, seller_id, account_type):
+    if host is None:
+        return 'unknown_system', None
+    seller = sellers.get((host, normalize_seller_id(seller_id)))
+    if seller is None:
+        return 'missing_seller', None
+    if seller[0] not in EXPECTED_TYPES.get(account_type, ()):
+        return 'type_mismatch', seller
+    # Confidential sellers publish no domain: nothing to compare
+    if account_type == 'DIRECT' and seller[1] and seller[1] != site:
+        return 'domain_mismatch', seller
+    return None, seller
+
+
+def verify(index: SellerIndex, records: Iterable[Tuple[str, str, str, str]], on_mismatch=None) -> Dict[str, list]:
+    """Check (site, ad system domain, seller_id, account type) records; returns the per-site counts
+    [records, verified, *ISSUES]. Each failing record is passed to `on_mismatch` as a tuple of
+    MISMATCH_FIELDS."""
+    report: Dict[str, list] = {}
+    columns = {issue: 2 + i for i, issue in enumerate(ISSUES)}
+    # Sites and ad systems repeat over millions of records: normalized once each
+    sites: Dict[str, str] = {}
+    systems: Dict[str, Optional[str]] = {}
+    for site, ad_system_domain, seller_id, account_type in records:
+        name = sites.get(site)
+        if name is None:
+            name = sites[site] = normalize_host(site)
+        counts = report.get(name)
+        if counts is None:
+            counts = report[name] = [0] * (2 + len(ISSUES))
+        counts[0] += 1
+        if ad_system_domain in systems:
+            host = systems[ad_system_domain]
+        else:
+            host = systems[ad_system_domain] = index.system(ad_system_domain)
+        issue, seller = _check(index.sellers, host, name, seller_id, account_type.strip().upper())
+        if issue is None:
+            counts[1] += 1
+            continue
+        counts[columns[issue]] += 1
+        if on_mismatch is not None:
+            on_mismatch((name, ad_system_domain, seller_id, account_type, issue) + (seller or ('', '', '')))
+    return report
+
+
+def _read_csv(path: str, columns) -> Iterator[tuple]:
+    """Tuples of the `columns` of a CSV file with a header row."""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positions = [header.index(column) for column in columns]
+        for row in reader:
+            if row:
+                yield tuple(row[i] for i in positions)
+
+
+def read_sellers_csv(path: str) -> Iterator[tuple]:
+    """(Source URL, seller_id, declared seller_type, domain, SSP name) of ssp_scraper's sellers_data.csv."""
+    with open(path, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f), [])
+    seller_type = 'declared_seller_type'
+    if seller_type not in header:
+        # Files written before the column existed only have the majority type
+        print(f"{path} has no declared_seller_type column: checking types against the majority type of each domain")
+        seller_type = 'seller_type'
+    return _read_csv(path, ['Source URL', 'seller_id', seller_type, 'domain', 'SSP name'])
+
+
+def read_ads_txt_csv(path: str) -> Iterator[Tuple[str, str, str, str]]:
+    """Records of AdTechScraper's ads_txt_results.csv."""
+    return _read_csv(path, ['domain', 'ad_system_domain', 'publisher_id', 'account_type'])
+
+
+def read_ads_txt_db(path: str) -> Iterator[Tuple[str, str, str, str]]:
+    """Records of the adstxt table filled by Sources/AdsTxt/adstxt_crawler.py."""
+    conn = sqlite3.connect(path)
+    try:
+        yield from conn.execute('SELECT SITE_DOMAIN, EXCHANGE_DOMAIN, SELLER_ACCOUNT_ID, ACCOUNT_TYPE FROM adstxt')
+    finally:
+        conn.close()
+
+
+def write_report(report: Dict[str, list], path: str):
+    sink = CsvSink(path, REPORT_FIELDS)
+    try:
+        for site in sorted(report):
+            sink(dict(zip(REPORT_FIELDS, [site] + report[site])))
+    finally:
+        sink.close()
+
+
+def main(sellers_path: str, ads_txt_path: Optional[str] = None, ads_txt_db: Optional[str] = None,
+         output_dir: str = 'output') -> Dict[str, list]:
+    start = time.perf_counter()
+    index = SellerIndex.from_tuples(read_sellers_csv(sellers_path))
+    print(f"{len(index)} sellers of {len(set(index.systems.values()))} ad systems indexed "
+          f"in {time.perf_counter() - start:.1f}s")
+    records = read_ads_txt_db(ads_txt_db) if ads_txt_db else read_ads_txt_csv(ads_txt_path)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'ads_txt_mismatches.csv'), 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(MISMATCH_FIELDS)
+        report = verify(index, records, writer.writerow)
+    write_report(report, os.path.join(output_dir, 'ads_txt_verification.csv'))
+    totals = [sum(column) for column in zip(*report.values())] or [0] * (2 + len(ISSUES))
+    print(f"{totals[0]} records of {len(report)} sites checked in {time.perf_counter() - start:.1f}s: "
+          f"{totals[1]} verified, " + ', '.join(f"{n} {issue}" for issue, n in zip(ISSUES, totals[2:])))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check ads.txt records against the SSP sellers.json files')
+    parser.add_argument('--sellers', default='output/sellers_data.csv', help="ssp_scraper's sellers_data.csv")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--ads-txt', default='output/ads_txt_results.csv', help="scraper.py's ads_txt_results.csv")
+    source.add_argument('--ads-txt-db', help='adstxt database of Sources/AdsTxt/adstxt_crawler.py')
+    parser.add_argument('--output', default='output', help='directory of the reports')
+    args = parser.parse_args()
+    main(args.sellers, args.ads_txt, args.ads_txt_db, args.output)
@@ -0,0 +1,72 @@
+"""Streaming CSV (or JSON Lines) output: rows are written as results come in
+instead of being collected for a DataFrame at the end, so memory stays flat on
+large runs. `open_sink(path, 'jsonl')` picks the sink of an output format and
+gives `path` its extension."""
+import csv
+import json
+import os
+from typing import Dict, List, Optional
+
+
+class CsvSink:
+    """Sink writing each result dict as a CSV row as it arrives: call it with one result
+    (process_domains_batch) or extend it with many, like a list (AdTechScraper.process_domains)."""
+
+    def __init__(self, path: str, fieldnames: Optional[List[str]] = None):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'w', newline='')
+        self.fieldnames = fieldnames
+        self.writer = None
+        self.rows = 0
+        if fieldnames:
+            # Known columns: the header is there even if no row comes
+            self._open_writer(fieldnames)
+
+    def _open_writer(self, fieldnames: List[str]):
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames, lineterminator='\n')
+        self.writer.writeheader()
+
+    def __call__(self, result: Dict):
+        if self.writer is None:
+            self._open_writer(list(result))
+        self.writer.writerow(result)
+        self.rows += 1
+
+    def extend(self, results):
+        for result in results:
+            self(result)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlSink:
+    """Same interface as CsvSink, one JSON object per line (`fieldnames` selects and orders the keys)."""
+
+    def __init__(self, path: str, fieldnames: Optional[List[str]] = None):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'w', encoding='utf-8')
+        self.fieldnames = fieldnames
+        self.rows = 0
+
+    def __call__(self, result: Dict):
+        if self.fieldnames:
+            result = {key: result.get(key) for key in self.fieldnames}
+        self.file.write(json.dumps(result, ensure_ascii=False, default=str) + '\n')
+        self.rows += 1
+
+    def extend(self, results):
+        for result in results:
+            self(result)
+
+    def close(self):
+        self.file.close()
+
+
+SINKS = {'csv': CsvSink, 'jsonl': JsonlSink}
+OUTPUT_FORMATS = list(SINKS)
+
+
+def open_sink(path: str, output_format: str = 'csv', fieldnames: Optional[List[str]] = None) -> CsvSink:
+    """Sink of `output_format` writing to `path` with that format's extension."""
+    return SINKS[output_format](os.path.splitext(path)[0] + '.' + output_format, fieldnames)
@@ -0,0 +1,38 @@
+"""Decoding rules for the fetched ads.txt and sellers.json bodies.
+
+The crawlers read response bodies as bytes and decode them here instead of
+calling `response.text()`, which guesses a charset over the whole body when
+the server does not declare one, then hands a copy of it to the parser.
+
+- ads.txt is UTF-8 (IAB ads.txt 1.1): a UTF-8 byte order mark is dropped, a
+  UTF-16 one is honoured, and undecodable bytes are replaced instead of
+  failing the whole file.
+- sellers.json goes to `json.loads` as bytes, which detects UTF-8/16/32 and
+  skips a byte order mark; only bodies that are not valid in their encoding
+  are decoded again with replacement characters.
+"""
+import codecs
+import json
+from typing import Optional
+
+_UTF16_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+
+def decode_ads_txt(body: Optional[bytes]) -> str:
+    """Text of an ads.txt body ('' for None)."""
+    if not body:
+        return ''
+    if body.startswith(_UTF16_BOMS):
+        return body.decode('utf-16', errors='replace')
+    return body.decode('utf-8-sig', errors='replace')
+
+
+def load_json(body):
+    """Decoded JSON document of a sellers.json body (bytes or str).
+
+    Raises ValueError (json.JSONDecodeError) when the body is not JSON.
+    """
+    try:
+        return json.loads(body)
+    except UnicodeDecodeError:
+        return json.loads(body.decode('utf-8-sig', errors='replace'))
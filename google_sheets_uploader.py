@@ -1,29 +1,31 @@
 import os
-import pandas as pd
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 import pickle
 from datetime import datetime
 import logging
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('sheets_upload.log'),
-        logging.StreamHandler()
-    ]
-)
+# pandas and the Google client libraries are imported by the methods that use
+# them: importing this module stays cheap and has no side effects.
 logger = logging.getLogger(__name__)
+UPLOAD_LOG = 'sheets_upload.log'
+
+def log_to_file(path=UPLOAD_LOG):
+    """Also write this module's log to `path` (once)."""
+    if any(getattr(handler, 'baseFilename', None) == os.path.abspath(path) for handler in logger.handlers):
+        return
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    if logger.getEffectiveLevel() > logging.INFO:
+        logger.setLevel(logging.INFO)
 
 # If modifying these scopes, delete the file token.pickle.
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+# Rows read and sent per request by upload_csv
+UPLOAD_CHUNK_ROWS = 10000
 
 class GoogleSheetsUploader:
     def __init__(self, spreadsheet_id):
+        log_to_file()
         self.spreadsheet_id = spreadsheet_id
         self.creds = None
         self.service = None
@@ -31,6 +33,10 @@ class GoogleSheetsUploader:
 
     def _authenticate(self):
         """Authenticate with Google Sheets API."""
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from google.auth.transport.requests import Request
+        from googleapiclient.discovery import build
+
         if os.path.exists('token.pickle'):
             with open('token.pickle', 'rb') as token:
                 self.creds = pickle.load(token)
@@ -65,74 +71,93 @@ class GoogleSheetsUploader:
 
     def upload_dataframe(self, df, sheet_name):
         """Upload a pandas DataFrame to a specific sheet."""
-        if df.empty:
-            logger.info(f"No data to upload for {sheet_name}")
-            return
-
-        try:
-            # Clean the DataFrame
-            df = self.clean_dataframe(df)
-            
-            # Convert DataFrame to list of lists
-            values = [df.columns.tolist()]
-            
-            # Process rows one by one to handle errors
-            for index, row in df.iterrows():
-                try:
-                    # Convert row to list and ensure all values are strings
-                    row_values = [str(val) for val in row.values]
-                    values.append(row_values)
-                except Exception as e:
-                    logger.warning(f"Skipping row {index} in {sheet_name} due to error: {str(e)}")
-                    continue
-
-            # Format range name without quotes
-            range_name = f"{sheet_name}!A1"
-            
-            # First, ensure the sheet exists
+        self.upload_chunks([df], sheet_name)
+
+    def upload_csv(self, path, sheet_name, sep=','):
+        """Upload a CSV file to a specific sheet, reading it UPLOAD_CHUNK_ROWS rows at a time.
+
+        Cells are uploaded as written in the file (no number parsing, so ids keep their zeros).
+        """
+        import pandas as pd
+        chunks = pd.read_csv(path, sep=sep, dtype=str, keep_default_na=False, chunksize=UPLOAD_CHUNK_ROWS)
+        self.upload_chunks(chunks, sheet_name)
+
+    def upload_chunks(self, chunks, sheet_name):
+        """Upload DataFrames, the successive chunks of one table, to a specific sheet, replacing its content."""
+        next_row = None
+        for df in chunks:
+            if df.empty:
+                continue
             try:
-                self.service.spreadsheets().values().get(
-                    spreadsheetId=self.spreadsheet_id,
-                    range=range_name
-                ).execute()
-            except Exception:
-                # If sheet doesn't exist, create it
-                body = {
-                    'requests': [{
-                        'addSheet': {
-                            'properties': {
-                                'title': sheet_name
-                            }
+                # Clean the DataFrame
+                df = self.clean_dataframe(df)
+                
+                # Convert DataFrame to list of lists, with the header above the first chunk
+                values = [df.columns.tolist()] if next_row is None else []
+                
+                # Process rows one by one to handle errors
+                for index, row in df.iterrows():
+                    try:
+                        # Convert row to list and ensure all values are strings
+                        row_values = [str(val) for val in row.values]
+                        values.append(row_values)
+                    except Exception as e:
+                        logger.warning(f"Skipping row {index} in {sheet_name} due to error: {str(e)}")
+                        continue
+
+                if next_row is None:
+                    # Format range name without quotes
+                    range_name = f"{sheet_name}!A1"
+                    
+                    # First, ensure the sheet exists
+                    try:
+                        self.service.spreadsheets().values().get(
+                            spreadsheetId=self.spreadsheet_id,
+                            range=range_name
+                        ).execute()
+                    except Exception:
+                        # If sheet doesn't exist, create it
+                        body = {
+                            'requests': [{
+                                'addSheet': {
+                                    'properties': {
+                                        'title': sheet_name
+                                    }
+                                }
+                            }]
                         }
-                    }]
+                        self.service.spreadsheets().batchUpdate(
+                            spreadsheetId=self.spreadsheet_id,
+                            body=body
+                        ).execute()
+
+                    # Clear existing content
+                    self.service.spreadsheets().values().clear(
+                        spreadsheetId=self.spreadsheet_id,
+                        range=range_name
+                    ).execute()
+                    next_row = 1
+
+                # Write this chunk below the previous ones
+                body = {
+                    'values': values
                 }
-                self.service.spreadsheets().batchUpdate(
+                
+                result = self.service.spreadsheets().values().update(
                     spreadsheetId=self.spreadsheet_id,
+                    range=f"{sheet_name}!A{next_row}",
+                    valueInputOption='RAW',
                     body=body
                 ).execute()
+                next_row += len(values)
 
-            # Clear existing content
-            self.service.spreadsheets().values().clear(
-                spreadsheetId=self.spreadsheet_id,
-                range=range_name
-            ).execute()
+                logger.info(f"Updated {result.get('updatedCells')} cells in {sheet_name}")
+            except Exception as e:
+                logger.error(f"Error updating sheet {sheet_name}: {str(e)}")
+                raise
 
-            # Update with new data
-            body = {
-                'values': values
-            }
-            
-            result = self.service.spreadsheets().values().update(
-                spreadsheetId=self.spreadsheet_id,
-                range=range_name,
-                valueInputOption='RAW',
-                body=body
-            ).execute()
-
-            logger.info(f"Updated {result.get('updatedCells')} cells in {sheet_name}")
-        except Exception as e:
-            logger.error(f"Error updating sheet {sheet_name}: {str(e)}")
-            raise
+        if next_row is None:
+            logger.info(f"No data to upload for {sheet_name}")
 
     def upload_all_data(self):
         """Upload all output files to Google Sheets."""
@@ -140,8 +165,7 @@ class GoogleSheetsUploader:
             # Upload sellers data
             if os.path.exists('output/sellers_data.csv'):
                 try:
-                    df_sellers = pd.read_csv('output/sellers_data.csv', low_memory=False)
-                    self.upload_dataframe(df_sellers, 'Sellers Data')
+                    self.upload_csv('output/sellers_data.csv', 'Sellers Data')
                 except Exception as e:
                     logger.error(f"Error processing sellers_data.csv: {str(e)}")
 
@@ -150,31 +174,29 @@ class GoogleSheetsUploader:
                 try:
                     # Try reading with semicolon separator first
                     try:
-                        df_direct = pd.read_csv('output/direct_media.csv', sep=';', low_memory=False)
+                        self.upload_csv('output/direct_media.csv', 'Direct Media', sep=';')
                     except:
                         # If that fails, try with comma separator
-                        df_direct = pd.read_csv('output/direct_media.csv', low_memory=False)
-                    self.upload_dataframe(df_direct, 'Direct Media')
+                        self.upload_csv('output/direct_media.csv', 'Direct Media')
                 except Exception as e:
                     logger.error(f"Error processing direct_media.csv: {str(e)}")
 
             # Upload intermediaries data
             if os.path.exists('output/intermediaries.csv'):
                 try:
-                    df_inter = pd.read_csv('output/intermediaries.csv', low_memory=False)
-                    self.upload_dataframe(df_inter, 'Intermediaries')
+                    self.upload_csv('output/intermediaries.csv', 'Intermediaries')
                 except Exception as e:
                     logger.error(f"Error processing intermediaries.csv: {str(e)}")
 
             # Upload new domains report
             if os.path.exists('output/new_domains_report.csv'):
                 try:
-                    df_new = pd.read_csv('output/new_domains_report.csv', low_memory=False)
-                    self.upload_dataframe(df_new, 'New Domains Report')
+                    self.upload_csv('output/new_domains_report.csv', 'New Domains Report')
                 except Exception as e:
                     logger.error(f"Error processing new_domains_report.csv: {str(e)}")
 
             # Add timestamp
+            import pandas as pd
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             self.upload_dataframe(
                 pd.DataFrame({'Last Updated': [timestamp]}),
@@ -229,6 +251,3 @@ class GoogleSheetsUploader:
         except Exception as e:
             logger.error(f"Error appending to sheet {sheet_name}: {str(e)}")
             raise
-
-# Set the environment variable for your Google Sheet ID
-os.environ['GOOGLE_SHEETS_ID'] = 'your-spreadsheet-id-here'
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""Host health tracking and circuit breaking for the crawlers.
+
+Connection failures and timeouts are counted per host. Once a host reaches
+its failure threshold, its circuit opens: requests to it fail at once
+instead of paying the connect timeout again for every retry and URL variant
+(apex, www, .well-known). An open circuit lasts `base_backoff` seconds (one
+day), doubled each time it opens again, up to `max_backoff`. After that one
+request is let through, and a success closes the circuit. When a path is
+given, the host circuits are saved there (SQLite) and reloaded by the next
+run, so a host that keeps failing is retried less and less often across runs.
+
+Addresses are shared by unrelated sites (CDNs, shared hosting), so an
+address circuit only opens once `ip_threshold` distinct hosts resolving to
+it have had their own circuit opened, and never for an address one of its
+hosts answered from during the run. Address circuits last for the run only.
+
+Changes are written COMMIT_EVERY at a time in one short transaction, merged
+with what other processes wrote meanwhile (the highest counts and backoff of
+a circuit are kept, a response deletes it), so the workers of a sharded
+crawl can share the file.
+
+    HEALTH (KIND 'host', NAME) -> FAILURES, OPENS, OPEN_UNTIL, LAST_ERROR, UPDATED
+"""
+import asyncio
+import socket
+import sqlite3
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+HOST_HEALTH = 'host_health.db'
+# Circuits changed between two saves
+COMMIT_EVERY = 200
+# Seconds to wait for another process's write to finish
+BUSY_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS HEALTH (
+    KIND TEXT NOT NULL,
+    NAME TEXT NOT NULL,
+    FAILURES INTEGER NOT NULL,
+    OPENS INTEGER NOT NULL,
+    OPEN_UNTIL REAL NOT NULL,
+    LAST_ERROR TEXT,
+    UPDATED REAL NOT NULL,
+    PRIMARY KEY (KIND, NAME)
+) WITHOUT ROWID;
+"""
+
+
+class Circuit:
+    __slots__ = ('failures', 'opens', 'open_until', 'last_error')
+
+    def __init__(self, failures: int = 0, opens: int = 0, open_until: float = 0.0, last_error: str = None):
+        self.failures = failures
+        self.opens = opens
+        self.open_until = open_until
+        self.last_error = last_error
+
+
+class CircuitOpenError(Exception):
+    """Raised by HostHealth.check for a host whose circuit is open."""
+
+    def __init__(self, host: str, key: Tuple[str, str], circuit: Circuit):
+        self.host = host
+        self.key = key
+        self.open_until = circuit.open_until
+        super().__init__(f"circuit open for {key[0]} {key[1]} ({circuit.last_error})")
+
+
+class HostHealth:
+    def __init__(self, path: Optional[str] = None, host_threshold: int = 2, ip_threshold: int = 3,
+                 base_backoff: float = 86400.0, max_backoff: float = 30 * 86400.0):
+        """In memory for one run, or saved in `path` across runs (host circuits only)."""
+        self.path = path
+        self.thresholds = {'host': host_threshold, 'ip': ip_threshold}
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.circuits: Dict[Tuple[str, str], Circuit] = {}
+        self._changed = set()
+        self._addresses: Dict[str, List[str]] = {}
+        # Address -> hosts resolving to it whose circuit opened, and addresses seen answering
+        self._down_hosts: Dict[str, Set[str]] = {}
+        self._answering: Set[str] = set()
+        self._open_ips = 0
+        self.blocked = 0
+        if path:
+            self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+            self.conn.executescript(SCHEMA)
+            # Address circuits of older versions were saved too: dropped
+            with self.conn:
+                self.conn.execute("DELETE FROM HEALTH WHERE KIND='ip'")
+            for kind, name, failures, opens, open_until, last_error, _ in self.conn.execute('SELECT * FROM HEALTH'):
+                self.circuits[(kind, name)] = Circuit(failures, opens, open_until, last_error)
+
+    async def _resolve(self, host: str) -> List[str]:
+        """Addresses of a host, looked up once per run (none when it does not resolve)."""
+        if host not in self._addresses:
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+                self._addresses[host] = sorted({info[4][0] for info in infos})
+            except OSError:
+                self._addresses[host] = []
+        return self._addresses[host]
+
+    def _is_open(self, key: Tuple[str, str], now: float) -> bool:
+        circuit = self.circuits.get(key)
+        if circuit is None or circuit.open_until == 0.0:
+            return False
+        if now < circuit.open_until:
+            return True
+        # Backoff over: let one request through, the next failure reopens at once
+        circuit.open_until = 0.0
+        circuit.failures = self.thresholds[key[0]] - 1
+        return False
+
+    async def check(self, host: str):
+        """Raise CircuitOpenError when requests to `host` should not be attempted."""
+        now = time.time()
+        key = ('host', host)
+        if self._is_open(key, now):
+            self.blocked += 1
+            raise CircuitOpenError(host, key, self.circuits[key])
+        # Addresses are only looked up once some address circuit is open
+        if self._open_ips:
+            addresses = await self._resolve(host)
+            if addresses and all(self._is_open(('ip', address), now) for address in addresses):
+                self.blocked += 1
+                key = ('ip', addresses[0])
+                raise CircuitOpenError(host, key, self.circuits[key])
+
+    def _open(self, circuit: Circuit, now: float):
+        circuit.opens += 1
+        circuit.open_until = now + min(self.max_backoff, self.base_backoff * 2 ** (circuit.opens - 1))
+
+    async def failure(self, host: str, error: str):
+        """Record a connection failure or timeout of `host`."""
+        now = time.time()
+        key = ('host', host)
+        circuit = self.circuits.get(key)
+        if circuit is None:
+            circuit = self.circuits[key] = Circuit()
+        circuit.failures += 1
+        circuit.last_error = error
+        self._mark(key)
+        if circuit.failures < self.thresholds['host'] or circuit.open_until > now:
+            return
+        self._open(circuit, now)
+        # The host is down: its addresses are suspect once enough other hosts on them are down too
+        for address in await self._resolve(host):
+            hosts = self._down_hosts.setdefault(address, set())
+            hosts.add(host)
+            ip_key = ('ip', address)
+            if address in self._answering or len(hosts) < self.thresholds['ip'] or self._is_open(ip_key, now):
+                continue
+            ip_circuit = self.circuits.get(ip_key)
+            if ip_circuit is None:
+                ip_circuit = self.circuits[ip_key] = Circuit()
+                self._open_ips += 1
+            ip_circuit.failures = len(hosts)
+            ip_circuit.last_error = f"{len(hosts)} hosts down, last {host}: {error}"
+            self._open(ip_circuit, now)
+
+    async def success(self, host: str):
+        """Record a response from `host` (whatever its status): the host and its addresses are up."""
+        if self.circuits.pop(('host', host), None) is not None:
+            self._mark(('host', host))
+        # Addresses only matter once some host is down
+        if not self._down_hosts:
+            return
+        for address in await self._resolve(host):
+            self._answering.add(address)
+            if self.circuits.pop(('ip', address), None) is not None:
+                self._open_ips -= 1
+
+    def summary(self) -> Dict[str, int]:
+        now = time.time()
+        return {
+            'open_hosts': sum(1 for (kind, _), c in self.circuits.items() if kind == 'host' and c.open_until > now),
+            'open_ips': sum(1 for (kind, _), c in self.circuits.items() if kind == 'ip' and c.open_until > now),
+            'blocked_requests': self.blocked,
+        }
+
+    def _mark(self, key: Tuple[str, str]):
+        self._changed.add(key)
+        if len(self._changed) >= COMMIT_EVERY:
+            self.save()
+
+    def save(self):
+        """Save the host circuits changed since the last save, merged with the saved ones."""
+        if not self.path or not self._changed:
+            return
+        now = time.time()
+        closed, failing = [], []
+        for key in self._changed:
+            circuit = self.circuits.get(key)
+            if circuit is None:
+                closed.append(key)
+            else:
+                failing.append(key + (circuit.failures, circuit.opens, circuit.open_until, circuit.last_error, now))
+        with self.conn:
+            self.conn.executemany('DELETE FROM HEALTH WHERE KIND=? AND NAME=?', closed)
+            # Another worker may have counted more failures or opened the circuit for longer
+            self.conn.executemany(
+                'INSERT INTO HEALTH VALUES (?,?,?,?,?,?,?) ON CONFLICT (KIND, NAME) DO UPDATE SET '
+                'FAILURES=max(FAILURES, excluded.FAILURES), OPENS=max(OPENS, excluded.OPENS), '
+                'OPEN_UNTIL=max(OPEN_UNTIL, excluded.OPEN_UNTIL), LAST_ERROR=excluded.LAST_ERROR, '
+                'UPDATED=excluded.UPDATED', failing)
+        self._changed.clear()
+
+    def close(self):
+        self.save()
+        if self.path:
+            self.conn.close()
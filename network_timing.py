@@ -0,0 +1,342 @@
+"""Per-request network timing for the aiohttp crawlers.
+
+`NetworkTimingCollector.trace_config()` plugs into an aiohttp ClientSession and
+records, for every request (and every redirect hop), DNS, connect, TLS, time to
+first byte and body transfer times along with status, bytes and the retry
+attempt passed through `trace_request_ctx={'attempt': n}`.
+
+Memory stays bounded over a long crawl: a request is finalized once it is
+complete, its record is appended to a temporary JSONL file and added to
+per-host aggregates, and its event is dropped. Complete means: its body was
+read (aiohttp reports the body of read() in one go), it failed, its response
+was released by the caller without being read, or nothing happened to it for
+SETTLE_SECONDS. The aggregates are counters and, per timing, a uniform sample
+of at most RESERVOIR_SIZE values (reservoir sampling), so the percentiles of
+the summary are exact up to that many requests per host and estimated beyond.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import weakref
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+from aiohttp import TCPConnector
+
+# Loop time at which the TCP socket was connected, set by TimingTCPConnector
+_tcp_connected_at = contextvars.ContextVar('tcp_connected_at', default=None)
+
+TIMING_FIELDS = ['dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms', 'transfer_ms', 'total_ms']
+# Seconds without news after which a request still in flight is taken as complete: longer than
+# any read timeout, so its body read has ended one way or another
+SETTLE_SECONDS = 120.0
+# Requests started between two looks for settled requests
+SETTLE_EVERY = 200
+# Values of each timing kept per host for the percentiles
+RESERVOIR_SIZE = 1000
+
+
+class TimingTCPConnector(TCPConnector):
+    """TCPConnector that notes when the TCP handshake is done, so TLS time can be split out.
+
+    asyncio builds the protocol right after the socket is connected and before
+    the TLS handshake starts, so wrapping the protocol factory gives that instant.
+    """
+
+    async def _wrap_create_connection(self, *args, **kwargs):
+        factory = args[0]
+
+        def timed_factory():
+            _tcp_connected_at.set(asyncio.get_running_loop().time())
+            return factory()
+
+        return await super()._wrap_create_connection(timed_factory, *args[1:], **kwargs)
+
+
+def _ms(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start) * 1000.0, 2)
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Linear interpolation percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return round(sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower), 2)
+
+
+class HostTimings:
+    """Aggregates of the records of one host.
+
+    `values` holds a uniform sample of each timing (algorithm R): the first
+    RESERVOIR_SIZE values, then the n-th one replaces a random slot with
+    probability RESERVOIR_SIZE/n. `seen` counts the values of each timing.
+    """
+    __slots__ = ('requests', 'retries', 'errors', 'status', 'bytes', 'wall_ms', 'values', 'seen')
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.status = Counter()
+        self.bytes = 0
+        self.wall_ms = 0.0
+        self.values = {field: array('d') for field in TIMING_FIELDS}
+        self.seen = dict.fromkeys(TIMING_FIELDS, 0)
+
+    def add(self, record: Dict):
+        self.requests += 1
+        self.retries += record['attempt'] > 1
+        self.errors += bool(record['error'])
+        self.status[str(record['status'])] += 1
+        self.bytes += record['bytes']
+        self.wall_ms += record['total_ms'] or 0.0
+        for field in TIMING_FIELDS:
+            value = record[field]
+            if value is None:
+                continue
+            self.seen[field] += 1
+            sample = self.values[field]
+            if len(sample) < RESERVOIR_SIZE:
+                sample.append(value)
+            else:
+                slot = random.randrange(self.seen[field])
+                if slot < RESERVOIR_SIZE:
+                    sample[slot] = value
+
+
+class NetworkTimingCollector:
+    def __init__(self, spill_dir: Optional[str] = None, settle_seconds: float = SETTLE_SECONDS):
+        """Records are kept in a temporary file in `spill_dir` (the system temporary directory by default)."""
+        self.spill_dir = spill_dir
+        self.settle_seconds = settle_seconds
+        # Requests not complete yet
+        self._in_flight: Dict[int, Dict] = {}
+        self._started = 0
+        self._hosts: Dict[str, HostTimings] = {}
+        self._file = None
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Build a TraceConfig feeding this collector."""
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_dns_resolvehost_start.append(self._on_dns_start)
+        trace_config.on_dns_resolvehost_end.append(self._on_dns_end)
+        trace_config.on_connection_create_start.append(self._on_connection_start)
+        trace_config.on_connection_create_end.append(self._on_connection_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_redirect.append(self._on_request_redirect)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        trace_config.on_response_chunk_received.append(self._on_chunk)
+        return trace_config
+
+    @staticmethod
+    def _now() -> float:
+        return asyncio.get_running_loop().time()
+
+    async def _on_request_start(self, session, ctx, params):
+        request_ctx = ctx.trace_request_ctx if isinstance(ctx.trace_request_ctx, dict) else {}
+        url = str(params.url)
+        event = {
+            'url': url,
+            'host': urlparse(url).hostname or '',
+            'method': params.method,
+            'attempt': request_ctx.get('attempt', 1),
+            'started_at': time.time(),
+            'status': None,
+            'bytes': 0,
+            'content_length': None,
+            'redirected': False,
+            'reused_connection': False,
+            'error': None,
+            '_start': self._now(),
+        }
+        ctx.timing = event
+        self._in_flight[id(event)] = event
+        self._started += 1
+        if self._started % SETTLE_EVERY == 0:
+            self._settle(event['_start'] - self.settle_seconds)
+
+    async def _on_dns_start(self, session, ctx, params):
+        ctx.timing['_dns_start'] = self._now()
+
+    async def _on_dns_end(self, session, ctx, params):
+        ctx.timing['_dns_end'] = self._now()
+
+    async def _on_connection_start(self, session, ctx, params):
+        ctx.timing['_connect_start'] = self._now()
+
+    async def _on_connection_end(self, session, ctx, params):
+        event = ctx.timing
+        event['_connect_end'] = self._now()
+        tcp_done = _tcp_connected_at.get()
+        if tcp_done is not None and tcp_done >= event['_connect_start']:
+            event['_tcp_done'] = tcp_done
+
+    async def _on_connection_reused(self, session, ctx, params):
+        ctx.timing['reused_connection'] = True
+
+    async def _on_request_end(self, session, ctx, params):
+        # Fired once the response headers are in: first byte of the response
+        event = ctx.timing
+        event['_headers'] = self._now()
+        event['status'] = params.response.status
+        event['content_length'] = params.response.content_length
+        # Gone once the caller is done with the response, read or not
+        event['_response'] = weakref.ref(params.response)
+
+    async def _on_request_redirect(self, session, ctx, params):
+        event = ctx.timing
+        event['_headers'] = self._now()
+        event['status'] = params.response.status
+        event['redirected'] = True
+
+    async def _on_request_exception(self, session, ctx, params):
+        event = ctx.timing
+        event['_failed'] = self._now()
+        event['error'] = type(params.exception).__name__
+        self._complete(event)
+
+    async def _on_chunk(self, session, ctx, params):
+        event = getattr(ctx, 'timing', None)
+        if event is not None and id(event) in self._in_flight:
+            event['bytes'] += len(params.chunk)
+            event['_last_chunk'] = self._now()
+            # The body has been read: complete once the callbacks of this read are done
+            asyncio.get_running_loop().call_soon(self._complete, event)
+
+    @staticmethod
+    def _finalize(event: Dict) -> Dict:
+        """Turn raw loop timestamps into durations."""
+        record = {key: value for key, value in event.items() if not key.startswith('_')}
+        dns_ms = _ms(event.get('_dns_start'), event.get('_dns_end'))
+        connect_start = event.get('_dns_end') or event.get('_connect_start')
+        tcp_done = event.get('_tcp_done')
+        if tcp_done is not None:
+            record['connect_ms'] = _ms(connect_start, tcp_done)
+            tls_ms = _ms(tcp_done, event.get('_connect_end'))
+            record['tls_ms'] = tls_ms if record['url'].startswith('https') else None
+        else:
+            record['connect_ms'] = _ms(connect_start, event.get('_connect_end'))
+            record['tls_ms'] = None
+        record['dns_ms'] = dns_ms
+        record['ttfb_ms'] = _ms(event['_start'], event.get('_headers'))
+        if event.get('_headers') is not None:
+            record['transfer_ms'] = _ms(event['_headers'], event.get('_last_chunk')) or 0.0
+        else:
+            record['transfer_ms'] = None
+        end = event.get('_last_chunk') or event.get('_headers') or event.get('_failed')
+        record['total_ms'] = _ms(event['_start'], end)
+        return record
+
+    def _add(self, record: Dict):
+        """Append a record to the spill file and the aggregates."""
+        if self._file is None:
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+            # Anonymous file: removed when closed, or when the process ends
+            self._file = tempfile.TemporaryFile('w+', encoding='utf-8', prefix='network_timing_', dir=self.spill_dir)
+        self._file.write(json.dumps(record) + '\n')
+        host = self._hosts.get(record['host'])
+        if host is None:
+            host = self._hosts[record['host']] = HostTimings()
+        host.add(record)
+
+    def _complete(self, event: Dict):
+        if self._in_flight.pop(id(event), None) is not None:
+            self._add(self._finalize(event))
+
+    def _settle(self, before: float):
+        """Complete the requests in flight whose response is gone, or with no news since loop time `before`."""
+        for event in list(self._in_flight.values()):
+            response = event.get('_response')
+            last = max(event.get(key) or 0.0 for key in ('_start', '_headers', '_last_chunk'))
+            if (response is not None and response() is None) or last < before:
+                self._complete(event)
+
+    def flush(self):
+        """Complete every request still in flight (the crawl is over)."""
+        for event in list(self._in_flight.values()):
+            self._complete(event)
+
+    def records(self, batch: int = 5000) -> Iterator[List[Dict]]:
+        """Every record, in lists of at most `batch`, read back from the spill file."""
+        self.flush()
+        if self._file is None:
+            return
+        self._file.flush()
+        self._file.seek(0)
+        records = []
+        for line in self._file:
+            records.append(json.loads(line))
+            if len(records) >= batch:
+                yield records
+                records = []
+        # Back to the end: records added later are appended
+        self._file.seek(0, os.SEEK_END)
+        if records:
+            yield records
+
+    def add_records(self, records: Iterable[Dict]):
+        """Merge records of another collector (see records) into the reports of this one."""
+        for record in records:
+            self._add(record)
+
+    def summary(self) -> Dict:
+        """Aggregate per host: counts, bytes, retries, errors and p50/p95/p99 of each timing
+        (estimated from the sampled values past RESERVOIR_SIZE requests)."""
+        self.flush()
+        crawl_total = sum(host.wall_ms for host in self._hosts.values())
+
+        hosts = {}
+        for name, host in self._hosts.items():
+            entry = {
+                'requests': host.requests,
+                'retries': host.retries,
+                'errors': host.errors,
+                'status': dict(host.status),
+                'bytes': host.bytes,
+                'wall_ms': round(host.wall_ms, 2),
+            }
+            entry['wall_share'] = round(entry['wall_ms'] / crawl_total, 4) if crawl_total else 0.0
+            for field in TIMING_FIELDS:
+                values = sorted(host.values[field])
+                entry[field] = {f'p{q}': _percentile(values, q) for q in (50, 95, 99)}
+            hosts[name] = entry
+
+        return {
+            'requests': sum(entry['requests'] for entry in hosts.values()),
+            'hosts': dict(sorted(hosts.items(), key=lambda item: item[1]['wall_ms'], reverse=True)),
+        }
+
+    def write_report(self, output_dir: str = 'output', prefix: str = 'network_timing'):
+        """Write one JSONL line per request plus the aggregated per-host summary."""
+        os.makedirs(output_dir, exist_ok=True)
+        self.flush()
+        with open(os.path.join(output_dir, f'{prefix}.jsonl'), 'w', encoding='utf-8') as f:
+            if self._file is not None:
+                self._file.flush()
+                self._file.seek(0)
+                shutil.copyfileobj(self._file, f)
+                self._file.seek(0, os.SEEK_END)
+        with open(os.path.join(output_dir, f'{prefix}_summary.json'), 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def close(self):
+        """Drop the spill file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,108 @@
+"""Cross-run cache of the per-domain ads.txt and sellers.json probe results.
+
+`SSPScraper.check_ads_txt` and `check_sellers_json` try up to four URL
+variants per domain, and their results rarely change from one week to the
+next. The cache keeps each result in SQLite, keyed by probe kind and
+normalized domain, until an expiry drawn around the TTL: the jitter spreads
+the refreshes of domains first seen in the same run over several runs.
+Results of unreachable domains get the shorter `unreachable_ttl_days`.
+New results are kept in memory and written COMMIT_EVERY at a time in one
+short transaction, so the workers of a sharded crawl can share the file.
+
+    PROBE (KIND, DOMAIN) -> RESULT (JSON), CHECKED_AT, EXPIRES_AT
+"""
+import json
+import random
+import sqlite3
+import time
+from typing import Dict, Optional
+
+PROBE_CACHE = 'probe_cache.db'
+# Entries written between two commits
+COMMIT_EVERY = 200
+# Seconds to wait for another process's write to finish
+BUSY_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS PROBE (
+    KIND TEXT NOT NULL,
+    DOMAIN TEXT NOT NULL,
+    RESULT TEXT NOT NULL,
+    CHECKED_AT REAL NOT NULL,
+    EXPIRES_AT REAL NOT NULL,
+    PRIMARY KEY (KIND, DOMAIN)
+) WITHOUT ROWID;
+"""
+
+
+def clean_domain(domain: str) -> str:
+    """The domain the probes are run for: no scheme, no trailing slash."""
+    domain = domain.strip()
+    if domain.startswith('http://'):
+        domain = domain[7:]
+    elif domain.startswith('https://'):
+        domain = domain[8:]
+    return domain.rstrip('/')
+
+
+def normalize_domain(domain: str) -> str:
+    """Cache key of a domain."""
+    return clean_domain(domain).lower()
+
+
+class ProbeCache:
+    def __init__(self, path: str = PROBE_CACHE, ttl_days: float = 28, jitter: float = 0.25,
+                 unreachable_ttl_days: float = 3, refresh: bool = False):
+        """Expiries are drawn in ttl_days * [1 - jitter, 1 + jitter]; with refresh, cached
+        results are ignored (and replaced by the new probes)."""
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.jitter = jitter
+        self.unreachable_ttl = unreachable_ttl_days * 86400
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._pending: Dict[tuple, tuple] = {}
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self.conn.executescript(SCHEMA)
+
+    def get(self, kind: str, domain: str) -> Optional[Dict]:
+        """Cached result of a probe, None when it has to be run."""
+        key = (kind, normalize_domain(domain))
+        row = None
+        if not self.refresh:
+            pending = self._pending.get(key)
+            if pending is not None:
+                row = pending[2:3]
+            else:
+                row = self.conn.execute('SELECT RESULT FROM PROBE WHERE KIND=? AND DOMAIN=? AND EXPIRES_AT>?',
+                                        key + (time.time(),)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, kind: str, domain: str, result: Dict):
+        now = time.time()
+        ttl = self.unreachable_ttl if result.get('unreachable') else self.ttl
+        expires_at = now + ttl * random.uniform(1 - self.jitter, 1 + self.jitter)
+        key = (kind, normalize_domain(domain))
+        self._pending[key] = key + (json.dumps(result), now, expires_at)
+        if len(self._pending) >= COMMIT_EVERY:
+            self.commit()
+
+    def purge(self) -> int:
+        """Drop the expired entries; returns how many."""
+        deleted = self.conn.execute('DELETE FROM PROBE WHERE EXPIRES_AT<=?', (time.time(),)).rowcount
+        self.commit()
+        return deleted
+
+    def commit(self):
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO PROBE VALUES (?,?,?,?,?)', self._pending.values())
+        self._pending = {}
+
+    def close(self):
+        self.commit()
+        self.conn.close()
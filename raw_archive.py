@@ -0,0 +1,164 @@
+"""Content-addressed archive of the raw ads.txt and sellers.json bodies.
+
+Every body a crawler fetches is stored once, gzip-compressed, under the
+sha256 of its uncompressed bytes, and an SQLite index records what each URL
+returned on each crawl date (status, Content-Type, error, body hash):
+
+    archive/
+        index.db                      FETCH (URL, DATE) -> STATUS, CONTENT_TYPE, ERROR, SHA256, SIZE
+        objects/3f/3fa2...e1.gz       gzip of the body whose sha256 is 3fa2...e1
+
+A crawler opened with a replay date reads its documents back from the index
+instead of the network, so a past run can be parsed and analysed again:
+
+    python ssp_scraper.py --replay 2026-10-12
+    python raw_archive.py [--archive DIR] [DATE]    # list crawl dates, or the URLs of one
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import sqlite3
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+from email.message import Message
+from typing import Iterator, List, Optional
+
+ARCHIVE_DIR = 'archive'
+# Index rows written between two commits
+COMMIT_EVERY = 200
+# Seconds to wait for another process's write to finish
+BUSY_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS FETCH (
+    URL TEXT NOT NULL,
+    DATE TEXT NOT NULL,
+    FETCHED_AT TEXT NOT NULL,
+    STATUS INTEGER,
+    CONTENT_TYPE TEXT,
+    ERROR TEXT,
+    SHA256 TEXT,
+    SIZE INTEGER,
+    PRIMARY KEY (URL, DATE)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS FETCH_DATE ON FETCH (DATE);
+"""
+
+_FIELDS = 'url date fetched_at status content_type error sha256 size'
+
+
+class ArchivedFetch(namedtuple('ArchivedFetch', _FIELDS)):
+    """One index entry: what `url` returned on `date` (sha256 is None when there was no body)."""
+
+    __slots__ = ()
+
+    @property
+    def charset(self) -> Optional[str]:
+        if not self.content_type:
+            return None
+        message = Message()
+        message['content-type'] = self.content_type
+        return message.get_param('charset')
+
+
+class RawArchive:
+    def __init__(self, path: str = ARCHIVE_DIR, date: Optional[str] = None):
+        """Open (or create) the archive in `path`; new entries are filed under `date`, today by default."""
+        self.path = path
+        self.date = date or datetime.now().strftime('%Y-%m-%d')
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(path, 'index.db'), timeout=BUSY_TIMEOUT)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        # Index rows not written yet: kept in memory so that the write lock is only held by
+        # commit(), and several crawler processes can share the archive
+        self._pending: List[tuple] = []
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self.path, 'objects', sha256[:2], sha256 + '.gz')
+
+    def put_body(self, body: bytes) -> str:
+        """Store a body (once per content) and return its sha256; safe to call from worker threads."""
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = self._object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(gzip.compress(body, compresslevel=6, mtime=0))
+            os.replace(tmp_path, path)
+        return sha256
+
+    def record(self, url: str, status: Optional[int], body: Optional[bytes] = None,
+               content_type: Optional[str] = None, error: Optional[str] = None,
+               sha256: Optional[str] = None):
+        """Index what `url` returned today; the body is stored unless its sha256 is given.
+
+        Uses the index connection, so it has to be called from the thread that opened the archive.
+        """
+        if body is not None and sha256 is None:
+            sha256 = self.put_body(body)
+        self._pending.append((url, self.date, datetime.now().isoformat(timespec='seconds'), status,
+                              content_type, error, sha256, len(body) if body is not None else None))
+        if len(self._pending) >= COMMIT_EVERY:
+            self.commit()
+
+    def resolve_date(self, date: str) -> str:
+        """A crawl date of the archive, 'latest' standing for the most recent one."""
+        if date == 'latest':
+            row = self.conn.execute('SELECT MAX(DATE) FROM FETCH').fetchone()
+            if row[0] is None:
+                raise LookupError(f'{self.path} is empty')
+            return row[0]
+        return date
+
+    def lookup(self, url: str, date: Optional[str] = None) -> Optional[ArchivedFetch]:
+        self.commit()
+        row = self.conn.execute('SELECT * FROM FETCH WHERE URL=? AND DATE=?',
+                                (url, date or self.date)).fetchone()
+        return ArchivedFetch(*row) if row else None
+
+    def body(self, sha256: str) -> bytes:
+        with open(self._object_path(sha256), 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def fetch(self, url: str, date: Optional[str] = None) -> Optional[bytes]:
+        """Archived body of `url` on `date`, None when there was none."""
+        entry = self.lookup(url, date)
+        return self.body(entry.sha256) if entry and entry.sha256 else None
+
+    def dates(self) -> List[tuple]:
+        """(date, urls, bodies) of every crawl date."""
+        return self.conn.execute('SELECT DATE, COUNT(*), COUNT(SHA256) FROM FETCH '
+                                 'GROUP BY DATE ORDER BY DATE').fetchall()
+
+    def entries(self, date: str) -> Iterator[ArchivedFetch]:
+        for row in self.conn.execute('SELECT * FROM FETCH WHERE DATE=? ORDER BY URL', (date,)):
+            yield ArchivedFetch(*row)
+
+    def commit(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO FETCH VALUES (?,?,?,?,?,?,?,?)', self._pending)
+            self._pending = []
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List the crawl dates of the raw document archive')
+    parser.add_argument('date', nargs='?', help='list the URLs archived on this date (or latest)')
+    parser.add_argument('--archive', default=ARCHIVE_DIR, help='archive directory')
+    args = parser.parse_args()
+    archive = RawArchive(args.archive)
+    if args.date:
+        for entry in archive.entries(archive.resolve_date(args.date)):
+            print(f'{entry.status or "-":>4} {entry.size or 0:>10} {entry.sha256 or entry.error or "":<64} {entry.url}')
+    else:
+        for date, urls, bodies in archive.dates():
+            print(f'{date}  {urls} URLs, {bodies} bodies')
+    archive.close()
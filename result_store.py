@@ -0,0 +1,126 @@
+"""Result lists of a crawl, kept in bounded memory.
+
+`SSPScraper.results['sellers']` alone holds one dict per seller of every
+SSP, several GB on the full SSP list. A ResultStore gives each result kind a
+ResultTable that behaves like the list it replaces (append, extend, len,
+iteration) but keeps at most `buffer_rows` rows in memory: full buffers are
+pickled into an SQLite file as one chunk each, created on the first spill in
+`spill_dir` (the system temporary directory by default) and deleted by
+close(). Readers go through the rows chunk by chunk:
+
+    for rows in store['sellers'].chunks():      # lists of at most buffer_rows rows
+        ...
+    store['sellers'].rewrite(fn)                # replace every row by fn(row)
+"""
+import os
+import pickle
+import sqlite3
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# Rows of each table kept in memory before they are spilled
+BUFFER_ROWS = 50000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS CHUNK (
+    NAME TEXT NOT NULL,
+    SEQ INTEGER NOT NULL,
+    ROWS INTEGER NOT NULL,
+    DATA BLOB NOT NULL,
+    PRIMARY KEY (NAME, SEQ)
+);
+"""
+
+
+class ResultTable:
+    def __init__(self, store: 'ResultStore', name: str):
+        self.store = store
+        self.name = name
+        self.buffer: List = []
+        self.spilled = 0
+        self._chunks = 0
+
+    def append(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.store.buffer_rows:
+            self.spill()
+
+    def extend(self, rows: Iterable):
+        for row in rows:
+            self.append(row)
+
+    def spill(self):
+        """Move the buffered rows to disk."""
+        if not self.buffer:
+            return
+        self.store.conn.execute('INSERT INTO CHUNK VALUES (?,?,?,?)',
+                                (self.name, self._chunks, len(self.buffer),
+                                 pickle.dumps(self.buffer, pickle.HIGHEST_PROTOCOL)))
+        self._chunks += 1
+        self.spilled += len(self.buffer)
+        self.buffer = []
+
+    def chunks(self) -> Iterator[List]:
+        """The rows in insertion order, as lists: the spilled chunks, then the buffer."""
+        for seq in range(self._chunks):
+            data, = self.store.conn.execute('SELECT DATA FROM CHUNK WHERE NAME=? AND SEQ=?',
+                                            (self.name, seq)).fetchone()
+            yield pickle.loads(data)
+        if self.buffer:
+            yield self.buffer
+
+    def __iter__(self):
+        for rows in self.chunks():
+            yield from rows
+
+    def rewrite(self, fn: Callable):
+        """Replace every row by fn(row), one chunk in memory at a time."""
+        for seq in range(self._chunks):
+            data, = self.store.conn.execute('SELECT DATA FROM CHUNK WHERE NAME=? AND SEQ=?',
+                                            (self.name, seq)).fetchone()
+            rows = [fn(row) for row in pickle.loads(data)]
+            self.store.conn.execute('UPDATE CHUNK SET DATA=? WHERE NAME=? AND SEQ=?',
+                                    (pickle.dumps(rows, pickle.HIGHEST_PROTOCOL), self.name, seq))
+        self.buffer = [fn(row) for row in self.buffer]
+
+    def __len__(self):
+        return self.spilled + len(self.buffer)
+
+    def __bool__(self):
+        return len(self) > 0
+
+
+class ResultStore:
+    def __init__(self, buffer_rows: int = BUFFER_ROWS, spill_dir: Optional[str] = None):
+        self.buffer_rows = buffer_rows
+        self.spill_dir = spill_dir
+        self.tables: Dict[str, ResultTable] = {}
+        self.path = None
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+            fd, self.path = tempfile.mkstemp(prefix='results_', suffix='.db', dir=self.spill_dir)
+            os.close(fd)
+            # Scratch data: no journal, no fsync
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=OFF')
+            self._conn.execute('PRAGMA synchronous=OFF')
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def __getitem__(self, name: str) -> ResultTable:
+        table = self.tables.get(name)
+        if table is None:
+            table = self.tables[name] = ResultTable(self, name)
+        return table
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            os.remove(self.path)
+        self.tables = {}
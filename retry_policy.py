@@ -0,0 +1,246 @@
+"""Retry and timeout policy shared by the crawlers.
+
+- Failures are classified (`classify`): timeouts, dropped connections and
+  overloaded servers (408, 425, 429, 5xx) are retried; unknown hosts,
+  refused connections, TLS failures and other HTTP statuses are not.
+- Retries wait an exponential backoff with full jitter (or the server's
+  Retry-After), so hosts that failed together are not retried together.
+- Every request gets a total time budget, and the URL variants of one domain
+  share a domain budget: a retry is only made if it fits in what is left.
+- Connect and read timeouts follow the latency observed for each host (time
+  to the response headers, so independent of the file size): a multiple of
+  its high percentile once enough samples are known, of the run-wide one
+  before that, and the fixed ceiling only until the run has samples at all.
+  Slow hosts no longer set the tail latency of a run.
+
+The policy itself does no I/O: `SSPScraper._download` drives it from the
+event loop and `run_sync` from the blocking crawlers of Sources/.
+"""
+import asyncio
+import math
+import random
+import socket
+import ssl
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional
+
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+RETRYABLE_KINDS = frozenset({'timeout', 'connection', 'http'})
+
+
+class Deadline:
+    """Point in time after which no more attempts are made (never, for a budget of None)."""
+
+    def __init__(self, budget: Optional[float] = None, parent: Optional['Deadline'] = None):
+        expires = time.monotonic() + budget if budget is not None else math.inf
+        self.expires = min(expires, parent.expires) if parent is not None else expires
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+
+def _causes(error: BaseException):
+    """The error and the errors it wraps (exception chaining, aiohttp os_error, urllib reason...)."""
+    seen = set()
+    stack = [error]
+    while stack:
+        e = stack.pop()
+        if not isinstance(e, BaseException) or id(e) in seen or len(seen) > 20:
+            continue
+        seen.add(id(e))
+        yield e
+        stack.extend([e.__cause__, e.__context__, getattr(e, 'os_error', None), getattr(e, 'reason', None)])
+        stack.extend(arg for arg in e.args if isinstance(arg, BaseException))
+
+
+def _named(e: BaseException, *words) -> bool:
+    return any(word in cls.__name__ for cls in type(e).__mro__ for word in words)
+
+
+def classify(error: BaseException) -> str:
+    """Kind of a fetch failure: 'dns', 'tls', 'refused', 'timeout', 'http', 'connection' or 'fatal'.
+
+    Only 'timeout', 'connection' and 'http' with a RETRYABLE_STATUS are worth retrying (see retryable).
+    Works on aiohttp, requests and urllib errors without importing them.
+    """
+    kinds = set()
+    for e in _causes(error):
+        if isinstance(e, socket.gaierror) or _named(e, 'DNS', 'NameResolution'):
+            kinds.add('dns')
+        elif isinstance(e, (ssl.SSLError, ssl.CertificateError)) or _named(e, 'SSL', 'Certificate'):
+            kinds.add('tls')
+        elif isinstance(e, ConnectionRefusedError):
+            kinds.add('refused')
+        elif isinstance(e, (asyncio.TimeoutError, TimeoutError)) or _named(e, 'Timeout'):
+            kinds.add('timeout')
+        elif isinstance(getattr(e, 'code', None), int) and _named(e, 'HTTPError'):
+            kinds.add('http')
+        elif isinstance(e, OSError) or _named(e, 'Connection', 'Disconnected', 'Payload'):
+            kinds.add('connection')
+    for kind in ('dns', 'tls', 'refused', 'timeout', 'http', 'connection'):
+        if kind in kinds:
+            return kind
+    return 'fatal'
+
+
+def retryable(error: BaseException) -> bool:
+    kind = classify(error)
+    if kind == 'http':
+        return any(getattr(e, 'code', None) in RETRYABLE_STATUS for e in _causes(error))
+    return kind in RETRYABLE_KINDS
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Delay asked by a Retry-After header given in seconds (HTTP dates are ignored)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    def __init__(self, attempts: int = 3, base_delay: float = 0.5, max_delay: float = 10.0,
+                 timeout: float = 30.0, min_timeout: float = 2.0, timeout_factor: float = 4.0,
+                 percentile: float = 95, min_samples: int = 5, run_min_samples: int = 20,
+                 request_budget: Optional[float] = 60.0, domain_budget: Optional[float] = 120.0,
+                 window: int = 50):
+        """At most `attempts` tries per request, within `request_budget` seconds (and
+        `domain_budget` for all the URLs of a domain); connect/read timeouts are
+        `timeout_factor` times the host's `percentile` latency, within [min_timeout, timeout]."""
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.timeout_factor = timeout_factor
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.run_min_samples = run_min_samples
+        self.request_budget = request_budget
+        self.domain_budget = domain_budget
+        self.window = window
+        self._hosts: Dict[str, deque] = {}
+        self._run = deque(maxlen=window * 20)
+
+    def request_deadline(self, parent: Optional[Deadline] = None) -> Deadline:
+        return Deadline(self.request_budget, parent)
+
+    def domain_deadline(self) -> Deadline:
+        return Deadline(self.domain_budget)
+
+    def observe(self, host: str, seconds: float):
+        """Record the time `host` took to answer (to the response headers)."""
+        samples = self._hosts.get(host)
+        if samples is None:
+            samples = self._hosts[host] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self._run.append(seconds)
+
+    def _quantile(self, samples) -> float:
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(math.ceil(self.percentile / 100 * len(ordered))) - 1)
+        return ordered[max(0, index)]
+
+    def latency(self, host: str) -> Optional[float]:
+        """High percentile latency of `host`, or of the run while the host has too few samples."""
+        samples = self._hosts.get(host)
+        if samples is not None and len(samples) >= self.min_samples:
+            return self._quantile(samples)
+        if len(self._run) >= self.run_min_samples:
+            return self._quantile(self._run)
+        return None
+
+    def timeouts(self, host: str, deadline: Optional[Deadline] = None, ceiling: Optional[float] = None):
+        """(total, idle) timeouts of the next attempt on `host`: the total is what is left of
+        the budget (at most `ceiling`), idle bounds the connection and each read."""
+        ceiling = ceiling if ceiling is not None else self.timeout
+        total = min(ceiling, deadline.remaining()) if deadline is not None else ceiling
+        latency = self.latency(host)
+        idle = ceiling if latency is None else min(ceiling, max(self.min_timeout, latency * self.timeout_factor))
+        return total, min(idle, total)
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, base_delay * 2**attempt], capped by max_delay."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def retry_delay(self, attempt: int, deadline: Optional[Deadline] = None,
+                    retry_after: Optional[float] = None) -> Optional[float]:
+        """Wait before try number `attempt` + 1 (attempt counts the failed ones), or None when
+        the attempts are used up or the retry would not fit in the deadline."""
+        if attempt >= self.attempts:
+            return None
+        delay = retry_after if retry_after is not None else self.backoff(attempt)
+        if deadline is not None and deadline.remaining() < delay + self.min_timeout:
+            return None
+        return delay
+
+
+def read_within(chunks: Iterable[bytes], deadline: Deadline) -> bytes:
+    """Join the body `chunks`, raising TimeoutError once `deadline` has passed.
+
+    Checked after each chunk, each read being bounded by the idle timeout: chunks should be
+    read as they arrive (read1), a read of a fixed size waits for all of it.
+    """
+    body = []
+    for chunk in chunks:
+        body.append(chunk)
+        if deadline.expired:
+            raise TimeoutError("body not read within the total timeout")
+    return b''.join(body)
+
+
+def run_sync(policy: RetryPolicy, host: str, fetch: Callable, deadline: Optional[Deadline] = None,
+             ceiling: Optional[float] = None, read: Optional[Callable] = None):
+    """Call fetch(timeout) with the retries of `policy`, blocking; returns its result or raises
+    its last error. `timeout` is the idle timeout to give the HTTP library.
+
+    With `read`, fetch returns as soon as the response headers are in (requests with
+    stream=True, urlopen) and read(result, deadline) reads the body before `deadline`
+    (read_within), the attempt's total timeout; run_sync then returns what read returns.
+    The latency samples stop at the headers. Without `read`, only the idle timeout
+    bounds the attempt, and the samples include the body.
+
+    A result with a retryable `status_code` (requests) is retried as well, and returned
+    as is (body not read) when no retry is left.
+    """
+    deadline = policy.request_deadline(deadline)
+    attempt = 0
+    while True:
+        total, idle = policy.timeouts(host, deadline, ceiling)
+        if total <= 0:
+            raise TimeoutError("time budget exhausted for %s" % host)
+        started = time.monotonic()
+        attempt_deadline = Deadline(total)
+        retry_after = None
+        observed = False
+        try:
+            result = fetch(idle)
+            policy.observe(host, time.monotonic() - started)
+            observed = True
+            status = getattr(result, 'status_code', None)
+            if read is not None and status not in RETRYABLE_STATUS:
+                result = read(result, attempt_deadline)
+        except Exception as err:
+            if not observed and classify(err) == 'timeout':
+                policy.observe(host, time.monotonic() - started)
+            attempt += 1
+            if getattr(err, 'code', None) == 429:
+                retry_after = retry_after_seconds(err.headers.get('Retry-After') if getattr(err, 'headers', None) else None)
+            delay = policy.retry_delay(attempt, deadline, retry_after) if retryable(err) else None
+            if delay is None:
+                raise
+        else:
+            if status not in RETRYABLE_STATUS:
+                return result
+            attempt += 1
+            if status == 429:
+                retry_after = retry_after_seconds(result.headers.get('Retry-After'))
+            delay = policy.retry_delay(attempt, deadline, retry_after)
+            if delay is None:
+                return result
+        time.sleep(delay)
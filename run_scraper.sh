@@ -6,11 +6,18 @@ cd "$(dirname "$0")"
 # Activate virtual environment if it exists (uncomment if you use one)
 # source venv/bin/activate
 
-# Install/update requirements
-pip install -r requirements.txt
+# Install/update requirements, only when requirements.txt changed since the last install
+if [ ! -f .requirements.installed ] || [ requirements.txt -nt .requirements.installed ]; then
+    pip install -r requirements.txt && touch .requirements.installed
+fi
 
-# Run the scraper
-python scraper.py
+# Run the domain checks on the domain list (one domain per line), or on the example domains
+DOMAINS_FILE="${DOMAINS_FILE:-domains.txt}"
+if [ -f "$DOMAINS_FILE" ]; then
+    python cli.py check "$DOMAINS_FILE" --concurrency "${CONCURRENCY:-50}"
+else
+    python cli.py check
+fi
 
 # Log the completion
-echo "Scraper completed at $(date)" >> scraper.log 
\ No newline at end of file
+echo "Scraper completed at $(date)" >> scraper.log
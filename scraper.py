@@ -1,25 +1,53 @@
 import aiohttp
 import asyncio
 import json
-import pandas as pd
-from typing import List, Dict, Optional
+import os
+from typing import Iterable, Iterator, List, Dict, Optional
 from urllib.parse import urlparse
 import logging
+import time
+from network_timing import NetworkTimingCollector, TimingTCPConnector
+from document_encoding import decode_ads_txt, load_json
+from raw_archive import ARCHIVE_DIR, RawArchive
+from csv_sink import OUTPUT_FORMATS, open_sink
+from retry_policy import RETRYABLE_STATUS, RetryPolicy, retry_after_seconds, retryable
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Domains processed at once by process_domains
+DOMAIN_CONCURRENCY = 50
+# Output files and their columns, in the order of the parsed rows
+OUTPUT_FILES = {'ads_txt': 'ads_txt_results.csv', 'sellers_json': 'sellers_json_results.csv'}
+OUTPUT_FIELDS = {
+    'ads_txt': ['domain', 'ad_system_domain', 'publisher_id', 'account_type', 'certification_authority_id'],
+    'sellers_json': ['domain', 'seller_id', 'name', 'seller_type', 'is_confidential', 'is_passthrough'],
+}
+
 class AdTechScraper:
-    def __init__(self):
+    def __init__(self, archive: Optional[RawArchive] = None, replay: Optional[str] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
+        """Fetched bodies are stored in `archive`; with a `replay` date (or 'latest') they are
+        read back from it instead of the network. Retries and timeouts follow `retry_policy`."""
+        if replay and archive is None:
+            raise ValueError("replay needs an archive")
+        self.archive = archive
+        self.replay = archive.resolve_date(replay) if replay else None
+        self.retry_policy = retry_policy or RetryPolicy(timeout=10)
         self.session = None
         self.results = {
             'ads_txt': [],
             'sellers_json': []
         }
+        self.timing = NetworkTimingCollector()
+        # Rows written by process_domains, and domains it gave up on
+        self.rows_written = 0
+        self.failed_domains = 0
 
     async def init_session(self):
         if not self.session:
-            self.session = aiohttp.ClientSession()
+            self.session = aiohttp.ClientSession(connector=TimingTCPConnector(),
+                                                 trace_configs=[self.timing.trace_config()])
 
     async def close_session(self):
         if self.session:
@@ -27,9 +55,12 @@ class AdTechScraper:
             self.session = None
 
     async def fetch_file(self, domain: str, file_type: str) -> Optional[str]:
-        """Fetch ads.txt or sellers.json file from a domain."""
-        await self.init_session()
-        
+        """Fetch ads.txt or sellers.json file from a domain as text."""
+        body = await self.fetch_bytes(domain, file_type)
+        return decode_ads_txt(body) if body is not None else None
+
+    async def fetch_bytes(self, domain: str, file_type: str) -> Optional[bytes]:
+        """Fetch the raw ads.txt or sellers.json body from a domain."""
         # Normalize domain
         if not domain.startswith(('http://', 'https://')):
             domain = f'https://{domain}'
@@ -46,17 +77,60 @@ class AdTechScraper:
                 f'{domain}/.well-known/sellers.json'
             ]
 
+        if self.replay:
+            # The index is only read from this thread, the gzip body in a worker one
+            for url in urls:
+                entry = self.archive.lookup(url, self.replay)
+                if entry is not None and entry.sha256 is not None:
+                    return await asyncio.to_thread(self.archive.body, entry.sha256)
+            return None
+
+        await self.init_session()
+        policy = self.retry_policy
+        host = urlparse(urls[0]).hostname or ''
+        domain_deadline = policy.domain_deadline()
         for url in urls:
-            try:
-                async with self.session.get(url, timeout=10) as response:
-                    if response.status == 200:
-                        return await response.text()
-            except Exception as e:
-                logger.warning(f"Error fetching {url}: {str(e)}")
-                continue
+            deadline = policy.request_deadline(domain_deadline)
+            attempt = 0
+            while True:
+                total, idle = policy.timeouts(host, deadline)
+                if total <= 0:
+                    break
+                retry_after = None
+                started = time.monotonic()
+                try:
+                    async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=total, sock_connect=idle,
+                                                                                   sock_read=idle)) as response:
+                        policy.observe(host, time.monotonic() - started)
+                        if response.status == 200:
+                            body = await response.read()
+                            await self._archive(url, 200, body, response.headers.get('Content-Type'))
+                            return body
+                        await self._archive(url, response.status)
+                        if response.status not in RETRYABLE_STATUS:
+                            break
+                        if response.status == 429:
+                            retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                except Exception as e:
+                    logger.warning(f"Error fetching {url}: {str(e)}")
+                    await self._archive(url, None, error=str(e))
+                    if not retryable(e):
+                        break
+                attempt += 1
+                delay = policy.retry_delay(attempt, deadline, retry_after)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
         
         return None
 
+    async def _archive(self, url: str, status: Optional[int], body: Optional[bytes] = None,
+                       content_type: Optional[str] = None, error: Optional[str] = None):
+        if self.archive is None:
+            return
+        sha256 = await asyncio.to_thread(self.archive.put_body, body) if body is not None else None
+        self.archive.record(url, status, body, content_type, error, sha256)
+
     def parse_ads_txt(self, content: str, domain: str) -> List[Dict]:
         """Parse ads.txt content into structured data."""
         if not content:
@@ -81,17 +155,20 @@ class AdTechScraper:
 
         return entries
 
-    def parse_sellers_json(self, content: str, domain: str) -> List[Dict]:
-        """Parse sellers.json content into structured data."""
+    def parse_sellers_json(self, content, domain: str) -> List[Dict]:
+        """Parse sellers.json content (raw bytes or str) into structured data."""
         if not content:
             return []
 
         try:
-            data = json.loads(content)
+            data = load_json(content)
             entries = []
             
-            if 'sellers' in data:
+            # JSON but not an object (null, a list...): no sellers
+            if isinstance(data, dict) and isinstance(data.get('sellers'), list):
                 for seller in data['sellers']:
+                    if not isinstance(seller, dict):
+                        continue
                     entry = {
                         'domain': domain,
                         'seller_id': seller.get('seller_id'),
@@ -104,51 +181,131 @@ class AdTechScraper:
                     entries.append(entry)
             
             return entries
-        except json.JSONDecodeError:
+        except ValueError:
             logger.error(f"Error parsing sellers.json for {domain}")
             return []
 
+    async def fetch_domain(self, domain: str):
+        """(ads.txt rows, sellers.json rows) of a domain, both files fetched at once."""
+        ads_txt_body, sellers_json_content = await asyncio.gather(
+            self.fetch_bytes(domain, 'ads_txt'), self.fetch_bytes(domain, 'sellers_json'))
+        ads_txt_content = decode_ads_txt(ads_txt_body)
+        # sellers.json is handed to the JSON decoder as bytes
+        return (self.parse_ads_txt(ads_txt_content, domain) if ads_txt_content else [],
+                self.parse_sellers_json(sellers_json_content, domain) if sellers_json_content else [])
+
     async def process_domain(self, domain: str):
         """Process both ads.txt and sellers.json for a domain."""
-        # Fetch and process ads.txt
-        ads_txt_content = await self.fetch_file(domain, 'ads_txt')
-        if ads_txt_content:
-            self.results['ads_txt'].extend(self.parse_ads_txt(ads_txt_content, domain))
+        ads_txt_rows, sellers_json_rows = await self.fetch_domain(domain)
+        self.results['ads_txt'].extend(ads_txt_rows)
+        self.results['sellers_json'].extend(sellers_json_rows)
 
-        # Fetch and process sellers.json
-        sellers_json_content = await self.fetch_file(domain, 'sellers_json')
-        if sellers_json_content:
-            self.results['sellers_json'].extend(self.parse_sellers_json(sellers_json_content, domain))
+    async def process_domains(self, domains: Iterable[str], concurrency: int = DOMAIN_CONCURRENCY,
+                              output_dir: Optional[str] = None, output_format: str = 'csv') -> int:
+        """Process `domains` (any iterable, read as it goes), `concurrency` at a time.
+
+        With `output_dir`, rows are written to its CSV (or `output_format`) files as each domain completes
+        (nothing is kept in self.results, save_results is not needed); otherwise they
+        are added to self.results. A domain that raises is logged and skipped (counted in
+        self.failed_domains). Returns the number of domains processed.
+        """
+        sinks = {}
+        if output_dir:
+            sinks = {kind: open_sink(os.path.join(output_dir, OUTPUT_FILES[kind]), output_format, OUTPUT_FIELDS[kind])
+                     for kind in OUTPUT_FILES}
+        targets = {kind: sinks.get(kind, self.results[kind]) for kind in OUTPUT_FILES}
+        pending = iter(domains)
+        done = 0
+
+        async def work():
+            nonlocal done
+            # The workers share the iterator: each takes the next domain when it is free
+            for domain in pending:
+                try:
+                    ads_txt_rows, sellers_json_rows = await self.fetch_domain(domain)
+                except Exception as e:
+                    logger.error(f"Error processing domain {domain}: {str(e)}")
+                    self.failed_domains += 1
+                    continue
+                targets['ads_txt'].extend(ads_txt_rows)
+                targets['sellers_json'].extend(sellers_json_rows)
+                self.rows_written += len(ads_txt_rows) + len(sellers_json_rows)
+                done += 1
+                if done % 1000 == 0:
+                    logger.info(f"{done} domains processed")
+
+        await self.init_session()
+        workers = [asyncio.create_task(work()) for _ in range(concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            for sink in sinks.values():
+                sink.close()
+        if output_dir:
+            self.timing.write_report(output_dir)
+        return done
 
     def save_results(self, output_dir: str = 'output'):
         """Save results to CSV files."""
-        import os
+        import pandas as pd
         os.makedirs(output_dir, exist_ok=True)
 
         if self.results['ads_txt']:
             df_ads = pd.DataFrame(self.results['ads_txt'])
-            df_ads.to_csv(f'{output_dir}/ads_txt_results.csv', index=False)
+            df_ads.to_csv(f"{output_dir}/{OUTPUT_FILES['ads_txt']}", index=False)
 
         if self.results['sellers_json']:
             df_sellers = pd.DataFrame(self.results['sellers_json'])
-            df_sellers.to_csv(f'{output_dir}/sellers_json_results.csv', index=False)
+            df_sellers.to_csv(f"{output_dir}/{OUTPUT_FILES['sellers_json']}", index=False)
+
+        self.timing.write_report(output_dir)
 
-async def main():
-    # Example usage
-    scraper = AdTechScraper()
-    domains = [
-        'example.com',
-        'publisher1.com',
-        'publisher2.com'
-    ]
+def read_domains(path: str) -> Iterator[str]:
+    """Domains of a file, one per line ('#' starts a comment), read lazily."""
+    with open(path) as f:
+        for line in f:
+            domain = line.split('#', 1)[0].strip()
+            if domain:
+                yield domain
+
+async def main(domains_file: Optional[str] = None, concurrency: int = DOMAIN_CONCURRENCY,
+               output_dir: str = 'output', output_format: str = 'csv',
+               archive_dir: Optional[str] = None, replay: Optional[str] = None):
+    """Fetched files are kept in the raw archive `archive_dir` (none by default);
+    `replay` reads the files archived on that date (in ARCHIVE_DIR unless given)."""
+    if replay and not archive_dir:
+        archive_dir = ARCHIVE_DIR
+    archive = RawArchive(archive_dir) if archive_dir else None
+    scraper = AdTechScraper(archive=archive, replay=replay)
+    if domains_file:
+        domains = read_domains(domains_file)
+    else:
+        # Example usage
+        domains = [
+            'example.com',
+            'publisher1.com',
+            'publisher2.com'
+        ]
 
     try:
-        for domain in domains:
-            await scraper.process_domain(domain)
+        count = await scraper.process_domains(domains, concurrency, output_dir, output_format)
     finally:
         await scraper.close_session()
-
-    scraper.save_results()
+        if archive is not None:
+            archive.close()
+    logger.info(f"{count} domains processed ({scraper.failed_domains} failed), results in {output_dir}/")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Fetch ads.txt and sellers.json of a list of domains")
+    parser.add_argument("domains", nargs="?", help="file of domains, one per line (default: examples)")
+    parser.add_argument("--concurrency", type=int, default=DOMAIN_CONCURRENCY, help="domains processed at once")
+    parser.add_argument("--output", default="output", help="directory of the outputs")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv", help="format of the outputs")
+    parser.add_argument("--archive", help="raw document archive directory (default: no archive)")
+    parser.add_argument("--replay", metavar="DATE",
+                        help=f"read the files archived on DATE (or latest) instead of fetching them, from --archive or {ARCHIVE_DIR}")
+    args = parser.parse_args()
+    asyncio.run(main(args.domains, args.concurrency, args.output, args.format, args.archive, args.replay))
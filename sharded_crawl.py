@@ -0,0 +1,506 @@
+"""Sharded crawl: the weekly SSP crawl split over several worker processes.
+
+One SSPScraper event loop parses on one core and drives one network stack.
+Here a coordinator puts the work in a queue file (SQLite) and worker
+processes, each with its own event loop, session and SSPScraper, take it
+from there. Workers on other machines join by opening the same file on a
+shared filesystem (one with working file locks). Every item gets a shard
+from a hash of its key (sellers.json URL or domain): a worker takes the
+items of its shard first, then those of the other shards once its own are
+done. A claimed item goes back to the queue when its lease expires, so the
+items of a worker that stopped are taken over by the others.
+
+    ITEM (ID) -> STAGE, SHARD, PAYLOAD, STATUS, WORKER, LEASED_UNTIL, ATTEMPTS, ERROR, RESULT
+    WORKER (NAME) -> SHARD, ITEMS, FAILED, REQUESTS
+    TIMING (WORKER, SEQ) -> RECORDS
+    META (KEY) -> VALUE
+
+The stages are those of ssp_scraper.main: the 'ssp' items download and
+parse the sellers.json files; the coordinator merges their rows, applies
+the majority seller_type pass and queues the domains, by batches, as
+'ads_txt' and 'sellers_json' items. Their results, and the failed requests
+and network timings of the workers, are merged into the usual output files.
+
+    python sharded_crawl.py crawl --workers 4 [crawl options of ssp_scraper.py]
+    python sharded_crawl.py worker --queue /shared/crawl_queue.db --shard 2
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import sqlite3
+import time
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from host_health import HOST_HEALTH, HostHealth
+from probe_cache import PROBE_CACHE, ProbeCache, normalize_domain
+from raw_archive import ARCHIVE_DIR, RawArchive
+from result_store import BUFFER_ROWS, ResultStore
+from ssp_scraper import (CONCURRENCY, ROW_BATCH_SIZE, SSPScraper, add_crawl_arguments, parse_sellers_rows,
+                         process_domains_batch, upload_results)
+
+logger = logging.getLogger(__name__)
+
+CRAWL_QUEUE = 'crawl_queue.db'
+# Domains per queue item
+DOMAIN_BATCH = 500
+# Items a worker processes at once (their requests share its concurrency)
+ITEM_SLOTS = 4
+# Seconds a claimed item stays with its worker without news; renewed while it works on it
+LEASE_SECONDS = 600
+# Claims of an item before it is given up
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 0.5
+# Seconds to wait for another process's write to finish
+BUSY_TIMEOUT = 60
+# Seconds the coordinator waits for the workers' reports at the end of the run
+REPORT_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ITEM (
+    ID INTEGER PRIMARY KEY,
+    STAGE TEXT NOT NULL,
+    SHARD INTEGER NOT NULL,
+    PAYLOAD BLOB NOT NULL,
+    STATUS TEXT NOT NULL,
+    WORKER TEXT,
+    LEASED_UNTIL REAL,
+    ATTEMPTS INTEGER NOT NULL DEFAULT 0,
+    ERROR TEXT,
+    RESULT BLOB
+);
+CREATE INDEX IF NOT EXISTS ITEM_STATUS ON ITEM (STATUS, SHARD);
+CREATE TABLE IF NOT EXISTS WORKER (
+    NAME TEXT PRIMARY KEY,
+    SHARD INTEGER,
+    ITEMS INTEGER NOT NULL,
+    FAILED BLOB NOT NULL,
+    REQUESTS INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS TIMING (
+    WORKER TEXT NOT NULL,
+    SEQ INTEGER NOT NULL,
+    RECORDS BLOB NOT NULL,
+    PRIMARY KEY (WORKER, SEQ)
+);
+CREATE TABLE IF NOT EXISTS META (
+    KEY TEXT PRIMARY KEY,
+    VALUE TEXT NOT NULL
+);
+"""
+
+
+def shard_of(key: str, shards: int) -> int:
+    """Shard of a sellers.json URL or a domain: the same one on every machine and run."""
+    return zlib.crc32(key.encode('utf-8')) % shards
+
+
+def _dump(value) -> bytes:
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+class WorkQueue:
+    def __init__(self, path: str = CRAWL_QUEUE):
+        self.path = path
+        # Autocommit: claims take their own write transaction (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+
+    def reset(self, config: Dict):
+        """Start a new run with `config` (the crawl options the workers follow)."""
+        with self._transaction():
+            for table in ('ITEM', 'WORKER', 'TIMING', 'META'):
+                self.conn.execute(f'DELETE FROM {table}')
+            self.conn.executemany('INSERT INTO META VALUES (?,?)',
+                                  [('config', json.dumps(config)), ('closed', '0')])
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute('SELECT VALUE FROM META WHERE KEY=?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def config(self) -> Optional[Dict]:
+        value = self._meta('config')
+        return json.loads(value) if value else None
+
+    @property
+    def closed(self) -> bool:
+        return self._meta('closed') == '1'
+
+    def close_run(self):
+        """No more items will come: idle workers report and exit."""
+        self.conn.execute("UPDATE META SET VALUE='1' WHERE KEY='closed'")
+
+    def add(self, stage: str, items: Iterable[tuple]):
+        """Queue (shard, payload) items of `stage`."""
+        with self._transaction():
+            self.conn.executemany("INSERT INTO ITEM (STAGE, SHARD, PAYLOAD, STATUS) VALUES (?,?,?,'pending')",
+                                  ((stage, shard, _dump(payload)) for shard, payload in items))
+
+    def claim(self, worker: str, shard: Optional[int] = None) -> Optional[tuple]:
+        """(id, stage, payload) of the next item for `worker`, those of `shard` first; None when there is none."""
+        now = time.time()
+        with self._transaction():
+            self.conn.execute("UPDATE ITEM SET STATUS='failed', ERROR='lease expired' "
+                              "WHERE STATUS='leased' AND LEASED_UNTIL<? AND ATTEMPTS>=?", (now, MAX_ATTEMPTS))
+            row = self.conn.execute(
+                "SELECT ID, STAGE, PAYLOAD FROM ITEM "
+                "WHERE STATUS='pending' OR (STATUS='leased' AND LEASED_UNTIL<?) "
+                "ORDER BY SHARD<>?, ID LIMIT 1", (now, -1 if shard is None else shard)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE ITEM SET STATUS='leased', WORKER=?, LEASED_UNTIL=?, ATTEMPTS=ATTEMPTS+1 "
+                              "WHERE ID=?", (worker, now + LEASE_SECONDS, row[0]))
+        return row[0], row[1], pickle.loads(row[2])
+
+    def renew(self, worker: str, ids: Iterable[int]):
+        """Extend the leases of the items `worker` is still working on."""
+        with self._transaction():
+            self.conn.executemany("UPDATE ITEM SET LEASED_UNTIL=? WHERE ID=? AND WORKER=? AND STATUS='leased'",
+                                  ((time.time() + LEASE_SECONDS, item_id, worker) for item_id in ids))
+
+    def complete(self, item_id: int, result):
+        self.conn.execute("UPDATE ITEM SET STATUS='done', RESULT=?, ERROR=NULL WHERE ID=? AND STATUS<>'done'",
+                          (_dump(result), item_id))
+
+    def release(self, item_id: int, error: str):
+        """Give an item back after an error; it is failed once its attempts are used up."""
+        self.conn.execute("UPDATE ITEM SET STATUS=CASE WHEN ATTEMPTS>=? THEN 'failed' ELSE 'pending' END, "
+                          "ERROR=? WHERE ID=? AND STATUS='leased'", (MAX_ATTEMPTS, error, item_id))
+
+    def counts(self, stages: Iterable[str]) -> Counter:
+        """Items of `stages` by status."""
+        stages = list(stages)
+        return Counter(dict(self.conn.execute(
+            f"SELECT STATUS, COUNT(*) FROM ITEM WHERE STAGE IN ({','.join('?' * len(stages))}) GROUP BY STATUS",
+            stages).fetchall()))
+
+    def results(self, stage: str) -> Iterator[tuple]:
+        """(payload, result) of the done items of `stage`, in the order they were queued."""
+        for payload, result in self.conn.execute(
+                "SELECT PAYLOAD, RESULT FROM ITEM WHERE STAGE=? AND STATUS='done' ORDER BY ID", (stage,)):
+            yield pickle.loads(payload), pickle.loads(result)
+
+    def failures(self, stage: str) -> List[tuple]:
+        """(payload, error) of the failed items of `stage`."""
+        return [(pickle.loads(payload), error) for payload, error in self.conn.execute(
+            "SELECT PAYLOAD, ERROR FROM ITEM WHERE STAGE=? AND STATUS='failed' ORDER BY ID", (stage,))]
+
+    def report(self, worker: str, shard: Optional[int], items: int, failed: List[str],
+               timing: Iterable[List[Dict]]):
+        """What a worker leaves for the merge when it exits: its failed requests and network
+        timings, given as lists of records and written one list per transaction."""
+        self.conn.execute('DELETE FROM TIMING WHERE WORKER=?', (worker,))
+        requests = 0
+        for seq, records in enumerate(timing):
+            self.conn.execute('INSERT INTO TIMING VALUES (?,?,?)', (worker, seq, _dump(records)))
+            requests += len(records)
+        # Written last: the coordinator takes a WORKER row as a complete report
+        self.conn.execute('INSERT OR REPLACE INTO WORKER VALUES (?,?,?,?,?)',
+                          (worker, shard, items, _dump(failed), requests))
+
+    def reports(self) -> Iterator[tuple]:
+        """(worker, shard, items, failed requests, number of timing records) of the workers that reported."""
+        for name, shard, items, failed, requests in self.conn.execute('SELECT * FROM WORKER ORDER BY NAME'):
+            yield name, shard, items, pickle.loads(failed), requests
+
+    def timing(self, worker: str) -> Iterator[List[Dict]]:
+        """Network timing records of a worker that reported, one list at a time."""
+        for records, in self.conn.execute('SELECT RECORDS FROM TIMING WHERE WORKER=? ORDER BY SEQ', (worker,)):
+            yield pickle.loads(records)
+
+    def unreported(self) -> List[str]:
+        """Workers that took items but did not report yet."""
+        return [name for name, in self.conn.execute(
+            'SELECT DISTINCT WORKER FROM ITEM WHERE WORKER IS NOT NULL AND WORKER NOT IN (SELECT NAME FROM WORKER)')]
+
+    def close(self):
+        self.conn.close()
+
+
+async def fetch_sellers(scraper: SSPScraper, payload) -> Optional[List[tuple]]:
+    """Compact rows (parse_sellers_rows) of an SSP's sellers.json, None when it could not be had."""
+    ssp_name, source_url = payload
+    content = await scraper.fetch_bytes(source_url)
+    if not content:
+        return None
+    rows = parse_sellers_rows(content)
+    if rows is None:
+        logger.error(f"Error parsing sellers.json for {ssp_name}")
+    return rows
+
+
+async def check_ads_txt(scraper: SSPScraper, domains: List[str]) -> List[Dict]:
+    return await process_domains_batch(scraper, domains, scraper.check_ads_txt, "Processing Direct Media",
+                                       workers=scraper.concurrency, show_progress=False)
+
+
+async def check_sellers_json(scraper: SSPScraper, domains: List[str]) -> List[Dict]:
+    return await process_domains_batch(scraper, domains, scraper.check_sellers_json, "Processing Intermediaries",
+                                       workers=scraper.concurrency, show_progress=False)
+
+
+PROCESS = {'ssp': fetch_sellers, 'ads_txt': check_ads_txt, 'sellers_json': check_sellers_json}
+
+
+async def work(queue_path: str = CRAWL_QUEUE, shard: Optional[int] = None, name: Optional[str] = None,
+               concurrency: Optional[int] = None) -> int:
+    """Process items of the queue at `queue_path` until the run is closed; returns how many.
+
+    Items of `shard` are taken first. The crawl options (archive, probe cache,
+    host health...) are those the coordinator put in the queue, `concurrency`
+    overrides its value for this worker.
+    """
+    queue = WorkQueue(queue_path)
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    config = queue.config()
+    while config is None:
+        # Started before the coordinator
+        await asyncio.sleep(POLL_SECONDS)
+        config = queue.config()
+    archive = RawArchive(config['archive_dir']) if config['archive_dir'] else None
+    probe_cache = None
+    if config['probe_cache_path']:
+        probe_cache = ProbeCache(config['probe_cache_path'], ttl_days=config['cache_ttl_days'],
+                                 refresh=config['refresh'])
+    health = HostHealth(config['host_health_path'])
+    scraper = SSPScraper(archive=archive, replay=config['replay'], probe_cache=probe_cache, health=health,
+                         concurrency=concurrency or config['concurrency'])
+    in_flight = set()
+    processed = 0
+
+    async def renew():
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            if in_flight:
+                queue.renew(name, list(in_flight))
+
+    async def slot():
+        nonlocal processed
+        while True:
+            item = queue.claim(name, shard)
+            if item is None:
+                if queue.closed:
+                    return
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+            item_id, stage, payload = item
+            in_flight.add(item_id)
+            try:
+                result = await PROCESS[stage](scraper, payload)
+            except Exception as e:
+                logger.error(f"{name}: {stage} item {item_id} failed: {e}")
+                queue.release(item_id, str(e))
+            else:
+                queue.complete(item_id, result)
+                processed += 1
+            finally:
+                in_flight.discard(item_id)
+
+    await scraper.init_session()
+    renewer = asyncio.create_task(renew())
+    try:
+        await asyncio.gather(*(slot() for _ in range(ITEM_SLOTS)))
+    finally:
+        renewer.cancel()
+        await scraper.close_session()
+        queue.report(name, shard, processed, list(scraper.failed_requests), scraper.timing.records())
+        scraper.timing.close()
+        if archive is not None:
+            archive.close()
+        if probe_cache is not None:
+            probe_cache.close()
+        health.close()
+        scraper.results.close()
+        queue.close()
+    logger.info(f"{name}: {processed} items processed")
+    return processed
+
+
+def run_worker(queue_path: str = CRAWL_QUEUE, shard: Optional[int] = None, name: Optional[str] = None,
+               concurrency: Optional[int] = None) -> int:
+    """Worker process entry point: its own event loop."""
+    return asyncio.run(work(queue_path, shard, name, concurrency))
+
+
+def domain_items(domains: Iterable[str], shards: int) -> List[tuple]:
+    """(shard, batch of domains) items of a domain set."""
+    by_shard = defaultdict(list)
+    for domain in domains:
+        # Skipped by process_domains_batch anyway
+        if domain and isinstance(domain, str) and domain.strip():
+            by_shard[shard_of(normalize_domain(domain), shards)].append(domain)
+    items = []
+    for shard, batch in sorted(by_shard.items()):
+        batch.sort()
+        items.extend((shard, batch[start:start + DOMAIN_BATCH]) for start in range(0, len(batch), DOMAIN_BATCH))
+    return items
+
+
+def wait(queue: WorkQueue, stages: List[str], processes: List[multiprocessing.Process]):
+    """Block until no item of `stages` is left to process."""
+    last_log = time.monotonic()
+    while True:
+        counts = queue.counts(stages)
+        left = counts['pending'] + counts['leased']
+        if not left:
+            return
+        if processes and not any(process.is_alive() for process in processes):
+            raise RuntimeError(f"all local workers exited with {left} items of {'/'.join(stages)} left")
+        if time.monotonic() - last_log >= 30:
+            logger.info(f"{'/'.join(stages)}: {counts['done']} items done, {left} left")
+            last_log = time.monotonic()
+        time.sleep(POLL_SECONDS)
+
+
+def log_failures(queue: WorkQueue, stage: str):
+    for payload, error in queue.failures(stage):
+        logger.error(f"{stage} item failed after {MAX_ATTEMPTS} attempts ({error}): "
+                     f"{payload if stage == 'ssp' else f'{len(payload)} domains'}")
+
+
+def crawl(workers: Optional[int] = None, shards: Optional[int] = None, queue_path: str = CRAWL_QUEUE,
+          archive_dir: Optional[str] = ARCHIVE_DIR, replay: Optional[str] = None,
+          probe_cache_path: Optional[str] = PROBE_CACHE, cache_ttl_days: float = 28, refresh: bool = False,
+          host_health_path: Optional[str] = HOST_HEALTH, buffer_rows: int = BUFFER_ROWS,
+          spill_dir: Optional[str] = None, concurrency: int = CONCURRENCY,
+          output_format: str = 'csv', upload: bool = True):
+    """Run the weekly crawl of ssp_scraper.main over `workers` local processes (one per core
+    by default; 0 to rely on workers started elsewhere) and `shards` shards (as many as workers,
+    by default), each worker with `concurrency` requests in flight. Same outputs as main()."""
+    import pandas as pd
+    workers = os.cpu_count() if workers is None else workers
+    shards = shards or workers or 1
+    ssp_df = pd.read_csv('List of SSP.csv', sep=';')
+    ssps = [(row['Name'], row['Sellers.JSON']) for _, row in ssp_df.iterrows()
+            if not pd.isna(row['Sellers.JSON'])]
+    archive = RawArchive(archive_dir) if archive_dir else None
+    # The coordinator only merges: no session, no probes
+    scraper = SSPScraper(archive=archive, replay=replay, results=ResultStore(buffer_rows, spill_dir))
+    queue = WorkQueue(queue_path)
+    queue.reset({
+        'archive_dir': archive_dir, 'replay': scraper.replay, 'concurrency': concurrency,
+        'probe_cache_path': probe_cache_path if not replay else None,
+        'cache_ttl_days': cache_ttl_days, 'refresh': refresh,
+        'host_health_path': host_health_path if not replay else None,
+    })
+    queue.add('ssp', ((shard_of(source_url, shards), (ssp_name, source_url)) for ssp_name, source_url in ssps))
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_worker, args=(queue_path, shard % shards), name=f'shard-{shard}')
+                 for shard in range(workers)]
+    for process in processes:
+        process.start()
+    logger.info(f"{len(ssps)} SSPs queued in {queue_path} for {shards} shards, {workers} local workers")
+
+    try:
+        wait(queue, ['ssp'], processes)
+        log_failures(queue, 'ssp')
+        for (ssp_name, source_url), rows in queue.results('ssp'):
+            for start in range(0, len(rows or ()), ROW_BATCH_SIZE):
+                scraper.results['sellers'].extend(
+                    scraper.expand_seller_rows(rows[start:start + ROW_BATCH_SIZE], ssp_name, source_url))
+
+        # Majority seller_type assignment per domain, then the domain checks
+        scraper.assign_majority_types()
+        direct_media, intermediaries = scraper.split_domains()
+        queue.add('ads_txt', domain_items(direct_media, shards))
+        queue.add('sellers_json', domain_items(intermediaries, shards))
+        del direct_media, intermediaries
+        wait(queue, ['ads_txt', 'sellers_json'], processes)
+        for stage, table in (('ads_txt', 'direct_media'), ('sellers_json', 'intermediaries')):
+            log_failures(queue, stage)
+            for _, rows in queue.results(stage):
+                scraper.results[table].extend(rows)
+
+        # Workers exit once idle and leave their failed requests and timings
+        queue.close_run()
+        for process in processes:
+            process.join(REPORT_TIMEOUT)
+        deadline = time.monotonic() + REPORT_TIMEOUT
+        while queue.unreported() and time.monotonic() < deadline:
+            time.sleep(POLL_SECONDS)
+        for name in queue.unreported():
+            logger.warning(f"No report from worker {name}: its failed requests and timings are missing")
+        for name, shard, items, failed, requests in queue.reports():
+            logger.info(f"Worker {name} (shard {shard}): {items} items, {requests} requests")
+            scraper.failed_requests.extend(failed)
+            for records in queue.timing(name):
+                scraper.timing.add_records(records)
+
+        scraper.save_results(output_format)
+        if scraper.replay:
+            logger.info(f"Replay of {scraper.replay}: results not uploaded")
+        elif output_format != 'csv':
+            logger.info(f"Results written as {output_format}: not uploaded")
+        elif upload:
+            upload_results()
+    finally:
+        queue.close_run()
+        for process in processes:
+            process.join(REPORT_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+        queue.close()
+        if archive is not None:
+            archive.close()
+        scraper.results.close()
+
+
+def add_shard_arguments(parser):
+    parser.add_argument("--workers", type=int, help="local worker processes of a sharded crawl "
+                                                    "(0: only workers started with `worker`)")
+    parser.add_argument("--shards", type=int, help="shards of a sharded crawl (default: one per local worker)")
+    parser.add_argument("--queue", default=CRAWL_QUEUE, help="work queue file of a sharded crawl")
+
+
+def add_worker_arguments(parser):
+    parser.add_argument("--queue", default=CRAWL_QUEUE, help="work queue file of the coordinator")
+    parser.add_argument("--shard", type=int, help="shard whose items are taken first")
+    parser.add_argument("--name", help="worker name (default: host-pid)")
+    parser.add_argument("--concurrency", type=int, help="requests in flight (default: the coordinator's)")
+
+
+def run_sharded(args, replay: Optional[str] = None):
+    """Run crawl() with the options of add_crawl_arguments and add_shard_arguments."""
+    if args.pipelined or args.streaming:
+        logger.info("Sharded crawl: --pipelined and --streaming do not apply, workers parse their own files")
+    archive_dir = None if args.no_archive and not replay else args.archive
+    crawl(workers=args.workers, shards=args.shards, queue_path=args.queue, archive_dir=archive_dir,
+          replay=replay, probe_cache_path=None if args.no_probe_cache else args.probe_cache,
+          cache_ttl_days=args.cache_ttl, refresh=args.refresh,
+          host_health_path=None if args.no_host_health else args.host_health,
+          buffer_rows=args.buffer_rows, spill_dir=args.spill_dir, concurrency=args.concurrency,
+          output_format=args.output_format, upload=not args.no_upload)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sharded SSP crawl over several processes or machines')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+    crawl_parser = commands.add_parser('crawl', help='coordinate a crawl, with local workers')
+    crawl_parser.add_argument("--replay", metavar="DATE", help="rerun the crawl on the files archived on DATE")
+    add_crawl_arguments(crawl_parser)
+    add_shard_arguments(crawl_parser)
+    worker_parser = commands.add_parser('worker', help='process the items of a coordinator\'s queue')
+    add_worker_arguments(worker_parser)
+    args = parser.parse_args()
+    if args.command == 'crawl':
+        run_sharded(args, args.replay)
+    else:
+        run_worker(args.queue, args.shard, args.name, args.concurrency)
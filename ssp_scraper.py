@@ -1,7 +1,8 @@
 import aiohttp
 import asyncio
+import contextlib
+import contextvars
 import json
-import pandas as pd
 from typing import List, Dict, Optional, Set
 from urllib.parse import urlparse
 import logging
@@ -10,9 +11,16 @@ import re
 from tqdm import tqdm
 import time
 import os
-from aiohttp import TCPConnector
-from google_sheets_uploader import GoogleSheetsUploader
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from network_timing import NetworkTimingCollector, TimingTCPConnector
+from document_encoding import decode_ads_txt, load_json
+from raw_archive import ARCHIVE_DIR, RawArchive
+from csv_sink import OUTPUT_FORMATS, open_sink
+from result_store import BUFFER_ROWS, ResultStore
+from probe_cache import PROBE_CACHE, ProbeCache, clean_domain
+from host_health import HOST_HEALTH, CircuitOpenError, HostHealth
+from retry_policy import RETRYABLE_STATUS, Deadline, RetryPolicy, classify, retry_after_seconds, retryable
 
 # Google Sheets configuration
 SPREADSHEET_ID = '16rptcM-d1tgxFid2NeS3BQjjOuxODNK7ZIng_DUDGag'
@@ -27,18 +35,63 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Per-seller fields of a parsed sellers.json, in the order of the compact rows
+SELLER_FIELDS = ['domain', 'is_confidential', 'is_passthrough', 'name', 'seller_id', 'seller_type', 'website']
+# Rows turned into result dicts between two yields to the event loop
+ROW_BATCH_SIZE = 10000
+# Requests in flight at once (SSPScraper) and concurrent domain checks (process_domains_batch)
+CONCURRENCY = 50
+# Set by _cached_probe: the URLs of the probe skipped because their host's circuit was open
+_circuit_skips: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar('circuit_skips', default=None)
+
+def parse_sellers_rows(content) -> Optional[List[tuple]]:
+    """Decode a sellers.json body (bytes or str) into compact rows, None if it is not JSON.
+
+    Runs in the parser worker processes of the pipelined mode: tuples in
+    SELLER_FIELDS order pickle far smaller and faster than one dict per seller.
+    """
+    try:
+        data = load_json(content)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or 'sellers' not in data:
+        return []
+    return [(seller.get('domain', ''),
+             seller.get('is_confidential', False),
+             seller.get('is_passthrough', False),
+             seller.get('name', ''),
+             seller.get('seller_id', ''),
+             seller.get('seller_type', ''),
+             seller.get('website', '')) for seller in data['sellers']]
+
 class SSPScraper:
-    def __init__(self):
+    def __init__(self, archive: Optional[RawArchive] = None, replay: Optional[str] = None,
+                 probe_cache: Optional[ProbeCache] = None, health: Optional[HostHealth] = None,
+                 retry_policy: Optional[RetryPolicy] = None, results: Optional[ResultStore] = None,
+                 concurrency: int = CONCURRENCY):
+        """Fetched bodies are stored in `archive`; with a `replay` date (or 'latest') they are
+        read back from it instead of the network. Domain checks reuse the results of
+        previous runs kept in `probe_cache` (not when replaying). Hosts whose connections
+        fail are skipped as `health` (in memory for this run by default) decides, and
+        retries, timeouts and time budgets follow `retry_policy`. Results are kept in
+        `results`, a ResultStore spilling to disk past its buffer. At most
+        `concurrency` requests are in flight."""
+        if replay and archive is None:
+            raise ValueError("replay needs an archive")
+        self.archive = archive
+        self.replay = archive.resolve_date(replay) if replay else None
+        self.probe_cache = probe_cache if not self.replay else None
+        self.health = health if health is not None else HostHealth()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.import_date = self.replay  # Date of the outputs, today unless replaying
         self.session = None
-        self.results = {
-            'sellers': [],
-            'direct_media': [],
-            'intermediaries': []
-        }
-        self.failed_requests = []
+        self.results = results if results is not None else ResultStore()
+        self.failed_requests = self.results['failed_requests']
+        self.timing = NetworkTimingCollector()
         self.new_domains_per_ssp = {}
         self.last_week_domains = self._load_last_week_domains()
-        self.semaphore = asyncio.Semaphore(50)  # Limit concurrent connections
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)  # Limit concurrent connections
 
     def _load_last_week_domains(self) -> Dict[str, Set[str]]:
         """Load last week's domains for comparison."""
@@ -61,92 +114,257 @@ class SSPScraper:
 
     async def init_session(self):
         if not self.session:
-            connector = TCPConnector(limit=50, force_close=True)
+            connector = TimingTCPConnector(limit=self.concurrency, force_close=True)
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
             }
-            self.session = aiohttp.ClientSession(connector=connector, headers=headers)
+            self.session = aiohttp.ClientSession(connector=connector, headers=headers,
+                                                 trace_configs=[self.timing.trace_config()])
 
     async def close_session(self):
         if self.session:
             await self.session.close()
             self.session = None
 
-    async def fetch_file(self, url: str, timeout: int = 30) -> Optional[str]:
-        """Fetch file content with retry mechanism."""
+    async def fetch_file(self, url: str, timeout: float = 30,
+                         deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Fetch file content as text (UTF-8, see document_encoding)."""
+        body = await self.fetch_bytes(url, timeout, deadline)
+        return decode_ads_txt(body) if body is not None else None
+
+    async def fetch_bytes(self, url: str, timeout: float = 30,
+                          deadline: Optional[Deadline] = None) -> Optional[bytes]:
+        """Fetch the raw file body, archived as it comes in (or read back from the archive when replaying).
+
+        `timeout` caps each attempt; `deadline` is the budget shared with other
+        fetches (the URL variants of one domain).
+        """
+        if self.replay:
+            body, error = await self._replay_body(url)
+        else:
+            body, error, status, content_type = await self._download(url, timeout, deadline)
+            if self.archive is not None:
+                sha256 = await asyncio.to_thread(self.archive.put_body, body) if body is not None else None
+                self.archive.record(url, status, body, content_type, error, sha256)
+        if error:
+            self.failed_requests.append(error)
+        return body
+
+    async def _replay_body(self, url: str):
+        """(body, failure) of `url` on the replayed date."""
+        entry = self.archive.lookup(url, self.replay)
+        if entry is None:
+            return None, f"Not archived on {self.replay}: {url}"
+        if entry.sha256 is None:
+            return None, entry.error or f"HTTP {entry.status}: {url}"
+        return await asyncio.to_thread(self.archive.body, entry.sha256), None
+
+    async def _download(self, url: str, timeout: float, deadline: Optional[Deadline] = None):
+        """(body, failure, HTTP status, Content-Type) of `url`, retried as `retry_policy` allows.
+
+        The status and Content-Type are those of the last response, None when none came.
+        """
         await self.init_session()
+        host = urlparse(url).hostname or ''
+        policy = self.retry_policy
+        deadline = policy.request_deadline(deadline)
         
+        status = content_type = None
         async with self.semaphore:  # Limit concurrent requests
-            for attempt in range(3):
+            attempt = 0
+            while True:
                 try:
-                    async with self.session.get(url, timeout=timeout) as response:
+                    # Hosts (or addresses) that keep failing are not tried again
+                    await self.health.check(host)
+                except CircuitOpenError as e:
+                    skips = _circuit_skips.get()
+                    if skips is not None:
+                        skips.append(url)
+                    return None, f"Host down ({e}): {url}", status, content_type
+                total, idle = policy.timeouts(host, deadline, timeout)
+                if total <= 0:
+                    return None, f"Time budget exhausted: {url}", status, content_type
+                retry_after = None
+                started = time.monotonic()
+                try:
+                    async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=total, sock_connect=idle,
+                                                                                   sock_read=idle),
+                                                trace_request_ctx={'attempt': attempt + 1}) as response:
+                        policy.observe(host, time.monotonic() - started)
+                        await self.health.success(host)
+                        status, content_type = response.status, response.headers.get('Content-Type')
                         if response.status == 200:
-                            return await response.text()
+                            return await response.read(), None, status, content_type
                         elif response.status == 404:
                             logger.info(f"File not found (404): {url}")
-                            self.failed_requests.append(f"404: {url}")
-                            return None
-                        elif response.status == 429:  # Too Many Requests
-                            wait_time = int(response.headers.get('Retry-After', 5))
-                            logger.warning(f"Rate limited, waiting {wait_time} seconds")
-                            await asyncio.sleep(wait_time)
-                            continue
-                        else:
+                            return None, f"404: {url}", status, content_type
+                        elif response.status not in RETRYABLE_STATUS:
                             logger.warning(f"HTTP {response.status} for {url}")
-                            self.failed_requests.append(f"HTTP {response.status}: {url}")
-                            return None
+                            return None, f"HTTP {response.status}: {url}", status, content_type
+                        failure = f"HTTP {response.status}: {url}"
+                        if response.status == 429:  # Too Many Requests
+                            retry_after = retry_after_seconds(response.headers.get('Retry-After', 5))
+                            logger.warning(f"Rate limited, waiting {retry_after} seconds")
                 except aiohttp.ClientConnectorError as e:
                     logger.warning(f"Connection error for {url}: {str(e)}")
-                    self.failed_requests.append(f"Connection error: {url}")
-                    return None
+                    await self.health.failure(host, f"connection error: {e}")
+                    if not retryable(e):
+                        return None, f"Connection error: {url}", status, content_type
+                    failure = f"Connection error: {url}"
                 except Exception as e:
                     logger.warning(f"Attempt {attempt + 1} failed for {url}: {str(e)}")
-                    if attempt < 2:
-                        await asyncio.sleep(1)
-                    continue
-            
-            self.failed_requests.append(f"Unreachable after retries: {url}")
-            return None
+                    if classify(e) == 'timeout':
+                        policy.observe(host, time.monotonic() - started)
+                        await self.health.failure(host, "timeout")
+                    if not retryable(e):
+                        return None, f"Failed ({classify(e)}): {url}", status, content_type
+                    failure = f"Unreachable after retries: {url}"
+                attempt += 1
+                delay = policy.retry_delay(attempt, deadline, retry_after)
+                if delay is None:
+                    return None, failure, status, content_type
+                await asyncio.sleep(delay)
 
-    def parse_sellers_json(self, content: str, ssp_name: str, source_url: str) -> List[Dict]:
-        """Parse sellers.json content into structured data."""
+    def parse_sellers_json(self, content, ssp_name: str, source_url: str) -> List[Dict]:
+        """Parse sellers.json content (raw bytes or str) into structured data."""
         if not content:
             return []
 
-        try:
-            data = json.loads(content)
-            entries = []
-            
-            if 'sellers' in data:
-                for seller in data['sellers']:
-                    entry = {
-                        'comment': '',
-                        'domain': seller.get('domain', ''),
-                        'is_confidential': seller.get('is_confidential', False),
-                        'is_passthrough': seller.get('is_passthrough', False),
-                        'name': seller.get('name', ''),
-                        'seller_id': seller.get('seller_id', ''),
-                        'seller_type': seller.get('seller_type', ''),
-                        'website': seller.get('website', ''),
-                        'Source URL': source_url,
-                        'SSP name': ssp_name,
-                        'Import_date': datetime.now().strftime('%Y-%m-%d'),
-                        'Unique SSPs per Domain': 1  # Will be updated later
-                    }
-                    entries.append(entry)
-                    
-                    # Track new domains
-                    if seller.get('domain'):
-                        if ssp_name not in self.new_domains_per_ssp:
-                            self.new_domains_per_ssp[ssp_name] = set()
-                        self.new_domains_per_ssp[ssp_name].add(seller['domain'])
-            
-            return entries
-        except json.JSONDecodeError:
+        rows = parse_sellers_rows(content)
+        if rows is None:
             logger.error(f"Error parsing sellers.json for {ssp_name}")
             return []
+        return self.expand_seller_rows(rows, ssp_name, source_url)
+
+    def expand_seller_rows(self, rows: List[tuple], ssp_name: str, source_url: str) -> List[Dict]:
+        """Turn compact rows from parse_sellers_rows into result entries."""
+        import_date = self.import_date or datetime.now().strftime('%Y-%m-%d')
+        entries = []
+        for domain, is_confidential, is_passthrough, name, seller_id, seller_type, website in rows:
+            entries.append({
+                'comment': '',
+                'domain': domain,
+                'is_confidential': is_confidential,
+                'is_passthrough': is_passthrough,
+                'name': name,
+                'seller_id': seller_id,
+                'seller_type': seller_type,
+                'website': website,
+                'Source URL': source_url,
+                'SSP name': ssp_name,
+                'Import_date': import_date,
+                'Unique SSPs per Domain': 1,  # Will be updated later
+                # seller_type becomes the domain's majority type (assign_majority_types): the SSP's own
+                # declaration is kept for cross_verify
+                'declared_seller_type': seller_type,
+            })
+
+        # Track new domains
+        domains = {row[0] for row in rows if row[0]}
+        if domains:
+            self.new_domains_per_ssp.setdefault(ssp_name, set()).update(domains)
+        return entries
+
+    async def collect_sellers_pipelined(self, ssps: List[tuple], parse_workers: Optional[int] = None,
+                                        on_rows=None):
+        """Fetch and parse the SSPs' sellers.json files, (name, url) pairs, with parsing off the event loop.
+
+        Raw bytes go to a pool of parser processes as soon as each download
+        completes, so decoding a large file never stalls the other downloads
+        (`parse_workers=0` parses on the loop instead). `on_rows(ssp_name, rows)`
+        sees each SSP's rows as soon as they are parsed; entries are added to
+        results['sellers'] in the order of `ssps`.
+        """
+        loop = asyncio.get_running_loop()
+        batches = [None] * len(ssps)
+        executor = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers != 0 else None
+        with executor or contextlib.nullcontext():
+            async def fetch_and_parse(index, ssp_name, source_url):
+                content = await self.fetch_bytes(source_url)
+                if not content:
+                    return
+                if executor is None:
+                    rows = parse_sellers_rows(content)
+                else:
+                    rows = await loop.run_in_executor(executor, parse_sellers_rows, content)
+                if rows is None:
+                    logger.error(f"Error parsing sellers.json for {ssp_name}")
+                    return
+                batches[index] = rows
+                if on_rows is not None:
+                    on_rows(ssp_name, rows)
+
+            tasks = [asyncio.create_task(fetch_and_parse(index, ssp_name, source_url))
+                     for index, (ssp_name, source_url) in enumerate(ssps)]
+            for future in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Processing SSPs"):
+                await future
+
+        for (ssp_name, source_url), rows in zip(ssps, batches):
+            if not rows:
+                continue
+            for start in range(0, len(rows), ROW_BATCH_SIZE):
+                self.results['sellers'].extend(
+                    self.expand_seller_rows(rows[start:start + ROW_BATCH_SIZE], ssp_name, source_url))
+                await asyncio.sleep(0)
+
+    def assign_majority_types(self) -> Dict[str, str]:
+        """Give each domain's entries the seller_type most of them declare; returns domain -> type."""
+        domain_type_counter = defaultdict(Counter)
+        for entry in self.results['sellers']:
+            if entry['domain']:
+                domain_type_counter[entry['domain']][entry['seller_type'].upper()] += 1
+        # Compute majority type per domain
+        domain_majority_type = {}
+        for domain, type_counts in domain_type_counter.items():
+            majority_type = type_counts.most_common(1)[0][0]
+            domain_majority_type[domain] = majority_type
+        # Update all entries to use the majority type
+        def apply_majority(entry):
+            if entry['domain'] in domain_majority_type:
+                entry['seller_type'] = domain_majority_type[entry['domain']]
+            return entry
+        self.results['sellers'].rewrite(apply_majority)
+        return domain_majority_type
+
+    def split_domains(self):
+        """(direct media, intermediaries): sets of the seller domains typed PUBLISHER, and of the others."""
+        direct_media = set()
+        intermediaries = set()
+        for entry in self.results['sellers']:
+            if entry['seller_type'].upper() == 'PUBLISHER':
+                direct_media.add(entry['domain'])
+            else:
+                intermediaries.add(entry['domain'])
+        return direct_media, intermediaries
+
+    async def _cached_probe(self, kind: str, domain: str, probe) -> Dict:
+        """Result of `probe(domain)`, taken from the probe cache while it is fresh."""
+        if self.probe_cache is None or not domain:
+            return await probe(domain)
+        result = self.probe_cache.get(kind, domain)
+        if result is not None:
+            result['domain'] = clean_domain(domain)
+            return result
+        skips = []
+        token = _circuit_skips.set(skips)
+        try:
+            result = await probe(domain)
+        finally:
+            _circuit_skips.reset(token)
+        # Not found only because a circuit was open: not known to be unreachable, probed again next run
+        if not (result.get('unreachable') and skips):
+            self.probe_cache.put(kind, domain, result)
+        return result
 
     async def check_ads_txt(self, domain: str) -> Dict:
+        """Vérifie ads.txt pour un domaine, via le cache des sondages s'il y en a un."""
+        return await self._cached_probe('ads_txt', domain, self.probe_ads_txt)
+
+    async def check_sellers_json(self, domain: str) -> Dict:
+        """Vérifie sellers.json pour un domaine, via le cache des sondages s'il y en a un."""
+        return await self._cached_probe('sellers_json', domain, self.probe_sellers_json)
+
+    async def probe_ads_txt(self, domain: str) -> Dict:
         """Vérifie ads.txt sur différentes variantes d'URL pour un domaine."""
         if not domain:  # Gère None ou domaine vide
             return {
@@ -187,11 +405,12 @@ class SSPScraper:
         }
 
         found = False
+        deadline = self.retry_policy.domain_deadline()
         for url in ads_txt_urls:
-            content = await self.fetch_file(url)
-            if content:
+            body = await self.fetch_bytes(url, deadline=deadline)
+            if body:
                 result['ads_txt_exists'] = True
-                lines = content.split('\n')
+                lines = decode_ads_txt(body).split('\n')
                 # Recherche Smilewanted
                 smilewanted_patterns = ['smilewanted', 'smile wanted', 'SMILEWANTED']
                 for line in lines:
@@ -219,7 +438,7 @@ class SSPScraper:
             result['unreachable'] = True
         return result
 
-    async def check_sellers_json(self, domain: str) -> Dict:
+    async def probe_sellers_json(self, domain: str) -> Dict:
         """Vérifie la présence de sellers.json sur différentes variantes d'URL pour un domaine."""
         if not domain:  # Gère None ou domaine vide
             return {
@@ -257,11 +476,12 @@ class SSPScraper:
         }
 
         found = False
+        deadline = self.retry_policy.domain_deadline()
         for url in sellers_json_urls:
-            content = await self.fetch_file(url)
-            if content:
+            body = await self.fetch_bytes(url, deadline=deadline)
+            if body:
                 try:
-                    data = json.loads(content)
+                    data = load_json(body)
                     if 'sellers' in data:
                         result['sellers_json_url'] = url
                         result['total_sellers'] = len(data['sellers'])
@@ -272,38 +492,41 @@ class SSPScraper:
                         found = True
                         logger.info(f"sellers.json trouvé pour {domain} à l'URL : {url}")
                         break
-                except json.JSONDecodeError:
+                except ValueError:
                     continue
         if not found:
             result['unreachable'] = True
 
         return result
 
-    def save_results(self):
-        """Save all results to CSV files."""
+    def save_results(self, output_format: str = 'csv'):
+        """Save all results to CSV files (or JSON Lines files with output_format='jsonl')."""
+        import pandas as pd
         os.makedirs('output', exist_ok=True)
         
-        # Save main sellers data
+        # Save main sellers data, chunk by chunk
         if self.results['sellers']:
-            df_sellers = pd.DataFrame(self.results['sellers'])
             # Update Unique SSPs per Domain
-            domain_counts = df_sellers.groupby('domain')['SSP name'].nunique()
-            df_sellers['Unique SSPs per Domain'] = df_sellers['domain'].map(domain_counts)
-            df_sellers.to_csv('output/sellers_data.csv', index=False)
+            domain_ssps = defaultdict(set)
+            for entry in self.results['sellers']:
+                domain_ssps[entry['domain']].add(entry['SSP name'])
+            domain_counts = {domain: len(ssps) for domain, ssps in domain_ssps.items()}
+            del domain_ssps
+            self._write_rows('output/sellers_data.csv', self.results['sellers'], output_format,
+                            lambda entry: {**entry, 'Unique SSPs per Domain': domain_counts[entry['domain']]})
         
         # Save direct media data
         if self.results['direct_media']:
-            df_direct = pd.DataFrame(self.results['direct_media'])
-            df_direct.to_csv('output/direct_media.csv', index=False)
+            self._write_rows('output/direct_media.csv', self.results['direct_media'], output_format)
         
         # Save intermediaries data
         if self.results['intermediaries']:
-            df_inter = pd.DataFrame(self.results['intermediaries'])
-            df_inter.to_csv('output/intermediaries.csv', index=False)
+            self._write_rows('output/intermediaries.csv', self.results['intermediaries'], output_format)
         
         # Save new domains report
         from datetime import datetime
-        week_str = datetime.now().strftime('%Y-%W')
+        run_date = datetime.strptime(self.import_date, '%Y-%m-%d') if self.import_date else datetime.now()
+        week_str = run_date.strftime('%Y-%W')
         new_domains_report = []
         for ssp, domains in self.new_domains_per_ssp.items():
             last_week_domains = self.last_week_domains.get(ssp, set())
@@ -320,114 +543,292 @@ class SSPScraper:
         # Save failed requests
         if self.failed_requests:
             with open('output/failed_requests.txt', 'w') as f:
-                f.write('\n'.join(self.failed_requests))
+                for i, rows in enumerate(self.failed_requests.chunks()):
+                    f.write(('\n' if i else '') + '\n'.join(rows))
 
-async def process_domains_batch(scraper, domains, process_func, desc):
-    """Process a batch of domains concurrently."""
-    # Filter out None or empty domains
-    valid_domains = [d for d in domains if d and isinstance(d, str) and d.strip()]
-    
-    if not valid_domains:
-        return []
-    
-    tasks = []
-    for domain in valid_domains:
-        task = asyncio.create_task(process_func(domain))
-        tasks.append(task)
-    
+        # Save per-request network timings
+        self.timing.write_report('output')
+
+    @staticmethod
+    def _write_rows(path: str, table, output_format: str = 'csv', transform=None):
+        """Write a result table as it is read, one chunk in memory at a time."""
+        sink = open_sink(path, output_format)
+        try:
+            for rows in table.chunks():
+                sink.extend(map(transform, rows) if transform else rows)
+        finally:
+            sink.close()
+
+# Concurrent domain checks of process_domains_batch, as many as fetch_bytes lets through
+BATCH_WORKERS = CONCURRENCY
+
+async def process_domains_batch(scraper, domains, process_func, desc, sink=None,
+                                workers: int = BATCH_WORKERS, queue_size: Optional[int] = None,
+                                show_progress: bool = True):
+    """Process domains with a fixed pool of workers fed through a bounded queue.
+
+    `domains` (any iterable or async iterable, consumed lazily) is pushed into a queue of
+    `queue_size` entries (twice the workers by default) and each result is
+    handed to `sink(result)` as soon as it is ready, so memory does not grow
+    with the number of domains. Without a sink the results are returned in a
+    list; with one, their count is. Cancelling the awaiting task stops the
+    producer and the workers. `show_progress=False` hides the progress bar.
+    """
+    queue = asyncio.Queue(maxsize=queue_size or 2 * workers)
     results = []
-    for future in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc=desc):
+    emit = sink if sink is not None else results.append
+    emitted = 0
+    progress = tqdm(total=len(domains) if hasattr(domains, '__len__') else None, desc=desc, disable=not show_progress)
+
+    async def feed(domain):
+        # Filter out None or empty domains
+        if domain and isinstance(domain, str) and domain.strip():
+            await queue.put(domain)
+        else:
+            progress.update()
+
+    async def produce():
+        if hasattr(domains, '__aiter__'):
+            async for domain in domains:
+                await feed(domain)
+        else:
+            for domain in domains:
+                await feed(domain)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def work():
+        nonlocal emitted
+        while True:
+            domain = await queue.get()
+            if domain is None:
+                return
+            try:
+                result = await process_func(domain)
+            except Exception as e:
+                logger.error(f"Error processing domain: {str(e)}")
+            else:
+                emit(result)
+                emitted += 1
+            progress.update()
+
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        progress.close()
+    return results if sink is None else emitted
+
+
+class DomainCheckStream:
+    """Streaming mode: check domains while the SSPs' sellers.json files are still coming in.
+
+    `ingest` (the on_rows callback of collect_sellers_pipelined) keeps running
+    seller_type counts per domain and queues a domain as soon as it is seen,
+    for the ads.txt check if most of its entries so far say PUBLISHER and the
+    sellers.json check otherwise. A domain whose majority flips later is queued
+    again and `check` then runs the other check; when all SSPs are in,
+    `finish` applies the exact majority pass of the batch mode and queues what
+    is still missing. Both checks share one process_domains_batch worker pool.
+    """
+
+    def __init__(self, scraper: SSPScraper):
+        self.scraper = scraper
+        self.type_counts = defaultdict(Counter)
+        self.kind = {}
+        self.done = {}
+        self.running = set()
+        self.pending = set()
+        self.queue = asyncio.Queue()
+
+    @staticmethod
+    def kind_of(seller_type: str) -> str:
+        return 'direct_media' if seller_type == 'PUBLISHER' else 'intermediaries'
+
+    def _classify(self, domain: str, kind: str):
+        self.kind[domain] = kind
+        if (domain, kind) not in self.done and domain not in self.pending:
+            self.pending.add(domain)
+            self.queue.put_nowait(domain)
+
+    def ingest(self, ssp_name: str, rows: List[tuple]):
+        changed = set()
+        for row in rows:
+            domain, seller_type = row[0], row[5]
+            if domain:
+                self.type_counts[domain][seller_type.upper()] += 1
+                changed.add(domain)
+        for domain in changed:
+            kind = self.kind_of(self.type_counts[domain].most_common(1)[0][0])
+            if self.kind.get(domain) != kind:
+                self._classify(domain, kind)
+
+    def finish(self, domain_majority_type: Dict[str, str]):
+        """Settle every domain on its final majority type and close the stream."""
+        for domain, seller_type in domain_majority_type.items():
+            self._classify(domain, self.kind_of(seller_type))
+        self.queue.put_nowait(None)
+
+    async def domains(self):
+        while True:
+            domain = await self.queue.get()
+            if domain is None:
+                return
+            yield domain
+
+    async def check(self, domain: str):
+        self.pending.discard(domain)
+        kind = self.kind[domain]
+        if (domain, kind) in self.done or (domain, kind) in self.running:
+            return None
+        self.running.add((domain, kind))
         try:
-            result = await future
-            results.append(result)
-        except Exception as e:
-            logger.error(f"Error processing domain: {str(e)}")
-            continue
-    
-    return results
+            if kind == 'direct_media':
+                return domain, kind, await self.scraper.check_ads_txt(domain)
+            return domain, kind, await self.scraper.check_sellers_json(domain)
+        finally:
+            self.running.discard((domain, kind))
+
+    def store(self, checked):
+        if checked is not None:
+            domain, kind, result = checked
+            self.done[(domain, kind)] = result
+
+    def results(self, kind: str) -> List[Dict]:
+        """Results of the domains whose final class is `kind`, in check completion order."""
+        return [result for (domain, checked_kind), result in self.done.items()
+                if checked_kind == kind and self.kind[domain] == kind]
+
+async def stream_checks(scraper: SSPScraper, ssps: List[tuple], parse_workers: Optional[int] = 0,
+                        workers: int = BATCH_WORKERS):
+    """Collect the SSPs' sellers and run the domain checks in one streaming pass (see DomainCheckStream)."""
+    stream = DomainCheckStream(scraper)
+    checks = asyncio.create_task(process_domains_batch(
+        scraper, stream.domains(), stream.check, "Checking domains", sink=stream.store, workers=workers))
+    try:
+        await scraper.collect_sellers_pipelined(ssps, parse_workers, on_rows=stream.ingest)
+        stream.finish(scraper.assign_majority_types())
+        await checks
+    finally:
+        checks.cancel()
+    scraper.results['direct_media'].extend(stream.results('direct_media'))
+    scraper.results['intermediaries'].extend(stream.results('intermediaries'))
+    return stream
+
+async def main(pipelined: bool = False, parse_workers: Optional[int] = None,
+               archive_dir: Optional[str] = ARCHIVE_DIR, replay: Optional[str] = None,
+               streaming: bool = False, probe_cache_path: Optional[str] = PROBE_CACHE,
+               cache_ttl_days: float = 28, refresh: bool = False,
+               host_health_path: Optional[str] = HOST_HEALTH, buffer_rows: int = BUFFER_ROWS,
+               spill_dir: Optional[str] = None, concurrency: int = CONCURRENCY,
+               output_format: str = 'csv', upload: bool = True):
+    """Run the weekly crawl; with pipelined, sellers.json files are parsed by
+    `parse_workers` processes (default: one per core) while downloads go on.
+    With streaming, the domain checks run as soon as each SSP is parsed
+    instead of after all of them (see DomainCheckStream).
 
-async def main():
+    Fetched files are kept in the raw archive `archive_dir` (None to disable);
+    `replay` runs the same pipeline on the files archived on that date.
+    Domain check results are reused across runs from `probe_cache_path`
+    (None to disable) for about `cache_ttl_days`; refresh probes them all again.
+    Hosts found down are remembered in `host_health_path` (None: this run only).
+    At most `buffer_rows` rows of each result list stay in memory, the others
+    are spilled to a scratch file in `spill_dir` (see ResultStore).
+    `concurrency` bounds the requests in flight and the concurrent domain
+    checks. Results are written as `output_format` (csv or jsonl) files and,
+    in CSV and with upload, sent to Google Sheets.
+    """
+    import pandas as pd
     # Read SSP list
     ssp_df = pd.read_csv('List of SSP.csv', sep=';')
-    scraper = SSPScraper()
+    archive = RawArchive(archive_dir) if archive_dir else None
+    probe_cache = None
+    if probe_cache_path and not replay:
+        probe_cache = ProbeCache(probe_cache_path, ttl_days=cache_ttl_days, refresh=refresh)
+    health = HostHealth(host_health_path if not replay else None)
+    scraper = SSPScraper(archive=archive, replay=replay, probe_cache=probe_cache, health=health,
+                         results=ResultStore(buffer_rows, spill_dir), concurrency=concurrency)
     
     try:
         # Process sellers.json files
-        ssp_tasks = []
-        for _, row in ssp_df.iterrows():
-            if pd.isna(row['Sellers.JSON']):
-                continue
+        ssps = [(row['Name'], row['Sellers.JSON']) for _, row in ssp_df.iterrows()
+                if not pd.isna(row['Sellers.JSON'])]
+        if streaming:
+            # Domain checks start while sellers.json files are still being fetched
+            await stream_checks(scraper, ssps, parse_workers if pipelined else 0, workers=concurrency)
+        else:
+            if pipelined:
+                await scraper.collect_sellers_pipelined(ssps, parse_workers)
+            else:
+                ssp_tasks = []
+                for ssp_name, source_url in ssps:
+                    task = asyncio.create_task(scraper.fetch_bytes(source_url))
+                    ssp_tasks.append((ssp_name, source_url, task))
             
-            task = asyncio.create_task(scraper.fetch_file(row['Sellers.JSON']))
-            ssp_tasks.append((row['Name'], row['Sellers.JSON'], task))
+                # Process all SSPs concurrently
+                for ssp_name, source_url, task in tqdm(ssp_tasks, desc="Processing SSPs"):
+                    content = await task
+                    if content:
+                        entries = scraper.parse_sellers_json(content, ssp_name, source_url)
+                        scraper.results['sellers'].extend(entries)
         
-        # Process all SSPs concurrently
-        for ssp_name, source_url, task in tqdm(ssp_tasks, desc="Processing SSPs"):
-            content = await task
-            if content:
-                entries = scraper.parse_sellers_json(content, ssp_name, source_url)
-                scraper.results['sellers'].extend(entries)
+            # Majority seller_type assignment per domain
+            scraper.assign_majority_types()
         
-        # --- Majority seller_type assignment per domain ---
-        domain_type_counter = defaultdict(list)
-        for entry in scraper.results['sellers']:
-            if entry['domain']:
-                domain_type_counter[entry['domain']].append(entry['seller_type'].upper())
-        # Compute majority type per domain
-        domain_majority_type = {}
-        for domain, types in domain_type_counter.items():
-            type_counts = Counter(types)
-            majority_type = type_counts.most_common(1)[0][0]
-            domain_majority_type[domain] = majority_type
-        # Update all entries to use the majority type
-        for entry in scraper.results['sellers']:
-            if entry['domain'] in domain_majority_type:
-                entry['seller_type'] = domain_majority_type[entry['domain']]
-        # --- End majority seller_type assignment ---
+            # Split domains into direct media and intermediaries
+            direct_media, intermediaries = scraper.split_domains()
         
-        # Process direct media and intermediaries
-        all_domains = set()
-        for entry in scraper.results['sellers']:
-            if entry['domain']:
-                all_domains.add(entry['domain'])
+            # Process direct media and intermediaries concurrently, results streamed into the lists
+            await process_domains_batch(
+                scraper, direct_media, scraper.check_ads_txt, "Processing Direct Media",
+                sink=scraper.results['direct_media'].append, workers=concurrency
+            )
         
-        # Split domains into direct media and intermediaries
-        direct_media = set()
-        intermediaries = set()
-        for entry in scraper.results['sellers']:
-            if entry['seller_type'].upper() == 'PUBLISHER':
-                direct_media.add(entry['domain'])
-            else:
-                intermediaries.add(entry['domain'])
-        
-        # Process direct media and intermediaries concurrently
-        direct_media_results = await process_domains_batch(
-            scraper, direct_media, scraper.check_ads_txt, "Processing Direct Media"
-        )
-        scraper.results['direct_media'].extend(direct_media_results)
-        
-        intermediary_results = await process_domains_batch(
-            scraper, intermediaries, scraper.check_sellers_json, "Processing Intermediaries"
-        )
-        scraper.results['intermediaries'].extend(intermediary_results)
+            await process_domains_batch(
+                scraper, intermediaries, scraper.check_sellers_json, "Processing Intermediaries",
+                sink=scraper.results['intermediaries'].append, workers=concurrency
+            )
         
         # Save all results
-        scraper.save_results()
+        scraper.save_results(output_format)
         
-        # Upload to Google Sheets
-        try:
-            uploader = GoogleSheetsUploader(SPREADSHEET_ID)
-            uploader.upload_all_data()
-            # Append this week's new domains report to the sheet
-            if os.path.exists('output/new_domains_report.csv'):
-                df_new = pd.read_csv('output/new_domains_report.csv', low_memory=False)
-                uploader.append_dataframe(df_new, 'New Domains Report')
-            logger.info("Successfully uploaded data to Google Sheets")
-        except Exception as e:
-            logger.error(f"Error uploading to Google Sheets: {str(e)}")
+        # Upload to Google Sheets, unless this is a replay of an archived run
+        if scraper.replay:
+            logger.info(f"Replay of {scraper.replay}: results not uploaded")
+        elif output_format != 'csv':
+            logger.info(f"Results written as {output_format}: not uploaded")
+        elif upload:
+            upload_results()
         
     finally:
         await scraper.close_session()
+        if archive is not None:
+            archive.close()
+        if probe_cache is not None:
+            logger.info(f"Probe cache: {probe_cache.hits} cached, {probe_cache.misses} probed")
+            probe_cache.close()
+        if not replay:
+            logger.info("Host health: {open_hosts} hosts and {open_ips} addresses down, "
+                        "{blocked_requests} requests skipped".format(**health.summary()))
+        health.close()
+        scraper.results.close()
+
+def upload_results():
+    """Upload the CSV outputs to Google Sheets and append this week's new domains report."""
+    import pandas as pd
+    from google_sheets_uploader import GoogleSheetsUploader
+    try:
+        uploader = GoogleSheetsUploader(SPREADSHEET_ID)
+        uploader.upload_all_data()
+        # Append this week's new domains report to the sheet
+        if os.path.exists('output/new_domains_report.csv'):
+            df_new = pd.read_csv('output/new_domains_report.csv', low_memory=False)
+            uploader.append_dataframe(df_new, 'New Domains Report')
+        logger.info("Successfully uploaded data to Google Sheets")
+    except Exception as e:
+        logger.error(f"Error uploading to Google Sheets: {str(e)}")
 
 # Test asynchrone pour Mediavine
 async def test_mediavine():
@@ -442,5 +843,47 @@ async def test_mediavine():
     finally:
         await scraper.close_session()
 
+def add_crawl_arguments(parser):
+    """Options of the full crawl, shared by this script and `cli.py crawl`."""
+    parser.add_argument("--archive", default=ARCHIVE_DIR, help="raw document archive directory")
+    parser.add_argument("--no-archive", action="store_true", help="do not archive fetched files")
+    parser.add_argument("--pipelined", action="store_true", help="parse sellers.json files in worker processes")
+    parser.add_argument("--streaming", action="store_true", help="check domains while SSPs are still being parsed")
+    parser.add_argument("--probe-cache", default=PROBE_CACHE, help="cache of the domain check results")
+    parser.add_argument("--no-probe-cache", action="store_true", help="probe every domain, without the cache")
+    parser.add_argument("--cache-ttl", type=float, default=28, metavar="DAYS", help="probe cache lifetime")
+    parser.add_argument("--refresh", action="store_true", help="probe every domain again and refresh the cache")
+    parser.add_argument("--host-health", default=HOST_HEALTH, help="hosts found down, skipped by the next runs")
+    parser.add_argument("--no-host-health", action="store_true", help="retry every host, forget failures after the run")
+    parser.add_argument("--buffer-rows", type=int, default=BUFFER_ROWS, help="result rows kept in memory per list")
+    parser.add_argument("--spill-dir", help="directory of the results spilled to disk (default: temporary directory)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="requests in flight and domains checked at once")
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default="csv",
+                        help="format of the result files (jsonl results are not uploaded)")
+    parser.add_argument("--no-upload", action="store_true", help="do not upload the results to Google Sheets")
+
+
+def run_crawl(args, replay: Optional[str] = None):
+    """Run main() with the options of add_crawl_arguments."""
+    archive_dir = None if args.no_archive and not replay else args.archive
+    asyncio.run(main(pipelined=args.pipelined, archive_dir=archive_dir, replay=replay,
+                     streaming=args.streaming,
+                     probe_cache_path=None if args.no_probe_cache else args.probe_cache,
+                     cache_ttl_days=args.cache_ttl, refresh=args.refresh,
+                     host_health_path=None if args.no_host_health else args.host_health,
+                     buffer_rows=args.buffer_rows, spill_dir=args.spill_dir,
+                     concurrency=args.concurrency, output_format=args.output_format,
+                     upload=not args.no_upload))
+
+
 if __name__ == "__main__":
-    asyncio.run(test_mediavine()) 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="SSP sellers.json crawl (default: Mediavine test)")
+    parser.add_argument("--crawl", action="store_true", help="run the full crawl of 'List of SSP.csv'")
+    parser.add_argument("--replay", metavar="DATE", help="rerun the crawl on the files archived on DATE (or latest)")
+    add_crawl_arguments(parser)
+    args = parser.parse_args()
+    if args.crawl or args.replay:
+        run_crawl(args, args.replay)
+    else:
+        asyncio.run(test_mediavine())
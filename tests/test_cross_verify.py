@@ -0,0 +1,42 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cross_verify import SellerIndex, check, read_sellers_csv
+from ssp_scraper import SSPScraper
+
+
+def seller(seller_id, seller_type, domain='site.fr'):
+    # Compact row of parse_sellers_rows
+    return (domain, False, False, 'Site', seller_id, seller_type, '')
+
+
+def crawl_with_conflicting_types():
+    """Seller 42 of site.fr declared PUBLISHER by SSP A, INTERMEDIARY by B and C."""
+    scraper = SSPScraper()
+    for ssp, host, seller_type in (('A', 'a.com', 'PUBLISHER'), ('B', 'b.com', 'INTERMEDIARY'),
+                                   ('C', 'c.com', 'INTERMEDIARY')):
+        scraper.results['sellers'].extend(
+            scraper.expand_seller_rows([seller('42', seller_type)], ssp, f'https://{host}/sellers.json'))
+    scraper.assign_majority_types()
+    return scraper
+
+
+def test_declared_type_survives_majority_pass():
+    scraper = crawl_with_conflicting_types()
+    index = SellerIndex.from_rows(scraper.results['sellers'])
+    assert check(index, 'site.fr', 'a.com', '42', 'DIRECT') == (None, ('PUBLISHER', 'site.fr', 'A'))
+    assert check(index, 'site.fr', 'b.com', '42', 'RESELLER') == (None, ('INTERMEDIARY', 'site.fr', 'B'))
+    assert check(index, 'site.fr', 'b.com', '42', 'DIRECT')[0] == 'type_mismatch'
+    scraper.results.close()
+
+
+def test_sellers_csv_keeps_declared_type(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scraper = crawl_with_conflicting_types()
+    scraper.save_results()
+    scraper.results.close()
+    index = SellerIndex.from_tuples(read_sellers_csv('output/sellers_data.csv'))
+    assert check(index, 'site.fr', 'a.com', '42', 'DIRECT') == (None, ('PUBLISHER', 'site.fr', 'A'))
+    assert check(index, 'site.fr', 'c.com', '42', 'DIRECT')[0] == 'type_mismatch'